@@ -0,0 +1,261 @@
+# 性能基准：在临时目录里造一份指定规模的数据，分别用 Flask 测试客户端（单客户端）
+# 和本地 WSGI 服务（多客户端并发）压各个路由，结果写成 JSON，方便不同提交之间对比。
+#
+#   python bench.py --size small                 # 1k 任务 × 50 账户
+#   python bench.py --size medium -o after.json --compare before.json
+#   python bench.py --tasks 5000 --clients 16 --requests 500 --scenarios index,progress
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import note
+
+SIZES = {
+    'small': {'tasks': 1000, 'accounts': 50, 'profiles': 1000, 'addresses': 5000},
+    'medium': {'tasks': 10000, 'accounts': 50, 'profiles': 1000, 'addresses': 5000},
+    'large': {'tasks': 100000, 'accounts': 50, 'profiles': 1000, 'addresses': 5000},
+}
+SCENARIOS = ['index', 'index_uncached', 'progress', 'move', 'add_addr', 'add_profile']
+
+# --- 造数据 ---
+def seed(conn, tasks, accounts, profiles, addresses):
+    rnd = random.Random(42)
+    names = [f'账号{i + 1}' for i in range(accounts)]
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('global_accounts', json.dumps(names, ensure_ascii=False)))
+    c.executemany('INSERT INTO bookmarks (id, url, remark, enable_stats, sort_order) VALUES (?, ?, ?, 1, ?)',
+                  ((i, f'https://example.com/task/{i}', f'任务备注 {i}', i * note.RANK_GAP) for i in range(1, tasks + 1)))
+    c.executemany('INSERT INTO task_accounts (task_id, account, position, done) VALUES (?, ?, ?, ?)',
+                  ((i, name, pos, 1 if rnd.random() < 0.5 else 0) for i in range(1, tasks + 1) for pos, name in enumerate(names)))
+    c.executemany('INSERT INTO profiles (name, avatar, remark, account_number, link) VALUES (?, ?, ?, ?, ?)',
+                  ((f'账户{i}', 'missing.webp', f'备注{i}', f'{i:012d}', 'https://example.com') for i in range(profiles)))
+    c.executemany('INSERT INTO address_book (name, addr, uid, sort_order) VALUES (?, ?, ?, ?)',
+                  ((f'地址{i}', f'0x{rnd.getrandbits(160):040x}', str(i), i) for i in range(addresses)))
+    conn.commit()
+
+def sample_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        # 没有 Pillow 时用一个 1x1 的 PNG
+        return bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de0000000c4944415408d763f8cfc0000003010100c9fe92ef0000000049454e44ae426082')
+    buf = io.BytesIO()
+    Image.new('RGB', (1600, 1200), tuple(random.randrange(256) for _ in range(3))).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+def multipart(fields, file_field, filename, data):
+    boundary = f'bench{random.getrandbits(64):x}'
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode() for k, v in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def form(fields):
+    from urllib.parse import urlencode
+    return urlencode(fields, doseq=True).encode(), 'application/x-www-form-urlencoded'
+
+# --- 场景 ---
+# 每个场景返回一个函数，调用一次生成一个请求 (method, path, body, content_type)
+def make_scenario(name, sizes):
+    rnd = random.Random()
+    names = [f'账号{i + 1}' for i in range(sizes['accounts'])]
+    if name in ('index', 'index_uncached'):
+        return lambda: ('GET', '/', None, None)
+    if name == 'progress':
+        def progress():
+            body, ctype = form({'done_accounts': rnd.sample(names, rnd.randrange(len(names) + 1))})
+            return 'POST', f'/update_progress/{rnd.randint(1, sizes["tasks"])}', body, ctype
+        return progress
+    if name == 'move':
+        return lambda: ('GET', f'/move/{rnd.randint(1, sizes["tasks"])}/{rnd.choice(["up", "down"])}', None, None)
+    if name == 'add_addr':
+        return lambda: ('POST', '/add_addr', *form({'name': f'bench{rnd.random()}', 'addr': '0xbench', 'uid': '1'}))
+    if name == 'add_profile':
+        image = sample_image()
+        return lambda: ('POST', '/add_profile', *multipart({'name': 'bench', 'remark': '', 'account_number': '', 'link': ''},
+                                                           'file', 'bench.jpg', image + os.urandom(8)))
+    raise ValueError(name)
+
+def prepare(name, timeout=120):
+    # add_profile、move 会排后台任务（缩图、重排序号），任务提交时会让页面缓存失效，
+    # 不等它们做完，下一个场景的结果就取决于场景顺序；index 测的是缓存命中，先把页面缓存热好
+    client = note.app.test_client()
+    deadline = time.monotonic() + timeout
+    while True:
+        counts = client.get('/jobs').get_json()['counts']
+        pending = sum(n for states in counts.values() for state, n in states.items() if state in ('queued', 'running'))
+        if not pending:
+            break
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'{pending} background jobs still pending after {timeout}s')
+        time.sleep(0.1)
+    if name == 'index':
+        client.get('/')
+
+def before_request(name):
+    # index_uncached 每次都让页面缓存失效，测的是真正查库+渲染的耗时
+    if name == 'index_uncached':
+        note.bump_generation()
+
+# --- 统计 ---
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3) if latencies else None
+    return {
+        'requests': len(latencies), 'errors': errors, 'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': pct(50), 'p90_ms': pct(90), 'p99_ms': pct(99),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+def run_client(name, sizes, requests):
+    client = note.app.test_client()
+    next_request = make_scenario(name, sizes)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        method, path, body, ctype = next_request()
+        before_request(name)
+        t = time.perf_counter()
+        resp = client.open(path, method=method, data=body, content_type=ctype)
+        latencies.append(time.perf_counter() - t)
+        errors += resp.status_code >= 400
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+def run_concurrent(name, sizes, requests, clients, port):
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    per_client = max(1, requests // clients)
+
+    def worker():
+        next_request = make_scenario(name, sizes)
+        local = []
+        for _ in range(per_client):
+            method, path, body, ctype = next_request()
+            before_request(name)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            t = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers={'Content-Type': ctype} if ctype else {})
+                resp = conn.getresponse()
+                resp.read()
+                failed = resp.status >= 400
+            except OSError:
+                failed = True
+            local.append(time.perf_counter() - t)
+            conn.close()
+            if failed:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return summarize(latencies, time.perf_counter() - start, errors[0])
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_file):
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f'\n对比 {baseline_file} ({baseline.get("commit")}):')
+    for mode, scenarios in results['results'].items():
+        for name, r in scenarios.items():
+            old = baseline.get('results', {}).get(mode, {}).get(name)
+            if old and old.get('p50_ms') and r.get('p50_ms'):
+                print(f'  {mode:10s} {name:15s} p50 {old["p50_ms"]:9.2f} -> {r["p50_ms"]:9.2f} ms ({r["p50_ms"] / old["p50_ms"] - 1:+.0%})'
+                      f'   rps {old["throughput_rps"]} -> {r["throughput_rps"]}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='note.py 性能基准')
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--tasks', type=int)
+    parser.add_argument('--accounts', type=int)
+    parser.add_argument('--profiles', type=int)
+    parser.add_argument('--addresses', type=int)
+    parser.add_argument('--requests', type=int, default=200, help='每个场景的请求数')
+    parser.add_argument('--clients', type=int, default=8, help='并发模式的客户端数')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--modes', default='client,concurrent', help='client: 测试客户端单线程；concurrent: 本地 WSGI 服务并发')
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('--compare', help='和之前的结果文件对比')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据目录')
+    args = parser.parse_args(argv)
+
+    sizes = dict(SIZES[args.size])
+    for k in sizes:
+        if getattr(args, k) is not None:
+            sizes[k] = getattr(args, k)
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    modes = [m for m in args.modes.split(',') if m]
+
+    workdir = tempfile.mkdtemp(prefix='note-bench-')
+    db_file = os.path.join(workdir, 'bench.db')
+    note.app.config['DB_FILE'] = db_file
+    note.app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.makedirs(note.app.config['UPLOAD_FOLDER'])
+    try:
+        t = time.perf_counter()
+        with note.app.app_context():
+            note.init_db(db_file)
+            seed(note.get_db(), **sizes)
+        print(f'造数据 {sizes} 用时 {time.perf_counter() - t:.1f}s')
+
+        results = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                   'sqlite': note.sqlite3.sqlite_version, 'sizes': sizes, 'requests': args.requests, 'clients': args.clients, 'results': {}}
+        server = None
+        for mode in modes:
+            if mode == 'concurrent' and server is None:
+                server = make_server('127.0.0.1', 0, note.app, threaded=True, request_handler=QuietHandler)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            for name in scenarios:
+                prepare(name)
+                if mode == 'client':
+                    r = run_client(name, sizes, args.requests)
+                else:
+                    r = run_concurrent(name, sizes, args.requests, args.clients, server.server_port)
+                results['results'].setdefault(mode, {})[name] = r
+                print(f'{mode:10s} {name:15s} p50 {r["p50_ms"]:9.2f} ms  p90 {r["p90_ms"]:9.2f} ms  p99 {r["p99_ms"]:9.2f} ms'
+                      f'  {r["throughput_rps"]:8.1f} req/s  errors {r["errors"]}')
+        if server is not None:
+            server.shutdown()
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {args.output}')
+        if args.compare:
+            compare(results, args.compare)
+    finally:
+        if args.keep:
+            print(f'数据目录: {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,620 +1,1228 @@
-from flask import Flask, request, render_template_string, redirect, url_for, send_from_directory
+from flask import Flask, Blueprint, current_app, request, render_template, redirect, url_for, send_from_directory, g, make_response, jsonify, Response, stream_with_context, has_app_context, abort
+from flask.signals import before_render_template, template_rendered
 import sqlite3
 import json
 import os
 import time
+import threading
+import hashlib
+import re
+import io
+import csv
+import sys
+import argparse
+import cProfile
+import pstats
+import gzip
+import logging
+import shutil
+import tempfile
+import itertools
+import urllib.request
+import urllib.error
+from collections import OrderedDict
 from werkzeug.utils import secure_filename
+from markupsafe import escape
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # 没装 Pillow 时头像按原图保存
+    Image = None
+try:
+    import brotli
+except ImportError:  # 没装 brotli 时只用 gzip
+    brotli = None
 
-app = Flask(__name__)
 DB_FILE = 'bookmarks.db'
 UPLOAD_FOLDER = 'uploads'
+BACKUP_FOLDER = 'backups'
+WORKSPACE_FOLDER = 'workspaces'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# 所有路由都挂在这个蓝图上，由 create_app() 注册到应用里
+bp = Blueprint('main', __name__)
+log = logging.getLogger(__name__)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# --- 数据库初始化 ---
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+# --- 头像 ---
+# 上传的图片统一缩成小方图，文件名取原图内容的哈希，同一张图只存一份，
+# 内容不会变，所以可以让浏览器永久缓存。
+AVATAR_SIZE = 128  # 页面上显示 50px，留出高分屏的余量
+AVATAR_MAX_AGE = 365 * 24 * 3600
+AVATAR_GC_GRACE = 3600  # 刚上传还没写进数据库的文件不要误删
+AVATAR_NAME = re.compile(r'^[0-9a-f]{32}\.[a-z]+$')
+
+def _thumbnail(data):
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    img = ImageOps.fit(img.convert('RGB'), (AVATAR_SIZE, AVATAR_SIZE), Image.LANCZOS)
+    buf = io.BytesIO()
+    if features.check('webp'):
+        img.save(buf, 'WEBP', quality=80, method=6)
+        return buf.getvalue(), 'webp'
+    img.save(buf, 'JPEG', quality=85, optimize=True)
+    return buf.getvalue(), 'jpg'
+
+def store_avatar(data, ext):
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    folder = current_paths()['uploads']
+    for existing in (f'{digest}.webp', f'{digest}.jpg', f'{digest}.{ext}'):
+        if os.path.exists(os.path.join(folder, existing)):
+            return existing
+    if Image is not None:
+        try:
+            data, ext = _thumbnail(data)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            pass  # 解不开的图片原样保存
+    filename = f'{digest}.{ext}'
+    tmp = os.path.join(folder, f'.{filename}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(folder, filename))
+    return filename
+
+def stage_avatar(data, ext):
+    # 上传时原图先原样落盘，缩图交给后台任务（见 _job_thumbnail）；返回 (文件名, 是否还要缩图)
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    folder = current_paths()['uploads']
+    for existing in (f'{digest}.webp', f'{digest}.jpg', f'{digest}.{ext}'):
+        if os.path.exists(os.path.join(folder, existing)):
+            return existing, False
+    if Image is None:
+        return store_avatar(data, ext), False
+    filename = f'{digest}.orig.{ext}'
+    tmp = os.path.join(folder, f'.{filename}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(folder, filename))
+    return filename, True
+
+def remove_avatar_if_unused(c, filename):
+    if not filename:
+        return
+    c.execute('SELECT 1 FROM profiles WHERE avatar = ? LIMIT 1', (filename,))
+    if c.fetchone() is None:
+        try: os.remove(os.path.join(current_paths()['uploads'], secure_filename(filename)))
+        except FileNotFoundError: pass
+
+def collect_orphan_avatars(conn):
+    # 清理没有任何账户引用的头像文件，包括以前删除账户时留下的
+    used = {row[0] for row in conn.execute('SELECT avatar FROM profiles')}
+    folder = current_paths()['uploads']
+    cutoff = time.time() - AVATAR_GC_GRACE
+    removed = 0
+    for entry in os.scandir(folder):
+        try:
+            if entry.is_file() and allowed_file(entry.name) and entry.name not in used and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass  # 多个 worker 同时启动时可能已经被别的进程删掉了
+    return removed
+
+# --- 数据库迁移 ---
+# 表结构按版本号逐步升级，当前版本记录在 PRAGMA user_version 中。
+# 新的结构变更只能追加到 MIGRATIONS 末尾，已发布的步骤不要再改。
+def _columns(c, table):
+    return {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+
+def _add_column(c, table, column, decl):
+    if column not in _columns(c, table):
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+def _m001_base_tables(c):
     c.execute('''CREATE TABLE IF NOT EXISTS bookmarks (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, remark TEXT, target_accounts TEXT, done_accounts TEXT, enable_stats INTEGER DEFAULT 1)''')
     c.execute('''CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS profiles (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, avatar TEXT, remark TEXT, account_number TEXT, link TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS special_notes (id INTEGER PRIMARY KEY AUTOINCREMENT, content TEXT, remark TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    try: c.execute('ALTER TABLE profiles ADD COLUMN account_number TEXT')
-    except: pass
-    try: c.execute('ALTER TABLE profiles ADD COLUMN link TEXT')
-    except: pass
-    
-    try: 
-        c.execute('ALTER TABLE bookmarks ADD COLUMN sort_order INTEGER')
-        c.execute('UPDATE bookmarks SET sort_order = id WHERE sort_order IS NULL')
-    except: 
-        pass
-        
-    c.execute('SELECT value FROM settings WHERE key = ?', ('global_accounts',))
-    if c.fetchone() is None:
-        default_accs = json.dumps(['账号1', '账号2', '账号3'])
-        c.execute('INSERT INTO settings (key, value) VALUES (?, ?)', ('global_accounts', default_accs))
-        
-    c.execute('SELECT value FROM settings WHERE key = ?', ('address_book',))
-    if c.fetchone() is None:
-        c.execute('INSERT INTO settings (key, value) VALUES (?, ?)', ('address_book', '[]'))
-        
+
+def _m002_profile_columns(c):
+    # 旧库的 profiles 表可能缺这两列
+    _add_column(c, 'profiles', 'account_number', 'TEXT')
+    _add_column(c, 'profiles', 'link', 'TEXT')
+
+def _m003_bookmark_sort_order(c):
+    _add_column(c, 'bookmarks', 'sort_order', 'INTEGER')
+    c.execute('UPDATE bookmarks SET sort_order = id WHERE sort_order IS NULL')
+
+def _m004_default_settings(c):
     defaults = {
+        'global_accounts': json.dumps(['账号1', '账号2', '账号3']),
+        'address_book': '[]',
         'left_bg': '#2c3e50', 'left_text': '#ffffff', 
         'right_bg': '#ffffff', 'right_text': '#333333',
         'addr_name_color': '#3498db'
     }
     for k, v in defaults.items():
         c.execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', (k, v))
-        
+
+def _m005_task_accounts(c):
+    # 每个任务的账户进度从 JSON 字段拆成一行一个账户
+    c.execute('''CREATE TABLE IF NOT EXISTS task_accounts (task_id INTEGER NOT NULL, account TEXT NOT NULL, position INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, done_at TIMESTAMP, PRIMARY KEY (task_id, account)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_task_accounts_account ON task_accounts (account, done, task_id)')
+    rows = []
+    for task_id, targets, done in c.execute('SELECT id, target_accounts, done_accounts FROM bookmarks').fetchall():
+        try: targets = json.loads(targets) or []
+        except: targets = []
+        try: done = set(json.loads(done) or [])
+        except: done = set()
+        for pos, acc in enumerate(dict.fromkeys(targets)):
+            rows.append((task_id, acc, pos, 1 if acc in done else 0))
+    c.executemany('INSERT OR IGNORE INTO task_accounts (task_id, account, position, done) VALUES (?, ?, ?, ?)', rows)
+    # 旧的 JSON 字段不再使用，清空避免和新表不一致
+    c.execute('UPDATE bookmarks SET target_accounts = NULL, done_accounts = NULL')
+
+def _m006_bookmark_order_index(c):
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookmarks_order ON bookmarks (sort_order DESC, id DESC)')
+
+def _has_fts5():
+    try:
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+HAS_FTS = _has_fts5()
+
+# 全文索引：源表 -> 参与检索的字段
+FTS_SOURCES = {
+    'bookmarks': ['url', 'remark'],
+    'special_notes': ['content', 'remark'],
+    'profiles': ['name', 'remark', 'account_number'],
+}
+
+def _create_fts(c, table, columns):
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new_vals = ', '.join(f'new.{col}' for col in columns)
+    old_vals = ', '.join(f'old.{col}' for col in columns)
+    # trigram 分词按三个字符切分，中文不分词也能做子串匹配
+    c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')")
+    c.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_vals}); END')
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_vals}); END")
+    c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def _m007_fulltext(c):
+    if not HAS_FTS:
+        return
+    for table, columns in FTS_SOURCES.items():
+        _create_fts(c, table, columns)
+    # 地址本还存在 settings 的 JSON 里，整体改写时把索引一起重建，rowid 就是列表下标
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS address_book_fts USING fts5(name, addr, uid, tokenize='trigram')")
+    for event in ('INSERT', 'UPDATE'):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS address_book_fts_{event.lower()} AFTER {event} ON settings WHEN new.key = 'address_book' BEGIN
+                         DELETE FROM address_book_fts;
+                         INSERT INTO address_book_fts (rowid, name, addr, uid)
+                         SELECT key, json_extract(value, '$.name'), json_extract(value, '$.addr'), json_extract(value, '$.uid') FROM json_each(new.value);
+                     END''')
+    c.execute("UPDATE settings SET value = value WHERE key = 'address_book'")
+
+def _m008_address_book_table(c):
+    # 地址本从 settings 里的 JSON 挪到独立的表，每条有自己的主键
+    c.execute('''CREATE TABLE IF NOT EXISTS address_book (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, addr TEXT, uid TEXT, sort_order INTEGER)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_address_book_order ON address_book (sort_order, id)')
+    c.execute('SELECT value FROM settings WHERE key = ?', ('address_book',))
+    row = c.fetchone()
+    try: entries = json.loads(row[0]) if row else []
+    except: entries = []
+    c.executemany('INSERT INTO address_book (name, addr, uid, sort_order) VALUES (?, ?, ?, ?)',
+                  [(e.get('name'), e.get('addr'), e.get('uid'), i + 1) for i, e in enumerate(entries) if isinstance(e, dict)])
+    c.execute('DELETE FROM settings WHERE key = ?', ('address_book',))
+    if HAS_FTS:
+        for event in ('insert', 'update'):
+            c.execute(f'DROP TRIGGER IF EXISTS address_book_fts_{event}')
+        c.execute('DROP TABLE IF EXISTS address_book_fts')
+        _create_fts(c, 'address_book', ['name', 'addr', 'uid'])
+
+def _m009_gapped_sort_order(c):
+    rebalance_order(c)
+
+def _m010_events(c):
+    # AUTOINCREMENT 保证清理旧事件后编号也不会复用，客户端断线重连靠它续传
+    c.execute('''CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, data TEXT NOT NULL,
+                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+# 进度计数：bookmarks.done_count/total_count 是每个任务的计数，account_totals 是每个账户在所有
+# 开启统计的任务里的计数，progress_totals 只有一行，是全局的任务数和已完成任务数。
+# 都由触发器在改 task_accounts / bookmarks 的同一个事务里增量维护，汇总时直接读，不用扫表。
+def _counter_triggers(c, counted, counted_of):
+    # counted：任务计入汇总的条件，{0} 换成 new / old / 表别名；counted_of：条件涉及的列
+    is_complete = f'({counted} AND {{0}}.total_count > 0 AND {{0}}.done_count >= {{0}}.total_count)'
+    task_counted = f"EXISTS (SELECT 1 FROM bookmarks b WHERE b.id = {{0}}.task_id AND {counted.format('b')})"
+    add_new = f'''UPDATE bookmarks SET total_count = total_count + 1, done_count = done_count + new.done WHERE id = new.task_id;
+                  INSERT INTO account_totals (account, tasks, done) SELECT new.account, 1, new.done WHERE {task_counted.format('new')}
+                  ON CONFLICT (account) DO UPDATE SET tasks = tasks + 1, done = done + excluded.done;'''
+    remove_old = f'''UPDATE bookmarks SET total_count = total_count - 1, done_count = done_count - old.done WHERE id = old.task_id;
+                     UPDATE account_totals SET tasks = tasks - 1, done = done - old.done WHERE account = old.account AND {task_counted.format('old')};
+                     DELETE FROM account_totals WHERE account = old.account AND tasks <= 0;'''
+    c.execute(f'CREATE TRIGGER IF NOT EXISTS task_accounts_count_ai AFTER INSERT ON task_accounts BEGIN {add_new} END')
+    c.execute(f'CREATE TRIGGER IF NOT EXISTS task_accounts_count_ad AFTER DELETE ON task_accounts BEGIN {remove_old} END')
+    c.execute(f'CREATE TRIGGER IF NOT EXISTS task_accounts_count_au AFTER UPDATE OF task_id, account, done ON task_accounts BEGIN {remove_old} {add_new} END')
+    # 任务进出统计时把它的所有账户整体加进或移出账户汇总
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bookmarks_stats_au AFTER UPDATE OF {counted_of} ON bookmarks
+                 WHEN {counted.format('old')} != {counted.format('new')} BEGIN
+                     INSERT INTO account_totals (account, tasks, done)
+                     SELECT account, IIF({counted.format('new')}, 1, -1), IIF({counted.format('new')}, done, -done) FROM task_accounts WHERE task_id = new.id
+                     ON CONFLICT (account) DO UPDATE SET tasks = tasks + excluded.tasks, done = done + excluded.done;
+                     DELETE FROM account_totals WHERE tasks <= 0;
+                 END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bookmarks_totals_ai AFTER INSERT ON bookmarks BEGIN
+                     UPDATE progress_totals SET tasks = tasks + {counted.format('new')}, complete = complete + {is_complete.format('new')};
+                 END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bookmarks_totals_au AFTER UPDATE OF {counted_of}, done_count, total_count ON bookmarks BEGIN
+                     UPDATE progress_totals SET tasks = tasks + {counted.format('new')} - {counted.format('old')},
+                                                complete = complete + {is_complete.format('new')} - {is_complete.format('old')};
+                 END''')
+    # 删除任务时先把它的账户从汇总里减掉，再连带删除账户行（那时任务已不存在，行触发器不会重复扣减）
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bookmarks_totals_ad AFTER DELETE ON bookmarks BEGIN
+                     UPDATE progress_totals SET tasks = tasks - {counted.format('old')}, complete = complete - {is_complete.format('old')};
+                     UPDATE account_totals SET tasks = account_totals.tasks - 1, done = account_totals.done - ta.done
+                     FROM (SELECT account, done FROM task_accounts WHERE task_id = old.id) ta
+                     WHERE account_totals.account = ta.account AND {counted.format('old')};
+                     DELETE FROM account_totals WHERE tasks <= 0;
+                     DELETE FROM task_accounts WHERE task_id = old.id;
+                 END''')
+    return is_complete
+
+_COUNTER_TRIGGERS = ['task_accounts_count_ai', 'task_accounts_count_ad', 'task_accounts_count_au',
+                     'bookmarks_stats_au', 'bookmarks_totals_ai', 'bookmarks_totals_au', 'bookmarks_totals_ad']
+
+def _m011_progress_counters(c):
+    _add_column(c, 'bookmarks', 'done_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(c, 'bookmarks', 'total_count', 'INTEGER NOT NULL DEFAULT 0')
+    c.execute('CREATE TABLE IF NOT EXISTS account_totals (account TEXT PRIMARY KEY, tasks INTEGER NOT NULL, done INTEGER NOT NULL) WITHOUT ROWID')
+    c.execute('CREATE TABLE IF NOT EXISTS progress_totals (id INTEGER PRIMARY KEY CHECK (id = 1), tasks INTEGER NOT NULL, complete INTEGER NOT NULL)')
+    is_complete = _counter_triggers(c, '({0}.enable_stats != 0)', 'enable_stats')
+    # 回填现有数据
+    c.execute('''UPDATE bookmarks SET total_count = (SELECT COUNT(*) FROM task_accounts WHERE task_id = bookmarks.id),
+                                      done_count = (SELECT COALESCE(SUM(done), 0) FROM task_accounts WHERE task_id = bookmarks.id)''')
+    c.execute('DELETE FROM account_totals')
+    c.execute('''INSERT INTO account_totals (account, tasks, done)
+                 SELECT ta.account, COUNT(*), SUM(ta.done) FROM task_accounts ta JOIN bookmarks b ON b.id = ta.task_id
+                 WHERE b.enable_stats != 0 GROUP BY ta.account''')
+    c.execute('DELETE FROM progress_totals')
+    c.execute(f"INSERT INTO progress_totals (id, tasks, complete) SELECT 1, COUNT(*), COALESCE(SUM({is_complete.format('b')}), 0) FROM bookmarks b WHERE b.enable_stats != 0")
+    # 全文索引只关心 url 和 remark，计数和排序变化不用重建这一行的索引
+    if HAS_FTS:
+        cols = FTS_SOURCES['bookmarks']
+        c.execute('DROP TRIGGER IF EXISTS bookmarks_fts_au')
+        c.execute(f'''CREATE TRIGGER bookmarks_fts_au AFTER UPDATE OF {', '.join(cols)} ON bookmarks BEGIN
+                         INSERT INTO bookmarks_fts (bookmarks_fts, rowid, {', '.join(cols)}) VALUES ('delete', old.id, {', '.join('old.' + x for x in cols)});
+                         INSERT INTO bookmarks_fts (rowid, {', '.join(cols)}) VALUES (new.id, {', '.join('new.' + x for x in cols)});
+                     END''')
+
+def _m012_trash_and_journal(c):
+    # 删除改成打上 deleted_at 放进回收站；部分索引只收录回收站里的行，列表查询不受影响
+    for table in TRASH_TABLES:
+        _add_column(c, table, 'deleted_at', 'TIMESTAMP')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_deleted ON {table} (deleted_at) WHERE deleted_at IS NOT NULL')
+    # 回收站里的任务和关掉统计的一样不计入汇总。迁移时还没有被删除的行，计数不用重算
+    for name in _COUNTER_TRIGGERS:
+        c.execute(f'DROP TRIGGER IF EXISTS {name}')
+    _counter_triggers(c, '({0}.enable_stats != 0 AND {0}.deleted_at IS NULL)', 'enable_stats, deleted_at')
+    # 操作日志：at 存 Unix 秒，before 是改动前各行的 JSON 数组（不带列名），见 journal()
+    c.execute('''CREATE TABLE IF NOT EXISTS journal (id INTEGER PRIMARY KEY, step INTEGER, at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                 action TEXT NOT NULL, tbl TEXT NOT NULL, keys TEXT NOT NULL, accounts TEXT, before TEXT NOT NULL, undone INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_journal_at ON journal (at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_journal_step ON journal (step) WHERE step IS NOT NULL')
+
+def _m013_changelog(c):
+    # 复制用的变更日志，触发器等第一个副本来取快照时才建（见 enable_changelog）；
+    # at 是提交时的 Unix 秒（带小数），副本用它算延迟。replica_state 只在副本上有一行，记应用到的位置
+    c.execute('''CREATE TABLE IF NOT EXISTS changelog (id INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, op INTEGER NOT NULL, row TEXT NOT NULL,
+                 at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS replica_state (id INTEGER PRIMARY KEY CHECK (id = 1), primary_url TEXT NOT NULL,
+                 applied INTEGER NOT NULL, applied_at REAL)''')
+
+# 任务状态就是页面上卡片的样式名，{0} 换成 new / 表名
+TASK_STATUS = "CASE WHEN IFNULL({0}.enable_stats, 0) = 0 THEN 'stats-off' WHEN {0}.total_count > 0 AND {0}.done_count >= {0}.total_count THEN 'completed' ELSE 'pending' END"
+
+def _m014_task_status(c):
+    # 状态和创建时间存成列，按它们筛选时直接走索引。旧任务没有创建时间，留空
+    _add_column(c, 'bookmarks', 'status', "TEXT NOT NULL DEFAULT 'pending'")
+    _add_column(c, 'bookmarks', 'created_at', 'TIMESTAMP')
+    status = TASK_STATUS.format('new')
+    # 计数和统计开关变了才可能改状态，状态没变时不多写一次
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bookmarks_status_ai AFTER INSERT ON bookmarks WHEN new.created_at IS NULL OR new.status IS NOT {status} BEGIN
+                     UPDATE bookmarks SET status = {status}, created_at = COALESCE(new.created_at, CURRENT_TIMESTAMP) WHERE id = new.id;
+                 END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS bookmarks_status_au AFTER UPDATE OF enable_stats, done_count, total_count ON bookmarks WHEN new.status IS NOT {status} BEGIN
+                     UPDATE bookmarks SET status = {status} WHERE id = new.id;
+                 END''')
+    c.execute(f"UPDATE bookmarks SET status = {TASK_STATUS.format('bookmarks')}")
+    # 索引里带上排序列，筛选和排序都在索引里做完，只回表取这一页的行
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookmarks_status ON bookmarks (status, sort_order DESC, id DESC) WHERE deleted_at IS NULL')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookmarks_created ON bookmarks (created_at, sort_order, id) WHERE deleted_at IS NULL')
+    # 已经开启复制的主库，任务的变更要带上新的创建时间列
+    if changelog_enabled(c.connection):
+        for event in ('ai', 'au', 'ad'):
+            c.execute(f'DROP TRIGGER bookmarks_changelog_{event}')
+        _changelog_triggers(c, 'bookmarks')
+
+def _m015_jobs(c):
+    # 后台任务队列，时间都存 Unix 秒。dedupe 相同的任务同一时刻只排一个（清理、重排、备份）
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, args TEXT NOT NULL, dedupe TEXT,
+                 state TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, lease REAL NOT NULL,
+                 lease_until REAL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, run_at)')
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe) WHERE state IN ('queued', 'running')")
+
+MIGRATIONS = [
+    _m001_base_tables,
+    _m002_profile_columns,
+    _m003_bookmark_sort_order,
+    _m004_default_settings,
+    _m005_task_accounts,
+    _m006_bookmark_order_index,
+    _m007_fulltext,
+    _m008_address_book_table,
+    _m009_gapped_sort_order,
+    _m010_events,
+    _m011_progress_counters,
+    _m012_trash_and_journal,
+    _m013_changelog,
+    _m014_task_status,
+    _m015_jobs,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(db_file):
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        # 拿到写锁后再读一次版本号，多个进程同时启动时只有一个会真正执行迁移
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        c = conn.cursor()
+        for step in MIGRATIONS[version:]:
+            step(c)
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.execute('COMMIT')
+    except:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+# --- 工作区 ---
+# 每个团队一个工作区：/w/<名字>/... 下的所有路由用 workspaces/<名字>/ 里自己的库文件、头像目录和备份目录，
+# 各自一把写锁，互不等待；不带前缀的路由还是用 DB_FILE 那个库。
+# 同一个蓝图以 ws 的名字再注册一次（见 create_app），前缀里的工作区名在这里取出放进 g，
+# 视图函数不用改；url_for 生成链接时自动带上当前工作区。
+WORKSPACE_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+def workspace_paths(app, workspace=None):
+    if workspace is None:
+        return {'db': app.config['DB_FILE'], 'uploads': app.config['UPLOAD_FOLDER'], 'backups': app.config['BACKUP_FOLDER']}
+    root = os.path.join(app.config['WORKSPACE_FOLDER'], workspace)
+    return {'db': os.path.join(root, DB_FILE), 'uploads': os.path.join(root, UPLOAD_FOLDER), 'backups': os.path.join(root, BACKUP_FOLDER)}
+
+def current_paths():
+    return workspace_paths(current_app, g.get('workspace'))
+
+def workspace_exists(app, workspace):
+    return bool(WORKSPACE_NAME.match(workspace)) and os.path.isdir(os.path.join(app.config['WORKSPACE_FOLDER'], workspace))
+
+def create_workspace(app, workspace):
+    if not WORKSPACE_NAME.match(workspace):
+        raise ValueError(f'workspace name must match {WORKSPACE_NAME.pattern}')
+    os.makedirs(workspace_paths(app, workspace)['uploads'], exist_ok=True)
+
+def list_workspaces(app):
+    folder = app.config['WORKSPACE_FOLDER']
+    return sorted(name for name in os.listdir(folder) if workspace_exists(app, name)) if os.path.isdir(folder) else []
+
+@bp.url_value_preprocessor
+def pull_workspace(endpoint, values):
+    if values and 'workspace' in values:
+        workspace = values.pop('workspace')
+        # 工作区要先用命令行建好，随便敲的名字不会凭空建出一个库
+        if not workspace_exists(current_app, workspace):
+            abort(404)
+        g.workspace = workspace
+
+@bp.url_defaults
+def add_workspace(endpoint, values):
+    if 'workspace' in g and current_app.url_map.is_endpoint_expecting(endpoint, 'workspace'):
+        values.setdefault('workspace', g.workspace)
+
+def base_path():
+    # 页面脚本拼接口地址用的前缀，不在工作区里时是空串
+    return url_for('.index').rstrip('/')
+
+# --- 数据库初始化 ---
+_ready_dbs = set()
+
+def init_db(db_file=None):
+    db_file = db_file or current_paths()['db']
+    migrate(db_file)
+    _ready_dbs.add(db_file)
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        # 副本上的数据只跟着主库变，过期清理在主库上做，结果会同步过来
+        if not current_app.config.get('PRIMARY_URL'):
+            purge_expired(conn)
+        collect_orphan_avatars(conn)
+    finally:
+        conn.close()
+
+@bp.before_app_request
+def ensure_db():
+    # 每个数据库文件只在进程里第一次用到时检查表结构，之后就是一次集合查找
+    db_file = current_paths()['db']
+    if db_file not in _ready_dbs:
+        init_db()
+    # 提供服务的进程才跑后台任务，命令行导入导出不跑；副本不写库，任务都在主库上做
+    if not current_app.config.get('PRIMARY_URL'):
+        watch_jobs(db_file)
+
+# --- 监控 ---
+# 每个路由的耗时、每条 SQL 的耗时和模板渲染耗时都记成直方图，/metrics 按 Prometheus 文本格式输出。
+SLOW_QUERY_MS = float(os.environ.get('NOTE_SLOW_QUERY_MS', '100'))
+PROFILING = os.environ.get('NOTE_PROFILING') == '1'  # 打开后请求带 ?profile=1 会返回 cProfile 结果
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            s = self.series.get(label_values)
+            if s is None:
+                s = self.series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[0][i] += 1
+            s[1] += 1
+            s[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label_values, (buckets, count, total) in sorted(self.series.items()):
+                labels = ','.join(f'{k}="{_prom_escape(v)}"' for k, v in zip(self.labels, label_values))
+                sep = ',' if labels else ''
+                for bound, n in zip(self.buckets, buckets):
+                    lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {n}')
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{labels}}} {total}')
+                lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+def _prom_escape(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REQUEST_SECONDS = Histogram('note_request_duration_seconds', 'Request latency by route', ('endpoint', 'method', 'status'))
+REQUEST_SQL_SECONDS = Histogram('note_request_sql_seconds', 'Time spent in SQLite per request', ('endpoint',))
+REQUEST_TEMPLATE_SECONDS = Histogram('note_request_template_seconds', 'Time spent rendering templates per request', ('endpoint',))
+SQL_SECONDS = Histogram('note_sql_statement_duration_seconds', 'SQLite statement latency by statement type', ('statement',))
+TEMPLATE_SECONDS = Histogram('note_template_render_seconds', 'Template render latency', ('template',))
+HISTOGRAMS = [REQUEST_SECONDS, REQUEST_SQL_SECONDS, REQUEST_TEMPLATE_SECONDS, SQL_SECONDS, TEMPLATE_SECONDS]
+_slow_queries = [0]
+
+def _record_sql(sql, seconds):
+    SQL_SECONDS.observe(seconds, sql.lstrip().split(None, 1)[0].upper() if sql.strip() else '?')
+    if has_app_context() and 'sql_seconds' in g:
+        g.sql_seconds += seconds
+        g.sql_count += 1
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _slow_queries[0] += 1
+        log.warning('slow query (%.1f ms): %s', seconds * 1000, ' '.join(sql.split())[:500])
+
+# execute 只计到语句开始返回结果为止，SELECT 之后 fetch 的时间不在里面
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _record_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _record_sql(sql, time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute 自己建的游标不是 TimedCursor，要改走 cursor()
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _record_sql('COMMIT', time.perf_counter() - start)
+
+    def rollback(self):
+        start = time.perf_counter()
+        try:
+            return super().rollback()
+        finally:
+            _record_sql('ROLLBACK', time.perf_counter() - start)
+
+@bp.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    g.sql_seconds, g.sql_count, g.template_seconds = 0.0, 0, 0.0
+    if PROFILING and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@bp.after_app_request
+def record_request(resp):
+    if 'request_start' not in g:
+        return resp
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint, request.method, str(resp.status_code))
+    REQUEST_SQL_SECONDS.observe(g.sql_seconds, endpoint)
+    REQUEST_TEMPLATE_SECONDS.observe(g.template_seconds, endpoint)
+    resp.headers['Server-Timing'] = f'db;dur={g.sql_seconds * 1000:.2f}, tpl;dur={g.template_seconds * 1000:.2f}'
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(60)
+        return Response(out.getvalue(), mimetype='text/plain')
+    return resp
+
+def _template_started(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+def _template_finished(sender, template, context, **extra):
+    start = g.pop('template_start', None)
+    if start is not None:
+        seconds = time.perf_counter() - start
+        TEMPLATE_SECONDS.observe(seconds, template.name or '?')
+        if 'template_seconds' in g:
+            g.template_seconds += seconds
+
+@bp.route('/metrics')
+def metrics():
+    with _pool_lock:
+        idle = sum(len(conns) for conns in _pool.values())
+    gen, _ = current_generation(current_paths()['db'])
+    lines = [h.render() for h in HISTOGRAMS]
+    lines += [
+        '# HELP note_slow_queries_total SQLite statements slower than NOTE_SLOW_QUERY_MS',
+        '# TYPE note_slow_queries_total counter',
+        f'note_slow_queries_total {_slow_queries[0]}',
+        '# HELP note_db_pool_idle_connections Idle pooled SQLite connections',
+        '# TYPE note_db_pool_idle_connections gauge',
+        f'note_db_pool_idle_connections {idle}',
+        '# HELP note_data_generation Current data generation used by the page cache',
+        '# TYPE note_data_generation gauge',
+        f'note_data_generation {gen}',
+    ]
+    if current_app.config.get('PRIMARY_URL'):
+        status = replica_status(get_db().cursor(), current_paths()['db'])
+        lines += [
+            '# HELP note_replication_lag_changes Changes committed on the primary but not yet applied here',
+            '# TYPE note_replication_lag_changes gauge',
+            f"note_replication_lag_changes {status['lag_changes'] if status['lag_changes'] is not None else 'NaN'}",
+            '# HELP note_replication_lag_seconds Commit time of the newest primary change minus that of the last applied one',
+            '# TYPE note_replication_lag_seconds gauge',
+            f"note_replication_lag_seconds {status['lag_seconds'] if status['lag_seconds'] is not None else 'NaN'}",
+        ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# --- 数据库连接 ---
+# 连接按数据库文件放进连接池，请求开始时借出、请求结束时归还，
+# 同一个工作线程后续的请求会拿回同一个连接，不用每次重新打开文件。
+DB_POOL_SIZE = 16
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_CACHE_SIZE = -16000  # 负数表示 KiB，约 16MB 页缓存
+# 每个工作区一个库文件。池按最近使用排序，超过 DB_POOL_FILES 个库或者闲置超过 DB_IDLE_TIMEOUT 秒的，
+# 把它的空闲连接关掉，连同没人订阅的事件分发线程和首页缓存一起回收，下次用到时再打开
+DB_POOL_FILES = 32
+DB_IDLE_TIMEOUT = 600
+
+_pool = OrderedDict()  # 库文件 -> 空闲连接列表
+_pool_used = {}  # 库文件 -> 最近一次归还连接的时间
+_pool_lock = threading.Lock()
+
+def _connect(db_file):
+    conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False, factory=TimedConnection)
+    # WAL 模式下读不会被写阻塞；synchronous=NORMAL 在 WAL 下依然不会损坏数据库
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size={DB_CACHE_SIZE}')
+    conn.db_file = db_file
+    return conn
+
+def _acquire(db_file):
+    with _pool_lock:
+        idle = _pool.get(db_file)
+        if idle:
+            return idle.pop()
+    return _connect(db_file)
+
+def _release(db_file, conn, touch=True):
+    if conn.in_transaction:
+        conn.rollback()
+    if not touch:
+        # 后台任务借的连接：不算作使用，免得轮询让库永远不被回收；库已经被回收了就直接关掉
+        with _pool_lock:
+            idle = _pool.get(db_file)
+            if idle is not None and len(idle) < DB_POOL_SIZE:
+                idle.append(conn)
+                return
+        conn.close()
+        return
+    now = time.monotonic()
+    closing = []
+    with _pool_lock:
+        idle = _pool.setdefault(db_file, [])
+        _pool.move_to_end(db_file)
+        _pool_used[db_file] = now
+        if len(idle) < DB_POOL_SIZE:
+            idle.append(conn)
+        else:
+            closing.append(conn)
+        evicted = []
+        while len(_pool) > 1 and (len(_pool) > DB_POOL_FILES or now - _pool_used[next(iter(_pool))] > DB_IDLE_TIMEOUT):
+            old, conns = _pool.popitem(last=False)
+            del _pool_used[old]
+            closing.extend(conns)
+            evicted.append(old)
+    for conn in closing:
+        conn.close()
+    for old in evicted:
+        _evict_db(old)
+
+def _evict_db(db_file):
+    _stop_event_hub(db_file)
+    unwatch_jobs(db_file)
+    _page_cache.pop(db_file, None)
+
+def get_db():
+    if 'db' not in g:
+        g.db_file = current_paths()['db']
+        g.db = _acquire(g.db_file)
+    return g.db
+
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        _release(g.pop('db_file'), conn)
+
+# --- 数据版本 ---
+# 每个库文件各有一个数据代号，写操作提交后加一，首页缓存和 ETag 都以它为准；
+# 一个工作区的写入不会作废别的工作区的缓存。
+_generation = {}  # 库文件 -> (代号, 修改时间)
+_generation_lock = threading.Lock()
+# 进程重启后代号会从头开始，ETag 里带上启动时间避免和重启前的缓存撞号
+_BOOT_ID = '%x' % int(time.time() * 1000)
+
+def bump_generation(db_file=None):
+    # 不指定库时所有库的代号一起加
+    with _generation_lock:
+        for key in [db_file] if db_file else list(_generation):
+            _generation[key] = (_generation.get(key, (1, 0))[0] + 1, time.time())
+
+def current_generation(db_file):
+    with _generation_lock:
+        return _generation.setdefault(db_file, (1, time.time()))
+
+# 多个 worker 进程（或命令行导入）写同一个库时，本进程的代号不会变。
+# 用数据库和 WAL 文件的修改时间、大小判断别的进程有没有提交过，有就作废本进程的缓存；
+# 只是两次 stat，不用查库。
+_file_state = {}
+
+def _db_signature(db_file):
+    sig = []
+    for path in (db_file, db_file + '-wal'):
+        try:
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+def sync_generation(db_file):
+    sig = _db_signature(db_file)
+    if _file_state.get(db_file) != sig:
+        if db_file in _file_state:
+            bump_generation(db_file)
+        _file_state[db_file] = sig
+
+def commit(conn):
     conn.commit()
-    conn.close()
+    # 自己的提交会加代号，记下提交后的文件状态，免得再算成外部修改；
+    # 要在加代号之前 stat，这之后别的进程的提交才能被发现
+    db_file = getattr(conn, 'db_file', None)
+    sig = _db_signature(db_file) if db_file else None
+    bump_generation(db_file)
+    if db_file:
+        _file_state[db_file] = sig
+        wake_events(db_file)
+        wake_jobs(db_file)
 
 def get_settings_dict():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT key, value FROM settings')
     rows = c.fetchall()
-    conn.close()
     return {row[0]: row[1] for row in rows}
 
-# --- HTML 模板 ---
-HTML_TEMPLATE = '''
-<!DOCTYPE html>
-<html lang="zh">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>小记管理控制台</title>
-    <style>
-        :root {
-            --left-bg: {{ settings.get('left_bg', '#2c3e50') }};
-            --left-text: {{ settings.get('left_text', '#ffffff') }};
-            --right-bg: {{ settings.get('right_bg', '#ffffff') }};
-            --right-text: {{ settings.get('right_text', '#333333') }};
-            --addr-name-color: {{ settings.get('addr_name_color', '#3498db') }};
-            
-            --bg-color: #f4f4f9; --text-color: #333; --card-bg: white; --input-bg: white;
-            --border-color: #ddd; --shadow: 0 4px 12px rgba(0,0,0,0.08);
-            --addr-card-bg: rgba(0,0,0,0.2); --addr-text: rgba(255,255,255,0.7); 
-            --btn-bg: #e0e0e0; --highlight: #3498db; --special-color: #e67e22;
-            
-            --left-sidebar-width: 320px; --drawer-width: 800px; 
-        }
-
-        .sidebar-left { color: var(--left-text) !important; }
-        .sidebar-left .addr-row { color: var(--left-text); opacity: 0.8; }
-        .sidebar-left .sidebar-desc { color: var(--left-text); opacity: 0.6; }
-        .sidebar-left .setting-label { color: var(--left-text); }
-        .sidebar-left h3 { border-bottom-color: rgba(255,255,255,0.2); }
-
-        .sidebar-right { color: var(--right-text) !important; }
-        .profile-name, .special-remark-text { color: var(--right-text); }
-        .profile-remark, .special-link-text { color: var(--right-text); opacity: 0.7; }
-        .profile-bottom, .special-card { background: var(--input-bg); border-color: var(--border-color); }
-
-        [data-theme="dark"] {
-            --bg-color: #121212; --text-color: #e0e0e0; --card-bg: #1e1e1e; --input-bg: #2d2d2d;
-            --border-color: #444; --shadow: 0 4px 12px rgba(0,0,0,0.6); --btn-bg: #333;
-            --highlight: #5dade2; --special-color: #d35400;
-            --left-bg: #0f1519; --left-text: #ccc; --right-bg: #1e1e1e; --right-text: #ccc;
-            --addr-name-color: #5dade2;
-        }
-
-        * { box-sizing: border-box; }
-        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Arial, sans-serif; margin: 0; background: var(--bg-color); color: var(--text-color); display: flex; min-height: 100vh; overflow-x: hidden; }
-        ::-webkit-scrollbar { width: 6px; } ::-webkit-scrollbar-track { background: transparent; } ::-webkit-scrollbar-thumb { background: rgba(128,128,128,0.3); border-radius: 3px; }
-
-        .theme-switch-wrapper { position: fixed; top: 15px; right: 20px; z-index: 9000; }
-        .theme-btn { background: var(--btn-bg); border: 1px solid var(--border-color); color: var(--text-color); padding: 8px 15px; cursor: pointer; border-radius: 20px; font-size: 14px; font-weight: bold; box-shadow: 0 2px 5px rgba(0,0,0,0.2); transition: all 0.2s; }
-        .theme-btn:hover { transform: scale(1.05); }
-
-        .sidebar-left { width: var(--left-sidebar-width); background: var(--left-bg); padding: 20px; display: flex; flex-direction: column; position: fixed; left: 0; top: 0; bottom: 0; overflow-y: auto; z-index: 100; box-shadow: 2px 0 10px rgba(0,0,0,0.2); transition: background 0.3s; }
-        .sidebar-header-row { display: flex; justify-content: space-between; align-items: center; border-bottom: 1px solid rgba(255,255,255,0.2); padding-bottom: 10px; margin-bottom: 15px; }
-        .sidebar-header-row h3 { margin: 0; border: none; padding: 0; }
-        .btn-color-setting { background: none; border: none; cursor: pointer; font-size: 1.2em; opacity: 0.7; transition: 0.2s; }
-        .btn-color-setting:hover { opacity: 1; transform: rotate(30deg); }
-
-        .drawer-handle {
-            position: fixed; right: 0; width: 40px; padding: 15px 5px; cursor: pointer; z-index: 2000;
-            border-top-left-radius: 8px; border-bottom-left-radius: 8px;
-            writing-mode: vertical-rl; text-orientation: upright; font-weight: bold;
-            box-shadow: -2px 0 10px rgba(0,0,0,0.2); transition: right 0.3s ease; letter-spacing: 2px; color: white;
-        }
-        .drawer-handle:hover { padding-left: 10px; width: 45px; }
-        
-        .handle-profile { top: 40%; transform: translateY(-50%); background: var(--highlight); }
-        .handle-special { top: 60%; transform: translateY(-50%); background: var(--special-color); }
-
-        .sidebar-right {
-            position: fixed; top: 0; right: 0; bottom: 0; width: var(--drawer-width); max-width: 90vw;
-            background: var(--right-bg); z-index: 10001; 
-            transform: translateX(100%); transition: transform 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-            box-shadow: -5px 0 20px rgba(0,0,0,0.2); padding: 20px; display: flex; flex-direction: column; overflow-y: auto;
-        }
-        .sidebar-right.open { transform: translateX(0); }
-
-        .drawer-overlay {
-            position: fixed; top: 0; left: 0; right: 0; bottom: 0; background: rgba(0,0,0,0.5); z-index: 10000;
-            display: none; backdrop-filter: blur(2px); opacity: 0; transition: opacity 0.3s;
-        }
-        .drawer-overlay.open { display: block; opacity: 1; }
-
-        .right-header { font-size: 1.5em; font-weight: bold; margin-bottom: 20px; text-align: center; border-bottom: 2px solid; padding-bottom: 10px; display: flex; justify-content: space-between; align-items: center;}
-        .close-drawer-btn { font-size: 0.8em; cursor: pointer; color: var(--right-text); opacity: 0.5; border: 1px solid var(--border-color); padding: 5px 10px; border-radius: 4px; background:transparent; }
-        .close-drawer-btn:hover { opacity: 1; background: var(--btn-bg); }
-
-        .header-profile { color: var(--highlight); border-bottom-color: var(--highlight); }
-        #profile-list { display: grid; grid-template-columns: repeat(auto-fill, minmax(220px, 1fr)); gap: 15px; padding-bottom: 20px; }
-        .profile-card { background: var(--input-bg); border: 1px solid var(--border-color); border-radius: 8px; padding: 12px; display: flex; flex-direction: column; position: relative; transition: transform 0.2s; box-shadow: 0 2px 5px var(--shadow); height: 100%; }
-        .profile-card:hover { transform: translateY(-3px); box-shadow: 0 8px 20px var(--shadow); z-index: 2; }
-        .profile-top { display: flex; gap: 10px; margin-bottom: 10px; align-items: center; }
-        .profile-avatar { width: 50px; height: 50px; border-radius: 50%; object-fit: cover; border: 2px solid var(--border-color); background: #eee; cursor: pointer; transition: transform 0.2s; }
-        .profile-avatar:hover { transform: scale(1.1); border-color: var(--highlight); }
-        .profile-info { flex: 1; overflow: hidden; display: flex; flex-direction: column; justify-content: center; }
-        .profile-name { font-weight: bold; font-size: 1.05em; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
-        .profile-remark { font-size: 0.8em; margin-top: 3px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
-        .profile-bottom { border-radius: 4px; padding: 6px; display: flex; align-items: center; justify-content: space-between; font-size: 0.85em; margin-top: auto; }
-        .acc-num { font-family: monospace; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; max-width: 140px; }
-        .profile-actions { position: absolute; top: 5px; right: 5px; display: flex; gap: 5px; }
-        .action-icon { cursor: pointer; font-size: 1.1em; opacity: 0.2; transition: 0.2s; }
-        .profile-card:hover .action-icon { opacity: 0.6; }
-        .action-icon:hover { opacity: 1; }
-
-        /* 特别记事样式 */
-        .header-special { color: var(--special-color); border-bottom-color: var(--special-color); }
-        .special-list { display: flex; flex-direction: column; gap: 15px; }
-        .special-card { background: var(--input-bg); border: 1px solid var(--border-color); border-radius: 8px; padding: 15px; position: relative; border-left: 4px solid var(--special-color); transition: 0.2s; }
-        .special-card:hover { transform: translateX(-2px); box-shadow: 0 5px 15px var(--shadow); }
-        .special-row { display: flex; justify-content: space-between; align-items: flex-start; gap: 10px; margin-bottom: 8px; }
-        .special-remark-text { font-size: 1.1em; font-weight: bold; color: var(--right-text); white-space: pre-wrap; flex: 1; line-height: 1.5; }
-        .special-link-text { font-size: 0.9em; color: var(--right-text); opacity: 0.8; word-break: break-all; flex: 1; font-family: monospace; }
-        .special-link-text a { color: var(--highlight); text-decoration: none; font-weight: bold; }
-        .special-actions-footer { display: flex; gap: 10px; justify-content: flex-end; align-items: center; margin-top: 10px; border-top: 1px dashed var(--border-color); padding-top: 8px; }
-        .btn-del-special { color: #e74c3c; cursor: pointer; font-weight: bold; opacity: 0.6; font-size: 0.9em; }
-        .btn-del-special:hover { opacity: 1; }
-        .btn-edit-special { color: #f39c12; cursor: pointer; font-weight: bold; opacity: 0.6; font-size: 0.9em; }
-        .btn-edit-special:hover { opacity: 1; }
-
-        .main-content { margin-left: var(--left-sidebar-width); width: calc(100% - var(--left-sidebar-width)); padding: 40px; display: flex; flex-direction: column; align-items: center; }
-        .content-container { width: 100%; max-width: 900px; }
-
-        .sidebar-desc { font-size: 0.8em; margin-bottom: 10px; }
-        .setting-box { background: rgba(128,128,128,0.1); padding: 15px; border-radius: 8px; margin-bottom: 25px; border: 1px solid rgba(128,128,128,0.2); }
-        .setting-label { font-size: 0.9em; font-weight: bold; margin-bottom: 8px; display: block; }
-        .account-editor { width: 100%; height: 80px; background: rgba(255,255,255,0.9); border: none; border-radius: 4px; padding: 8px; margin-bottom: 8px; font-family: monospace; resize: vertical; font-size: 0.9em; color: #333; }
-        .btn-save-settings { width: 100%; padding: 8px; background: #3498db; color: white; border: none; border-radius: 4px; cursor: pointer; font-weight: bold; font-size: 0.9em; }
-        
-        .addr-card { background: var(--addr-card-bg); padding: 12px; border-radius: 6px; font-size: 0.85em; border: 1px solid rgba(128,128,128,0.2); }
-        .addr-header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px; border-bottom: 1px dashed; padding-bottom: 5px; border-color: rgba(128,128,128,0.3); }
-        .addr-name { font-size: 1.2em; font-weight: 800; color: var(--addr-name-color); } 
-        .addr-row { display: flex; align-items: center; gap: 5px; margin-top: 6px; color: var(--addr-text); width: 100%; }
-        .addr-val { flex: 1; min-width: 0; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; font-family: monospace; background: rgba(0,0,0,0.3); padding: 2px 5px; border-radius: 3px; color: #ccc; }
-        .btn-copy-icon { flex-shrink: 0; background: none; border: 1px solid #576d80; color: #bdc3c7; cursor: pointer; border-radius: 3px; font-size: 0.8em; padding: 1px 6px; white-space: nowrap; }
-        .btn-copy-icon.copied { background: #2ecc71; color: white; border-color: #2ecc71; }
-        
-        .btn-show-form { width: 100%; background: #27ae60; color: white; border: none; padding: 8px; border-radius: 4px; cursor: pointer; font-weight: bold; margin-top: 5px; }
-        .add-addr-container { display: none; margin-top: 10px; background: rgba(0,0,0,0.2); padding: 10px; border-radius: 6px; }
-        .add-addr-form input { padding: 8px; border-radius: 4px; border: none; font-size: 0.9em; background: #fff; width: 100%; margin-bottom: 5px; }
-        .btn-submit-addr { background: #3498db; color: white; border: none; padding: 8px; border-radius: 4px; cursor: pointer; font-weight: bold; width: 100%; }
-
-        h2 { text-align: center; margin-bottom: 30px; color: var(--text-color); }
-        .input-group { background: var(--card-bg); padding: 20px; border-radius: 12px; box-shadow: 0 4px 10px var(--shadow); display: flex; gap: 10px; margin-bottom: 30px; border: 1px solid var(--border-color); }
-        input[type="text"] { flex: 1; padding: 12px; border: 1px solid var(--border-color); border-radius: 6px; font-size: 16px; background: var(--input-bg); color: var(--text-color); }
-        button.add-btn { padding: 0 25px; background: #27ae60; color: white; border: none; border-radius: 6px; cursor: pointer; font-weight: bold; font-size: 16px; }
-
-        .list-group { list-style: none; padding: 0; }
-        .list-item { background: var(--card-bg); border: 1px solid var(--border-color); padding: 20px; margin-bottom: 20px; border-radius: 10px; box-shadow: 0 2px 5px var(--shadow); transition: all 0.2s; }
-        .list-item:hover { box-shadow: 0 5px 15px var(--shadow); }
-        .list-item.stats-off { border-left: 5px solid #bdc3c7; }
-        .list-item.pending { border-left: 5px solid #f1c40f; }
-        .list-item.completed { border-left: 5px solid #2ecc71; background: rgba(46, 204, 113, 0.1); }
-
-        .item-header { display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 15px; }
-        .content-wrapper { flex: 1; margin-right: 15px; display: flex; flex-direction: column; gap: 5px; }
-        .item-remark { font-size: 1.2em; font-weight: bold; color: var(--text-color); margin-bottom: 2px; }
-        .item-url { font-size: 0.9em; color: #666; word-break: break-all; }
-        .url-link { color: #2980b9; text-decoration: none; font-weight: normal; }
-        .btn-copy { background: #ecf0f1; border: 1px solid #bdc3c7; color: #555; border-radius: 4px; padding: 2px 8px; font-size: 0.8em; cursor: pointer; display: inline-flex; align-items: center; margin-left: 5px; }
-        .btn-copy.copied { background: #2ecc71; color: white; border-color: #2ecc71; }
-        
-        .toolbar { display: flex; gap: 8px; flex-wrap: wrap; margin-top: 10px; }
-        .btn-sm { padding: 5px 10px; font-size: 0.85em; background: #95a5a6; color: white; text-decoration: none; border-radius: 4px; border:none; cursor: pointer;}
-        .btn-toggle { background: #1abc9c; }
-        .btn-edit-info { background: #f39c12; }
-        .btn-del { background: #e74c3c; margin-left: auto; }
-        .btn-update { background: #3498db; color: white; padding: 6px 15px; border: none; border-radius: 4px; cursor: pointer; }
-        
-        /* 排序按钮 - 优化后的样式 */
-        .btn-move { background: transparent; border: 1px solid var(--border-color); color: #999; font-size: 0.8em; padding: 2px 8px; border-radius: 4px; text-decoration: none; transition: all 0.2s; display: inline-flex; justify-content: center; align-items: center; min-width: 20px; }
-        .btn-move:hover { background: var(--highlight); color: white; border-color: var(--highlight); }
-
-        .btn-copy-mini { font-size: 0.9em; cursor: pointer; color: inherit; border: none; background: none; padding: 0 2px; opacity: 0.6; }
-        .btn-copy-mini:hover { opacity: 1; color: var(--highlight); }
-        .icon-edit { color: #f39c12; }
-        .icon-del { color: #e74c3c; }
-
-        .add-profile-box { margin-top: 10px; padding: 15px; background: var(--input-bg); border: 1px dashed var(--border-color); border-radius: 8px; }
-        .file-input { width: 100%; margin: 5px 0; font-size: 0.8em; }
-        .special-textarea { width: 100%; height: 100px; resize: vertical; font-family: sans-serif; padding: 10px; border: 1px solid var(--border-color); border-radius: 4px; background: var(--input-bg); color: var(--text-color); margin-bottom: 8px; font-size: 1em; }
-        .edit-area { margin-top: 10px; padding: 10px; background: rgba(0,0,0,0.02); display: none; }
-        .edit-area textarea { width: 100%; padding: 5px; margin-bottom: 5px; border: 1px solid #ccc; font-family: monospace; }
-        .stats-area { margin-top: 15px; padding-top: 15px; border-top: 1px dashed var(--border-color); }
-        .checkbox-group { display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 10px; }
-        .cb-label { display: flex; align-items: center; gap: 5px; font-size: 0.9em; background: var(--input-bg); padding: 5px 10px; border-radius: 4px; cursor: pointer; border: 1px solid var(--border-color); }
-
-        .modal-overlay { display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.5); justify-content: center; align-items: center; z-index: 20000; }
-        .modal-box { background: var(--card-bg); padding: 30px; border-radius: 10px; text-align: center; width: 360px; box-shadow: 0 5px 20px rgba(0,0,0,0.4); border: 1px solid var(--border-color); }
-        .modal-box h3 { margin-top: 0; color: var(--text-color); margin-bottom: 15px; }
-        #authPassword { width: 100%; margin: 20px 0; padding: 15px; border: 2px solid var(--highlight); border-radius: 8px; background: var(--input-bg); color: var(--text-color); font-size: 24px; font-weight: bold; text-align: center; letter-spacing: 2px; }
-        #authPassword:focus { outline: none; box-shadow: 0 0 10px rgba(52, 152, 219, 0.3); }
-        .modal-buttons { display: flex; justify-content: space-between; margin-top: 20px; gap: 15px; }
-        .btn-confirm { background-color: #3498db; color: white; padding: 12px 0; border: none; border-radius: 6px; cursor: pointer; font-weight: bold; flex: 1; font-size: 16px; }
-        .btn-cancel { background-color: #95a5a6; color: white; padding: 12px 0; border: none; border-radius: 6px; cursor: pointer; font-weight: bold; flex: 1; font-size: 16px; }
-
-        .modal-input-group { text-align: left; margin-bottom: 10px; }
-        .modal-input-label { font-size: 0.85em; color: #888; margin-bottom: 4px; display: block; }
-        .modal-input { width: 100%; padding: 10px; border: 1px solid var(--border-color); border-radius: 4px; background: var(--input-bg); color: var(--text-color); }
-        .color-picker-row { display: flex; align-items: center; justify-content: space-between; margin-bottom: 10px; padding: 5px 0; border-bottom: 1px solid #eee; }
-        input[type="color"] { border: none; width: 50px; height: 30px; cursor: pointer; background: none; }
-
-        @media (max-width: 768px) {
-            body { flex-direction: column; }
-            .sidebar-left { width: 100%; position: relative; height: auto; }
-            .main-content { margin-left: 0; width: 100%; padding: 20px; }
-            .sidebar-right { width: 100%; max-width: 85vw; }
-            #profile-list { grid-template-columns: repeat(auto-fill, minmax(150px, 1fr)); }
-        }
-    </style>
-</head>
-<body>
-    <div class="theme-switch-wrapper">
-        <button class="theme-btn" onclick="toggleTheme()" id="themeBtn">☀️/🌙</button>
-    </div>
-
-    <div class="drawer-handle handle-profile" onclick="toggleDrawer('profileDrawer')">💳 账户展馆</div>
-    <div class="drawer-handle handle-special" onclick="toggleDrawer('specialDrawer')">⭐ 特别记事</div>
-
-    <div class="drawer-overlay" id="drawerOverlay" onclick="closeAllDrawers()"></div>
-
-    <aside class="sidebar-left">
-        <div class="sidebar-header-row">
-            <h3>⚙️ 控制台</h3>
-            <button class="btn-color-setting" onclick="openColorModal()" title="设置界面颜色">🎨</button>
-        </div>
-        
-        <div class="setting-box">
-            <span class="setting-label">📥 默认账户模板</span>
-            <form action="/update_global_settings" method="post">
-                <textarea name="global_accounts_str" class="account-editor">{{ global_accounts_str }}</textarea>
-                <button type="submit" class="btn-save-settings">💾 保存模板</button>
-            </form>
-        </div>
-        <div class="setting-box">
-            <span class="setting-label">🏦 地址本</span>
-            <div class="addr-list">
-                {% for item in address_book %}
-                <div class="addr-card">
-                    <div class="addr-header">
-                        <span class="addr-name">{{ item.name }}</span>
-                        <div class="addr-actions">
-                            <span class="btn-icon btn-edit-addr" 
-                                  data-index="{{ loop.index0 }}" data-name="{{ item.name }}"
-                                  data-addr="{{ item.addr }}" data-uid="{{ item.uid }}"
-                                  onclick="openEditAddrModal(this)">✏️</span>
-                            <span class="btn-icon btn-del-addr" onclick="triggerAuth('delete_addr', {{ loop.index0 }})">×</span>
-                        </div>
-                    </div>
-                    {% if item.addr %}
-                    <div class="addr-row">
-                        <span class="addr-val" title="{{ item.addr }}">{{ item.addr }}</span>
-                        <button class="btn-copy-icon" data-val="{{ item.addr }}" onclick="copyContent(this.dataset.val, this)">Copy</button>
-                    </div>
-                    {% endif %}
-                    {% if item.uid %}
-                    <div class="addr-row">
-                        <span class="addr-val" title="{{ item.uid }}">{{ item.uid }}</span>
-                        <button class="btn-copy-icon" data-val="{{ item.uid }}" onclick="copyContent(this.dataset.val, this)">Copy</button>
-                    </div>
-                    {% endif %}
-                </div>
-                {% endfor %}
-            </div>
-            <button id="btn-toggle-addr" class="btn-show-form" onclick="toggleAddrForm()">＋ 添加新备忘</button>
-            <div id="addr-form-container" class="add-addr-container">
-                <form id="realAddForm" action="/add_addr" method="post" class="add-addr-form" onsubmit="event.preventDefault(); triggerAuth('add_addr', this);">
-                    <input type="text" name="name" placeholder="账户备注" required>
-                    <input type="text" name="addr" placeholder="Address">
-                    <input type="text" name="uid" placeholder="UID">
-                    <button type="submit" class="btn-submit-addr">添加 (需密码)</button>
-                </form>
-            </div>
-        </div>
-        <div class="sidebar-desc" style="margin-top: auto; opacity: 0.5; text-align: center;">LegendVPS Tool v4.16 (Style+)</div>
-    </aside>
-
-    <aside class="sidebar-right" id="profileDrawer">
-        <div class="right-header header-profile">
-            <span>💳 账户展馆</span>
-            <button class="close-drawer-btn" onclick="closeAllDrawers()">收起 >></button>
-        </div>
-        <div id="profile-list">
-            {% for p in profiles %}
-            <div class="profile-card">
-                <div class="profile-actions">
-                    <span class="action-icon icon-edit"
-                          data-id="{{ p.id }}" data-name="{{ p.name }}" data-remark="{{ p.remark }}"
-                          data-acc="{{ p.account_number }}" data-link="{{ p.link }}"
-                          onclick="openEditProfileModal(this)">✏️</span>
-                    <span class="action-icon icon-del" onclick="triggerAuth('delete_profile', {{ p.id }})">×</span>
-                </div>
-                <div class="profile-top">
-                    <a href="{{ p.link if p.link else '#' }}" target="_blank">
-                        <img src="{{ url_for('uploaded_file', filename=p.avatar) }}" class="profile-avatar" onerror="this.src='https://via.placeholder.com/50?text=User'">
-                    </a>
-                    <div class="profile-info">
-                        <div class="profile-name" title="{{ p.name }}">{{ p.name }}</div>
-                        <div class="profile-remark" title="{{ p.remark }}">{{ p.remark }}</div>
-                    </div>
-                </div>
-                {% if p.account_number %}
-                <div class="profile-bottom">
-                    <span class="acc-num" title="{{ p.account_number }}">{{ p.account_number }}</span>
-                    <button class="btn-copy-mini" onclick="copyContent('{{ p.account_number }}', this)">📋</button>
-                </div>
-                {% endif %}
-            </div>
-            {% endfor %}
-        </div>
-        <button class="btn-show-form" onclick="document.getElementById('add-profile-form').style.display = 'block'">＋ 添加展示账户</button>
-        <div id="add-profile-form" class="add-profile-box" style="display:none;">
-            <form id="realProfileForm" action="/add_profile" method="post" enctype="multipart/form-data" onsubmit="event.preventDefault(); triggerAuth('add_profile', this);">
-                <input type="text" name="name" placeholder="账户昵称" required class="file-input">
-                <input type="text" name="remark" placeholder="备注信息" class="file-input">
-                <input type="text" name="account_number" placeholder="账户号" class="file-input">
-                <input type="text" name="link" placeholder="链接" class="file-input">
-                <label style="font-size:0.8em;">头像:</label>
-                <input type="file" name="file" class="file-input" accept="image/*" required>
-                <button type="submit" class="btn-submit-addr" style="width:100%; margin-top:5px;">上传并添加</button>
-            </form>
-        </div>
-    </aside>
-
-    <aside class="sidebar-right" id="specialDrawer">
-        <div class="right-header header-special">
-            <span>⭐ 特别记事</span>
-            <button class="close-drawer-btn" onclick="closeAllDrawers()">收起 >></button>
-        </div>
-        
-        <div class="special-list">
-            {% for s in special_notes %}
-            <div class="special-card">
-                {% if s.remark %}
-                <div class="special-row">
-                    <div class="special-remark-text">{{ s.remark }}</div>
-                    <button class="btn-copy-mini" onclick="copyContent('{{ s.remark|replace("'", "\\'")|replace('\n', '\\n') }}', this)">📋</button>
-                </div>
-                {% endif %}
-                {% if s.content %}
-                <div class="special-row">
-                    <div class="special-link-text">
-                        {% if s.content.startswith('http') %}
-                            <a href="{{ s.content }}" target="_blank">{{ s.content }}</a>
-                        {% else %}
-                            {{ s.content }}
-                        {% endif %}
-                    </div>
-                    <button class="btn-copy-mini" onclick="copyContent('{{ s.content|replace("'", "\\'") }}', this)">📋</button>
-                </div>
-                {% endif %}
-                <div class="special-actions-footer">
-                    <span class="action-icon icon-edit btn-edit-special" 
-                          onclick="openEditSpecialModal({{ s.id }}, '{{ s.content|replace("'", "\\'") }}', '{{ s.remark|replace("'", "\\'")|replace('\n', '\\n') }}')">✏️ 修改</span>
-                    <span class="action-icon icon-del btn-del-special" onclick="triggerAuth('delete_special', {{ s.id }})">🗑️ 删除</span>
-                </div>
-            </div>
-            {% endfor %}
-        </div>
-
-        <button class="btn-show-form" onclick="document.getElementById('add-special-form').style.display = 'block'" style="background:var(--special-color); margin-top:20px;">＋ 新增记事</button>
-        <div id="add-special-form" class="add-profile-box" style="display:none; border-color:var(--special-color);">
-            <form id="realSpecialForm" action="/add_special_note" method="post" onsubmit="document.getElementById('realSpecialForm').submit();">
-                <textarea name="remark" placeholder="内容 (支持换行)" class="special-textarea"></textarea>
-                <input type="text" name="content" placeholder="链接 (Link)" class="file-input">
-                <button type="submit" class="btn-submit-addr" style="background:var(--special-color); width:100%; margin-top:5px;">保存</button>
-            </form>
-        </div>
-    </aside>
-
-    <main class="main-content">
-        <div class="content-container">
-            <h2>📋 小记管理</h2>
-            <form action="/add" method="post" class="input-group">
-                <input type="text" name="url" placeholder="任务链接 / 文字小记..." required>
-                <input type="text" name="remark" placeholder="备注 (可选)" style="flex: 0.7;">
-                <button type="submit" class="add-btn">＋ 发布</button>
-            </form>
-            <ul class="list-group">
-                {% for item in items %}
-                <li class="list-item {% if not item.enable_stats %}stats-off{% elif item.is_complete %}completed{% else %}pending{% endif %}">
-                    <div class="item-header">
-                        <div class="content-wrapper">
-                            {% if item.remark %}
-                                <div class="item-remark">{{ item.remark }}</div>
-                            {% endif %}
-                            <div class="item-url">
-                                <a href="{{ item.url }}" class="url-link" target="_blank">{{ item.url }}</a>
-                                <button class="btn-copy" data-url="{{ item.url }}" onclick="copyContent(this.dataset.url, this)">📋</button>
-                            </div>
-                        </div>
-                        
-                        <div style="display:flex; flex-direction:column; align-items:flex-end; gap:5px;">
-                            {% if item.enable_stats %}
-                                {% if item.is_complete %}<span class="badge badge-success">✅ 已完成</span>
-                                {% else %}<span class="badge badge-warning">⏳ {{ item.done_count }} / {{ item.total_count }}</span>{% endif %}
-                            {% else %}<span class="badge badge-gray">⚪ 统计关闭</span>{% endif %}
-                            
-                            <div style="display:flex; gap:2px;">
-                                <a href="/move/{{ item.id }}/up" class="btn-move" title="上移">▲</a>
-                                <a href="/move/{{ item.id }}/down" class="btn-move" title="下移">▼</a>
-                            </div>
-                        </div>
-                    </div>
-                    
-                    <div class="toolbar">
-                        <a href="/toggle_stats/{{ item.id }}" class="btn-sm btn-toggle">{% if item.enable_stats %}👁️ 隐藏{% else %}📊 开启统计{% endif %}</a>
-                        {% if item.enable_stats %}
-                        <button type="button" class="btn-sm" onclick="toggleEdit({{ item.id }})">⚙️ 改账户</button>
-                        <button type="button" class="btn-sm btn-edit-info" onclick="openEditTaskModal({{ item.id }}, '{{ item.url|replace("'", "\\'") }}', '{{ item.remark|replace("'", "\\'") }}')">✏️ 改内容</button>
-                        {% endif %}
-                        <span class="btn-sm btn-del" onclick="triggerAuth('delete_task', {{ item.id }})">🗑️ 删除</span>
-                    </div>
-                    
-                    {% if item.enable_stats %}
-                        <form action="/update_item_accounts/{{ item.id }}" method="post" id="edit-{{ item.id }}" class="edit-area">
-                            <textarea name="target_accounts_str">{{ item.target_accounts_str }}</textarea>
-                            <button type="submit" class="btn-sm" style="background:#3498db; margin-top:5px;">保存修改</button>
-                        </form>
-                        <form action="/update_progress/{{ item.id }}" method="post" class="stats-area">
-                            <div class="checkbox-group">
-                                {% for acc in item.target_accounts %}
-                                <label class="cb-label"><input type="checkbox" name="done_accounts" value="{{ acc }}" {% if acc in item.done_accounts %}checked{% endif %}> {{ acc }}</label>
-                                {% endfor %}
-                            </div>
-                            <button type="submit" class="btn-update">更新进度</button>
-                        </form>
-                    {% endif %}
-                </li>
-                {% endfor %}
-            </ul>
-        </div>
-    </main>
-
-    <div class="modal-overlay" id="authModal">
-        <div class="modal-box"><h3>请验证</h3><input type="password" id="authPassword" maxlength="10"><div class="modal-buttons"><button class="btn-cancel" onclick="closeModal('authModal')">取消</button><button class="btn-confirm" onclick="confirmAction()">确认</button></div></div>
-    </div>
-    <div class="modal-overlay" id="colorModal">
-        <div class="modal-box"><h3>🎨 界面配色</h3><form id="colorForm" action="/save_theme" method="post" onsubmit="event.preventDefault(); triggerAuth('save_theme', this);">
-            <div class="color-picker-row"><span class="color-picker-label">👈 左侧背景</span><input type="color" name="left_bg" value="{{ settings.get('left_bg', '#2c3e50') }}"></div>
-            <div class="color-picker-row"><span class="color-picker-label">👈 左侧文字</span><input type="color" name="left_text" value="{{ settings.get('left_text', '#ffffff') }}"></div>
-            <div class="color-picker-row"><span class="color-picker-label">🏦 地址本标题色</span><input type="color" name="addr_name_color" value="{{ settings.get('addr_name_color', '#3498db') }}"></div>
-            <hr style="border:0; border-top:1px dashed #ddd; margin:15px 0;">
-            <div class="color-picker-row"><span class="color-picker-label">👉 右侧背景</span><input type="color" name="right_bg" value="{{ settings.get('right_bg', '#ffffff') }}"></div>
-            <div class="color-picker-row"><span class="color-picker-label">👉 右侧文字</span><input type="color" name="right_text" value="{{ settings.get('right_text', '#333333') }}"></div>
-            <div class="modal-buttons"><button type="button" class="btn-cancel" onclick="closeModal('colorModal')">取消</button><button type="submit" class="btn-confirm">保存 (需密码)</button></div>
-        </form></div>
-    </div>
-    <div class="modal-overlay" id="editAddrModal">
-        <div class="modal-box"><h3>✏️ 修改地址</h3><form id="editAddrForm" action="/edit_addr" method="post" onsubmit="event.preventDefault(); triggerAuth('edit_addr', this);"><input type="hidden" name="index" id="edit_index"><div class="modal-input-group"><label class="modal-input-label">备注:</label><input type="text" name="name" id="edit_name" class="modal-input" required></div><div class="modal-input-group"><label class="modal-input-label">Address:</label><input type="text" name="addr" id="edit_addr_val" class="modal-input"></div><div class="modal-input-group"><label class="modal-input-label">UID:</label><input type="text" name="uid" id="edit_uid_val" class="modal-input"></div><div class="modal-buttons"><button type="button" class="btn-cancel" onclick="closeModal('editAddrModal')">取消</button><button type="submit" class="btn-confirm">保存</button></div></form></div>
-    </div>
-    <div class="modal-overlay" id="editTaskModal">
-        <div class="modal-box"><h3>✏️ 修改小记</h3><form id="editTaskForm" action="/edit_task_info" method="post" onsubmit="event.preventDefault(); triggerAuth('edit_task_info', this);"><input type="hidden" name="id" id="edit_task_id"><div class="modal-input-group"><label class="modal-input-label">内容:</label><input type="text" name="url" id="edit_task_url" class="modal-input" required></div><div class="modal-input-group"><label class="modal-input-label">备注:</label><input type="text" name="remark" id="edit_task_remark" class="modal-input"></div><div class="modal-buttons"><button type="button" class="btn-cancel" onclick="closeModal('editTaskModal')">取消</button><button type="submit" class="btn-confirm">保存</button></div></form></div>
-    </div>
-    <div class="modal-overlay" id="editProfileModal">
-        <div class="modal-box"><h3>✏️ 修改展示</h3><form id="editProfileForm" action="/edit_profile" method="post" onsubmit="event.preventDefault(); triggerAuth('edit_profile', this);"><input type="hidden" name="id" id="edit_profile_id"><div class="modal-input-group"><label class="modal-input-label">昵称:</label><input type="text" name="name" id="edit_profile_name" class="modal-input" required></div><div class="modal-input-group"><label class="modal-input-label">备注:</label><input type="text" name="remark" id="edit_profile_remark" class="modal-input"></div><div class="modal-input-group"><label class="modal-input-label">账户号:</label><input type="text" name="account_number" id="edit_profile_acc" class="modal-input"></div><div class="modal-input-group"><label class="modal-input-label">链接:</label><input type="text" name="link" id="edit_profile_link" class="modal-input"></div><div class="modal-buttons"><button type="button" class="btn-cancel" onclick="closeModal('editProfileModal')">取消</button><button type="submit" class="btn-confirm">保存</button></div></form></div>
-    </div>
-    
-    <div class="modal-overlay" id="editSpecialModal">
-        <div class="modal-box"><h3>✏️ 修改特别记事</h3><form id="editSpecialForm" action="/edit_special_note" method="post" onsubmit="event.preventDefault(); triggerAuth('edit_special_note', this);">
-            <input type="hidden" name="id" id="edit_special_id">
-            <div class="modal-input-group"><label class="modal-input-label">内容 (支持换行):</label><textarea name="remark" id="edit_special_remark" class="special-textarea"></textarea></div>
-            <div class="modal-input-group"><label class="modal-input-label">链接:</label><input type="text" name="content" id="edit_special_content" class="modal-input"></div>
-            <div class="modal-buttons"><button type="button" class="btn-cancel" onclick="closeModal('editSpecialModal')">取消</button><button type="submit" class="btn-confirm">保存</button></div>
-        </form></div>
-    </div>
-    
-    <script>
-        function toggleTheme() { try { const c = document.documentElement.getAttribute("data-theme"); const n = c === "dark" ? "light" : "dark"; document.documentElement.setAttribute("data-theme", n); localStorage.setItem("theme", n); } catch(e) {} }
-        document.addEventListener("DOMContentLoaded", function() { const s = localStorage.getItem("theme") || "light"; document.documentElement.setAttribute("data-theme", s); const p = document.getElementById('authPassword'); if(p){ p.addEventListener("keypress", function(e) { if (e.key === "Enter") confirmAction(); }); } });
-        
-        function toggleDrawer(id) {
-            var overlay = document.getElementById('drawerOverlay');
-            var target = document.getElementById(id);
-            if (target.classList.contains('open')) { closeAllDrawers(); } else { closeAllDrawers(); target.classList.add('open'); overlay.classList.add('open'); }
-        }
-        function closeAllDrawers() { document.getElementById('profileDrawer').classList.remove('open'); document.getElementById('specialDrawer').classList.remove('open'); document.getElementById('drawerOverlay').classList.remove('open'); }
-
-        function toggleEdit(id) { var el = document.getElementById('edit-' + id); el.style.display = el.style.display === 'block' ? 'none' : 'block'; }
-        function toggleAddrForm() { var el = document.getElementById('addr-form-container'); var btn = document.getElementById('btn-toggle-addr'); if (el.style.display === 'block') { el.style.display = 'none'; btn.innerText = '＋ 添加新备忘'; } else { el.style.display = 'block'; btn.innerText = '－ 收起'; } }
-        function copyContent(text, btnElement) { navigator.clipboard.writeText(text).then(function() { var originalText = btnElement.innerText; btnElement.innerText = "OK"; setTimeout(function() { btnElement.innerText = originalText; }, 1500); }, function(err) { alert('复制失败'); }); }
-        
-        function openEditAddrModal(btn) { document.getElementById('edit_index').value = btn.dataset.index; document.getElementById('edit_name').value = btn.dataset.name; document.getElementById('edit_addr_val').value = btn.dataset.addr; document.getElementById('edit_uid_val').value = btn.dataset.uid; document.getElementById('editAddrModal').style.display = 'flex'; }
-        function openEditTaskModal(id, url, remark) { document.getElementById('edit_task_id').value = id; document.getElementById('edit_task_url').value = url; document.getElementById('edit_task_remark').value = remark; document.getElementById('editTaskModal').style.display = 'flex'; }
-        function openEditProfileModal(btn) { document.getElementById('edit_profile_id').value = btn.dataset.id; document.getElementById('edit_profile_name').value = btn.dataset.name; document.getElementById('edit_profile_remark').value = btn.dataset.remark; document.getElementById('edit_profile_acc').value = btn.dataset.acc; document.getElementById('edit_profile_link').value = btn.dataset.link; document.getElementById('editProfileModal').style.display = 'flex'; }
-        function openEditSpecialModal(id, content, remark) { document.getElementById('edit_special_id').value = id; document.getElementById('edit_special_content').value = content; document.getElementById('edit_special_remark').value = remark; document.getElementById('editSpecialModal').style.display = 'flex'; }
-        function openColorModal() { document.getElementById('colorModal').style.display = 'flex'; }
-        
-        let pendingAction = null; let pendingData = null;
-        function triggerAuth(action, data) {
-            const modal = document.getElementById('authModal'); const passInput = document.getElementById('authPassword');
-            pendingAction = action; pendingData = data; passInput.value = ""; 
-            ['editAddrModal', 'editTaskModal', 'editProfileModal', 'colorModal', 'editSpecialModal'].forEach(id => document.getElementById(id).style.display = 'none');
-            modal.style.display = 'flex'; passInput.focus();
-        }
-        function closeModal(modalId) { document.getElementById(modalId).style.display = 'none'; pendingAction = null; pendingData = null; }
-        function confirmAction() {
-            const password = document.getElementById('authPassword').value;
-            if (password === "110") {
-                if (pendingAction === 'delete_addr') window.location.href = "/delete_addr/" + pendingData;
-                else if (pendingAction === 'add_addr') document.getElementById('realAddForm').submit();
-                else if (pendingAction === 'delete_task') window.location.href = "/delete/" + pendingData;
-                else if (pendingAction === 'edit_addr') document.getElementById('editAddrForm').submit();
-                else if (pendingAction === 'edit_task_info') document.getElementById('editTaskForm').submit();
-                else if (pendingAction === 'add_profile') document.getElementById('realProfileForm').submit();
-                else if (pendingAction === 'delete_profile') window.location.href = "/delete_profile/" + pendingData;
-                else if (pendingAction === 'edit_profile') document.getElementById('editProfileForm').submit();
-                else if (pendingAction === 'save_theme') document.getElementById('colorForm').submit();
-                else if (pendingAction === 'delete_special') window.location.href = "/delete_special_note/" + pendingData;
-                else if (pendingAction === 'edit_special_note') document.getElementById('editSpecialForm').submit();
-                closeModal('authModal');
-            } else { alert("密码错误！"); document.getElementById('authPassword').value = ""; }
-        }
-    </script>
-</body>
-</html>
-'''
+# --- 实时事件 ---
+# 写操作在同一个事务里往 events 表追加一条变更事件，/events 用 Server-Sent Events 推给打开的页面，
+# 页面按事件只刷新受影响的那一块。每个进程一个分发线程：本进程提交后立即唤醒，
+# 别的 worker 进程的提交靠库文件状态变化发现（每 EVENT_POLL 秒两次 stat），
+# 读出新事件放进内存里的环形缓冲，所有连接共用，不会每个客户端各查一遍库。
+# 同步服务器上每条 SSE 连接一直占着一个工作线程，所以每个进程最多开 EVENT_STREAMS 条（配置项，0 不限），
+# 超出的连接只拿走积压的事件就结束，浏览器隔 EVENT_BUSY_RETRY_MS 带着 Last-Event-ID 再来，退化成轮询。
+# note_asgi 的 /events 是协程，不受这个限制。
+EVENT_POLL = 0.5
+EVENT_PING = 15  # 空闲时发注释行保活，顺便让断开的连接尽早退出
+EVENT_RETRY_MS = 3000
+EVENT_BUSY_RETRY_MS = 10000
+EVENT_BUFFER = 500
+EVENT_RETAIN = 10000  # 表里最多保留的事件数
 
-# --- 路由 ---
-@app.route('/')
-def index():
-    init_db()
-    settings = get_settings_dict()
-    global_accounts_str = ",".join(json.loads(settings.get('global_accounts', '[]')))
-    address_book = json.loads(settings.get('address_book', '[]'))
-    
-    conn = sqlite3.connect(DB_FILE)
+_hubs = {}
+_hubs_lock = threading.Lock()
+_streams = {'open': 0}
+_streams_lock = threading.Lock()
+
+def emit(c, kind, **data):
+    c.execute('INSERT INTO events (kind, data) VALUES (?, ?)', (kind, json.dumps(data, ensure_ascii=False)))
+    if c.lastrowid % 1000 == 0:
+        c.execute('DELETE FROM events WHERE id <= ?', (c.lastrowid - EVENT_RETAIN,))
+
+def emit_progress(c, task_ids):
+    # 勾选进度的事件直接带上最新状态，页面不用再回来取
+    counts = task_counts(c, task_ids)
+    c.execute('SELECT task_id, account FROM task_accounts WHERE task_id IN (SELECT value FROM json_each(?)) AND done ORDER BY task_id, position',
+              (json.dumps(list(task_ids)),))
+    done = {}
+    for task_id, acc in c.fetchall():
+        done.setdefault(task_id, []).append(acc)
+    for task_id in task_ids:
+        emit(c, 'progress', id=task_id, done=done.get(task_id, []), **counts[task_id])
+    return counts
+
+def wake_events(db_file):
+    hub = _hubs.get(db_file)
+    if hub is not None:
+        hub['wake'].set()
+
+def _event_hub(db_file, subscribe=False):
+    # subscribe=True 的调用方是长连接，结束时要调 unsubscribe_events；有订阅的分发线程不会被回收
+    with _hubs_lock:
+        hub = _hubs.get(db_file)
+        if hub is None:
+            conn = _connect(db_file)
+            sig = _db_signature(db_file)
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+            # floor 之前的事件不在缓冲里，断线太久的客户端只能整页重新同步
+            hub = _hubs[db_file] = {'cond': threading.Condition(), 'wake': threading.Event(), 'events': [], 'last_id': last_id, 'floor': last_id,
+                                    'listeners': [], 'subscribers': 0, 'stopped': False}
+            threading.Thread(target=_dispatch_events, args=(db_file, conn, hub, sig), name='event-dispatch', daemon=True).start()
+        hub['subscribers'] += subscribe
+    return hub
+
+def unsubscribe_events(db_file, hub):
+    with _hubs_lock:
+        hub['subscribers'] -= 1
+    # 库的连接已经被回收过了，最后一个订阅走的时候把分发线程也停掉
+    if db_file not in _pool:
+        _stop_event_hub(db_file)
+
+def _stop_event_hub(db_file):
+    with _hubs_lock:
+        hub = _hubs.get(db_file)
+        if hub is None or hub['subscribers']:
+            return
+        del _hubs[db_file]
+        hub['stopped'] = True
+    hub['wake'].set()
+
+def _dispatch_events(db_file, conn, hub, sig):
+    try:
+        _dispatch_loop(db_file, conn, hub, sig)
+    finally:
+        conn.close()
+
+def _dispatch_loop(db_file, conn, hub, sig):
+    while not hub['stopped']:
+        hub['wake'].wait(EVENT_POLL)
+        hub['wake'].clear()
+        # 先 stat 再查：查询之后才发生的提交会让下一轮的文件状态不同
+        new_sig = _db_signature(db_file)
+        if new_sig == sig:
+            continue
+        sig = new_sig
+        try:
+            rows = conn.execute('SELECT id, kind, data FROM events WHERE id > ? ORDER BY id', (hub['last_id'],)).fetchall()
+        except sqlite3.Error:
+            log.exception('reading events failed')
+            continue
+        if rows:
+            with hub['cond']:
+                events = hub['events'] + rows
+                if len(events) > EVENT_BUFFER:
+                    hub['floor'] = events[-EVENT_BUFFER - 1][0]
+                    events = events[-EVENT_BUFFER:]
+                hub['events'], hub['last_id'] = events, rows[-1][0]
+                hub['cond'].notify_all()
+            # 不用线程等待的订阅方（note_asgi 的事件循环）在这里挂回调
+            for listener in list(hub['listeners']):
+                listener()
+
+def take_events(hub, last_id):
+    # 返回 (待发送的事件, 新的 last_id)，调用方要持有 hub['cond']
+    if last_id is not None and last_id < hub['floor']:
+        return [(hub['last_id'], 'reset', '{}')], hub['last_id']
+    if last_id is None:
+        last_id = hub['last_id']
+    pending = [e for e in hub['events'] if e[0] > last_id]
+    return pending, pending[-1][0] if pending else last_id
+
+def format_events(events):
+    return ''.join(f'id: {id}\nevent: {kind}\ndata: {data}\n\n' for id, kind, data in events)
+
+def stream_events(db_file, last_id=None):
+    hub = _event_hub(db_file, subscribe=True)
+    try:
+        yield f'retry: {EVENT_RETRY_MS}\n\n'
+        while True:
+            with hub['cond']:
+                pending, last_id = take_events(hub, last_id)
+                if not pending:
+                    hub['cond'].wait(EVENT_PING)
+                    pending, last_id = take_events(hub, last_id)
+            yield format_events(pending) if pending else ': ping\n\n'
+    finally:
+        unsubscribe_events(db_file, hub)
+
+def poll_events(db_file, last_id=None):
+    # 没有空闲的流时的一次性应答：发完积压的事件就结束，id 行让浏览器记住读到哪了
+    hub = _event_hub(db_file)
+    with hub['cond']:
+        pending, last_id = take_events(hub, last_id)
+    return f'retry: {EVENT_BUSY_RETRY_MS}\n\n' + format_events(pending) + f'id: {last_id}\n\n'
+
+def acquire_stream(limit):
+    with _streams_lock:
+        if limit and _streams['open'] >= limit:
+            return False
+        _streams['open'] += 1
+        return True
+
+def release_stream():
+    with _streams_lock:
+        _streams['open'] -= 1
+
+# --- 任务账户 ---
+def parse_accounts(s):
+    return list(dict.fromkeys(x.strip() for x in s.replace('，', ',').split(',') if x.strip()))
+
+def set_task_accounts(c, task_id, accounts):
+    # 保留仍在列表里的账户的完成状态，只增删有变化的行
+    c.execute('DELETE FROM task_accounts WHERE task_id = ? AND account NOT IN (SELECT value FROM json_each(?))', (task_id, json.dumps(accounts)))
+    # 任务不存在时不插入，免得留下没有归属的账户行，以后被同号的新任务认领
+    c.executemany('''INSERT INTO task_accounts (task_id, account, position) SELECT ?1, ?2, ?3 WHERE EXISTS (SELECT 1 FROM bookmarks WHERE id = ?1)
+                     ON CONFLICT (task_id, account) DO UPDATE SET position = excluded.position''',
+                  [(task_id, acc, pos) for pos, acc in enumerate(accounts)])
+
+def set_task_progress(c, task_id, done_accounts):
+    done_accounts = set(done_accounts)
+    c.execute('SELECT account, done FROM task_accounts WHERE task_id = ?', (task_id,))
+    changed = [(1 if acc in done_accounts else 0, task_id, acc) for acc, done in c.fetchall() if bool(done) != (acc in done_accounts)]
+    c.executemany("UPDATE task_accounts SET done = ?1, done_at = CASE WHEN ?1 THEN CURRENT_TIMESTAMP END WHERE task_id = ?2 AND account = ?3", changed)
+    return len(changed)
+
+def toggle_progress(c, toggles):
+    # toggles: [(task_id, account, done)]；已经是目标状态的行不会被改写
+    c.executemany("UPDATE task_accounts SET done = ?1, done_at = CASE WHEN ?1 THEN CURRENT_TIMESTAMP END WHERE task_id = ?2 AND account = ?3 AND done != ?1",
+                  [(1 if done else 0, task_id, acc) for task_id, acc, done in toggles])
+
+def task_counts(c, task_ids):
+    c.execute('SELECT id, total_count, done_count FROM bookmarks WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(list(task_ids)),))
+    counts = {id: {'done_count': 0, 'total_count': 0, 'is_complete': False} for id in task_ids}
+    for task_id, total, done in c.fetchall():
+        counts[task_id] = {'done_count': done, 'total_count': total, 'is_complete': done >= total and total > 0}
+    return counts
+
+# --- 批量账户操作 ---
+# 按条件选出一批任务，一次性给它们加、删或改名某个账户，整个操作一个事务，全部是集合 SQL，
+# 计数由触发器跟着更新。改名时原账户的完成状态带到新名字上，任务里已有新名字时两行合并。
+BULK_FILTERS = {
+    'all': '1',
+    'stats': "status != 'stats-off'",
+    'incomplete': "status = 'pending'",
+}
+BULK_OPS = ('add', 'remove', 'rename')
+
+def bulk_target_ids(c, filter, q=''):
+    if filter == 'search':
+        return matching_task_ids(c, q)
+    c.execute(f'SELECT id FROM bookmarks WHERE deleted_at IS NULL AND {BULK_FILTERS[filter]}')
+    return [r[0] for r in c.fetchall()]
+
+def bulk_accounts(c, op, account, ids, new_name=None):
+    targets = json.dumps(ids)
+    in_targets = 'task_id IN (SELECT value FROM json_each(:ids))'
+    args = {'ids': targets, 'account': account, 'new_name': new_name}
+    if op == 'add':
+        # 加在每个任务账户列表的末尾
+        c.execute('''INSERT INTO task_accounts (task_id, account, position)
+                     SELECT b.id, :account, COALESCE((SELECT MAX(position) + 1 FROM task_accounts WHERE task_id = b.id), 0)
+                     FROM bookmarks b WHERE b.id IN (SELECT value FROM json_each(:ids))
+                     ON CONFLICT (task_id, account) DO NOTHING''', args)
+    elif op == 'remove':
+        c.execute(f'DELETE FROM task_accounts WHERE account = :account AND {in_targets}', args)
+    else:
+        c.execute(f'''UPDATE task_accounts AS t SET done = 1, done_at = COALESCE(t.done_at, f.done_at)
+                      FROM (SELECT task_id, done_at FROM task_accounts WHERE account = :account AND done AND {in_targets}) f
+                      WHERE t.task_id = f.task_id AND t.account = :new_name AND t.done = 0''', args)
+        # 新旧同名时这里会删掉要改名的行本身，所以要排除
+        c.execute(f'''DELETE FROM task_accounts WHERE account = :account AND account != :new_name AND {in_targets}
+                      AND task_id IN (SELECT task_id FROM task_accounts WHERE account = :new_name)''', args)
+        merged = c.rowcount
+        c.execute(f'UPDATE task_accounts SET account = :new_name WHERE account = :account AND {in_targets}', args)
+        return merged + c.rowcount
+    return c.rowcount
+
+def apply_to_template(accounts, op, account, new_name=None):
+    if op == 'add' and account not in accounts:
+        return accounts + [account]
+    if op == 'remove':
+        return [a for a in accounts if a != account]
+    if op == 'rename':
+        return list(dict.fromkeys(new_name if a == account else a for a in accounts))
+    return accounts
+
+# --- 操作日志 ---
+# 每个写操作在同一个事务里往 journal 追加一行改动前的内容（前像），用一条 INSERT ... SELECT
+# 在库里直接拼成 JSON 数组，只记源数据列，计数列写回时由触发器重新算。
+# 撤销就是把最近一步的前像写回去；一个操作写了几行日志时，后面的行用 step 指向第一行，一起撤销。
+JOURNAL_TABLES = {
+    # 表: (范围键, 记录的列)，task_accounts 按任务整组记录（可以再限定到某几个账户）
+    'bookmarks': ('id', ['id', 'url', 'remark', 'enable_stats', 'sort_order', 'deleted_at']),
+    'task_accounts': ('task_id', ['task_id', 'account', 'position', 'done', 'done_at']),
+    'special_notes': ('id', ['id', 'content', 'remark', 'created_at', 'deleted_at']),
+    'profiles': ('id', ['id', 'name', 'avatar', 'remark', 'account_number', 'link', 'deleted_at']),
+    'address_book': ('id', ['id', 'name', 'addr', 'uid', 'sort_order', 'deleted_at']),
+    'settings': ('key', ['key', 'value']),
+}
+TRASH_TABLES = ['bookmarks', 'special_notes', 'profiles', 'address_book']
+# 表对应页面上的哪一块
+TABLE_SECTIONS = {'special_notes': 'notes', 'profiles': 'profiles', 'address_book': 'addresses'}
+RETAIN_DAYS = 30  # 回收站和操作日志保留的天数
+JOURNAL_MAX = 20000  # 操作日志最多保留的条数
+PURGE_EVERY = 500  # 每写这么多条日志安排一次后台清理
+
+def journal(c, action, table, keys, accounts=None, step=None, created=False):
+    # created：keys 是这一步新建的行，没有前像，撤销时放进回收站（settings 直接删掉）
+    key, cols = JOURNAL_TABLES[table]
+    args = {'step': step, 'action': action, 'tbl': table, 'keys': json.dumps(list(keys)),
+            'accounts': json.dumps(list(accounts)) if accounts is not None else None}
+    if created:
+        c.execute("INSERT INTO journal (step, action, tbl, keys, before) VALUES (:step, :action, :tbl, :keys, '[]')", args)
+    else:
+        only = 'AND account IN (SELECT value FROM json_each(:accounts))' if accounts is not None else ''
+        c.execute(f'''INSERT INTO journal (step, action, tbl, keys, accounts, before)
+                      SELECT :step, :action, :tbl, :keys, :accounts, json_group_array(json_array({', '.join(cols)}))
+                      FROM {table} WHERE {key} IN (SELECT value FROM json_each(:keys)) {only}''', args)
+    if c.lastrowid % PURGE_EVERY == 0:
+        enqueue(c, 'purge', dedupe='purge')
+    return c.lastrowid
+
+def _write_back(c, action, table, keys, accounts, before):
+    key, cols = JOURNAL_TABLES[table]
+    if table == 'task_accounts':
+        only = 'AND account IN (SELECT value FROM json_each(?))' if accounts is not None else ''
+        c.execute(f'DELETE FROM task_accounts WHERE task_id IN (SELECT value FROM json_each(?)) {only}', (keys, *([accounts] if only else [])))
+    else:
+        # 前像里没有的行是这一步新建的
+        gone = f"{key} IN (SELECT value FROM json_each(?1)) AND {key} NOT IN (SELECT json_extract(value, '$[0]') FROM json_each(?2))"
+        if table in TRASH_TABLES:
+            c.execute(f'UPDATE {table} SET deleted_at = CURRENT_TIMESTAMP WHERE {gone} AND deleted_at IS NULL', (keys, before))
+        else:
+            c.execute(f'DELETE FROM {table} WHERE {gone}', (keys, before))
+    # 排序值在后台重排后会整体变化，只有撤销移动时才写回
+    restore = [(i, col) for i, col in enumerate(cols) if col != 'sort_order' or action == 'move']
+    upsert = '' if table == 'task_accounts' else \
+        f"ON CONFLICT ({key}) DO UPDATE SET {', '.join(f'{col} = excluded.{col}' for i, col in restore if col != key)}"
+    c.execute(f'''INSERT INTO {table} ({', '.join(col for i, col in restore)})
+                  SELECT {', '.join(f"json_extract(value, '$[{i}]')" for i, col in restore)} FROM json_each(?) WHERE true {upsert}''', (before,))
+
+def undo_last(c):
+    # 撤销最近一步还没撤销过的操作，返回涉及的表
+    c.execute('SELECT COALESCE(step, id) FROM journal WHERE NOT undone ORDER BY id DESC LIMIT 1')
+    row = c.fetchone()
+    if row is None:
+        return None
+    c.execute('SELECT id, action, tbl, keys, accounts, before FROM journal WHERE (id = ?1 OR step = ?1) AND NOT undone ORDER BY id DESC', (row[0],))
+    entries = c.fetchall()
+    for id, action, table, keys, accounts, before in entries:
+        _write_back(c, action, table, keys, accounts, before)
+    c.executemany('UPDATE journal SET undone = 1 WHERE id = ?', [(e[0],) for e in entries])
+    return {'action': entries[-1][1], 'tables': sorted({e[2] for e in entries})}
+
+def emit_restored(c, tables):
+    if {'bookmarks', 'task_accounts'} & set(tables):
+        emit(c, 'reset')
+    for table in tables:
+        if table in TABLE_SECTIONS:
+            emit(c, TABLE_SECTIONS[table])
+    if 'settings' in tables:
+        c.execute('SELECT key, value FROM settings')
+        settings = dict(c.fetchall())
+        emit(c, 'settings', global_accounts=json.loads(settings.get('global_accounts', '[]')), theme_version=theme_version(settings))
+    emit(c, 'trash')
+
+# --- 回收站 ---
+# 删除只是打上 deleted_at，所有读取都带 deleted_at IS NULL；超过 RETAIN_DAYS 的才真正删除
+TRASH_KINDS = {
+    # 类型: (表, 显示的文字)
+    'task': ('bookmarks', "COALESCE(NULLIF(remark, ''), url)"),
+    'note': ('special_notes', "COALESCE(NULLIF(remark, ''), content)"),
+    'profile': ('profiles', 'name'),
+    'address': ('address_book', 'name'),
+}
+TRASH_LIMIT = 100
+
+def soft_delete(c, table, id):
+    journal(c, 'delete', table, [id])
+    c.execute(f'UPDATE {table} SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND deleted_at IS NULL', (id,))
+    emit(c, 'trash')
+    return c.rowcount
+
+def restore(c, table, id):
+    journal(c, 'restore', table, [id])
+    c.execute(f'UPDATE {table} SET deleted_at = NULL WHERE id = ? AND deleted_at IS NOT NULL', (id,))
+    emit(c, 'trash')
+    return c.rowcount
+
+def load_trash(c, limit=TRASH_LIMIT):
+    union = ' UNION ALL '.join(f"SELECT '{kind}', id, {label}, deleted_at FROM {table} WHERE deleted_at IS NOT NULL"
+                               for kind, (table, label) in TRASH_KINDS.items())
+    c.execute(f'SELECT * FROM ({union}) ORDER BY deleted_at DESC LIMIT ?', (limit,))
+    return [{'kind': r[0], 'id': r[1], 'label': r[2], 'deleted_at': r[3]} for r in c.fetchall()]
+
+def purge_expired(conn, days=RETAIN_DAYS):
+    # 回收站里过期的行真正删除（任务的账户行由触发器连带删除），操作日志按时间和条数截断
     c = conn.cursor()
-    
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        c.execute('SELECT id, name, avatar, remark, account_number, link FROM profiles')
-        profiles = [{'id': r[0], 'name': r[1], 'avatar': r[2], 'remark': r[3], 'account_number': r[4], 'link': r[5]} for r in c.fetchall()]
+        cutoff = f'-{days} days'
+        c.execute("SELECT DISTINCT avatar FROM profiles WHERE deleted_at < datetime('now', ?)", (cutoff,))
+        avatars = [r[0] for r in c.fetchall()]
+        removed = 0
+        for table in TRASH_TABLES:
+            c.execute(f"DELETE FROM {table} WHERE deleted_at < datetime('now', ?)", (cutoff,))
+            removed += c.rowcount
+        c.execute("DELETE FROM journal WHERE at < CAST(strftime('%s', 'now') AS INTEGER) - ?", (days * 86400,))
+        c.execute('DELETE FROM journal WHERE id <= (SELECT MAX(id) FROM journal) - ?', (JOURNAL_MAX,))
+        c.execute('DELETE FROM changelog WHERE id <= (SELECT MAX(id) FROM changelog) - ?', (CHANGELOG_KEEP,))
+        c.execute("DELETE FROM jobs WHERE state = 'done' AND finished_at < ? OR state = 'failed' AND finished_at < ?",
+                  (time.time() - JOB_DONE_KEEP, time.time() - days * 86400))
+        if removed:
+            emit(c, 'trash')
+        commit(conn)
     except:
-        profiles = []
-        
+        conn.rollback()
+        raise
+    for avatar in avatars:
+        remove_avatar_if_unused(c, avatar)
+    return removed
+
+# --- 任务列表 ---
+# 按 (sort_order, id) 做游标分页：游标就是上一页最后一条的这两个值，
+# 下一页直接从索引里接着往后读，翻到多深都不用扫描前面的行。
+PAGE_SIZE = 50
+
+def encode_cursor(sort_order, id):
+    return f'{sort_order}.{id}'
+
+def decode_cursor(cursor):
     try:
-        c.execute('SELECT id, content, remark FROM special_notes ORDER BY id DESC')
-        special_notes = [{'id': r[0], 'content': r[1], 'remark': r[2]} for r in c.fetchall()]
-    except:
-        special_notes = []
-        
-    # 修改：按 sort_order 倒序排列，如果 sort_order 相同或为空则按 id 倒序
-    c.execute('SELECT id, url, remark, target_accounts, done_accounts, enable_stats FROM bookmarks ORDER BY sort_order DESC, id DESC')
+        sort_order, id = cursor.split('.')
+        return int(sort_order), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+# 筛选参数：status 状态，stats 统计开关（1/0），account 这个账户还没完成，
+# created_from / created_to 创建日期（YYYY-MM-DD，含两端）。认不出的值当作没带
+TASK_STATUSES = ('pending', 'completed', 'stats-off')
+DATE_PARAM = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+def parse_task_filter(args):
+    f = {}
+    if args.get('status') in TASK_STATUSES:
+        f['status'] = args['status']
+    if args.get('stats') in ('0', '1'):
+        f['stats'] = args['stats']
+    if args.get('account', '').strip():
+        f['account'] = args['account'].strip()
+    for key in ('created_from', 'created_to'):
+        if DATE_PARAM.match(args.get(key, '')):
+            f[key] = args[key]
+    return f
+
+def task_filter_sql(f):
+    # 统计开关也换算成状态，都走 (status, sort_order, id) 索引
+    where, params = [], []
+    if 'status' in f:
+        where.append('status = ?')
+        params.append(f['status'])
+    if 'stats' in f:
+        where.append("status IN ('pending', 'completed')" if f['stats'] == '1' else "status = 'stats-off'")
+    if 'account' in f:
+        where.append('id IN (SELECT task_id FROM task_accounts WHERE account = ? AND done = 0)')
+        params.append(f['account'])
+    if 'created_from' in f:
+        where.append('created_at >= ?')
+        params.append(f['created_from'])
+    if 'created_to' in f:
+        where.append("created_at < date(?, '+1 day')")
+        params.append(f['created_to'])
+    return ''.join(f'AND {w} ' for w in where), params
+
+def load_items(c, cursor=None, limit=PAGE_SIZE, ids=None, filter=None):
+    filter_where, params = task_filter_sql(filter or {})
+    after = decode_cursor(cursor)
+    where = 'AND (sort_order, id) < (?, ?)' if after else ''
+    if ids is not None:
+        # 只取指定的几条，给实时更新刷新单张卡片用
+        where, after, limit = 'AND id IN (SELECT value FROM json_each(?))', (json.dumps(ids),), len(ids)
+    # 计数是触发器维护好的，按索引取一页就行
+    c.execute(f'''SELECT id, url, remark, enable_stats, total_count, done_count, sort_order, status, created_at FROM bookmarks
+                  WHERE deleted_at IS NULL {filter_where}{where} ORDER BY sort_order DESC, id DESC LIMIT ?''', (*params, *(after or ()), limit + 1))
+    rows = c.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1][6], rows[limit - 1][0]) if len(rows) > limit else None
+    rows = rows[:limit]
+    accounts = {}
+    c.execute('SELECT task_id, account, done FROM task_accounts WHERE task_id IN (SELECT value FROM json_each(?)) ORDER BY task_id, position',
+              (json.dumps([r[0] for r in rows]),))
+    for task_id, acc, done in c.fetchall():
+        accounts.setdefault(task_id, []).append((acc, done))
     items = []
-    
-    for row in c.fetchall():
-        try: target_accs = json.loads(row[3])
-        except: target_accs = []
-        try: done_accs = json.loads(row[4])
-        except: done_accs = []
-        
+    for row in rows:
+        target_accs = [acc for acc, done in accounts.get(row[0], [])]
+        done_accs = [acc for acc, done in accounts.get(row[0], []) if done]
         items.append({
             'id': row[0], 
             'url': row[1], 
@@ -622,31 +1230,1108 @@ def index():
             'target_accounts': target_accs, 
             'target_accounts_str': ",".join(target_accs), 
             'done_accounts': done_accs, 
-            'done_count': len(done_accs), 
-            'total_count': len(target_accs), 
-            'enable_stats': row[5]==1, 
-            'is_complete': len(done_accs)>=len(target_accs) and len(target_accs)>0
+            'done_count': row[5], 
+            'total_count': row[4], 
+            'enable_stats': row[3]==1, 
+            'is_complete': row[5]>=row[4] and row[4]>0,
+            'sort_order': row[6],
+            'status': row[7],
+            'created_at': row[8]
         })
+    return items, next_cursor
+
+# --- 排序 ---
+# sort_order 之间留出间隔，把任务挪到任意位置只需要给它取相邻两项的中间值，
+# 一次单行更新。间隔被反复对半分到不够用时才整体重新编号，这一步放到后台做。
+RANK_GAP = 1024
+RANK_MIN_GAP = 4  # 新位置和邻居的间隔小于它时安排一次后台重排
+
+def rebalance_order(c):
+    c.execute('SELECT id FROM bookmarks ORDER BY sort_order, id')
+    c.executemany('UPDATE bookmarks SET sort_order = ? WHERE id = ?',
+                  [((i + 1) * RANK_GAP, row[0]) for i, row in enumerate(c.fetchall())])
+
+def _neighbour_sort(c, id):
+    if id is None:
+        return None
+    c.execute('SELECT sort_order FROM bookmarks WHERE id = ?', (id,))
+    row = c.fetchone()
+    if row is None:
+        raise KeyError(id)
+    return row[0]
+
+def place_between(c, id, before_id=None, after_id=None):
+    # 列表按 sort_order 倒序显示：before_id 是新位置上方的任务，after_id 是下方的任务
+    if id in (before_id, after_id) or before_id is not None and before_id == after_id:
+        raise ValueError('before_id and after_id must be two other tasks')
+    for attempt in range(2):
+        above, below = _neighbour_sort(c, before_id), _neighbour_sort(c, after_id)
+        if above is None and below is None:
+            return None
+        # 上下颠倒的邻居算不出中间位置，不能拿重新编号去掩盖
+        if above is not None and below is not None and above < below:
+            raise ValueError('before_id must be above after_id')
+        if above is None:
+            new_sort = below + RANK_GAP
+        elif below is None:
+            new_sort = above - RANK_GAP
+        else:
+            new_sort = (above + below) // 2
+        if new_sort not in (above, below):
+            break
+        # 间隔已经用完，先在当前事务里重新编号再算一次
+        rebalance_order(c)
+    c.execute('UPDATE bookmarks SET sort_order = ? WHERE id = ?', (new_sort, id))
+    gaps = [abs(new_sort - s) for s in (above, below) if s is not None]
+    return new_sort, min(gaps) < RANK_MIN_GAP
+
+# --- 全文搜索 ---
+SEARCH_TARGETS = [
+    # (类型, 源表, 字段)，全文索引表是 源表_fts
+    ('task', 'bookmarks', ['url', 'remark']),
+    ('note', 'special_notes', ['content', 'remark']),
+    ('profile', 'profiles', ['name', 'remark', 'account_number']),
+    ('address', 'address_book', ['name', 'addr', 'uid']),
+]
+# highlight() 先用控制字符做标记，转义完内容后再换成 <mark>
+_HL_OPEN, _HL_CLOSE = '\x02', '\x03'
+
+def _highlight_html(text):
+    return str(escape(text or '')).replace(_HL_OPEN, '<mark>').replace(_HL_CLOSE, '</mark>')
+
+def _mark_terms(text, terms):
+    if not text:
+        return text
+    pattern = '|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+    return re.sub(f'({pattern})', _HL_OPEN + r'\1' + _HL_CLOSE, text, flags=re.I)
+
+# 全文索引里还留着回收站里的行，查询时按部分索引排除掉
+_NOT_TRASHED = 'rowid NOT IN (SELECT id FROM {table} WHERE deleted_at IS NOT NULL)'
+
+def _use_fts(terms):
+    return HAS_FTS and all(len(t) >= 3 for t in terms)
+
+def _fts_match(terms):
+    # 每个词作为一个短语查询；trigram 索引下短语就是子串匹配，输入前缀即可命中
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in terms)
+
+def _like_where(columns, terms):
+    # 少于三个字符时 trigram 用不上索引，退回 LIKE
+    where = ' AND '.join('(' + ' OR '.join(f'{col} LIKE ?' for col in columns) + ')' for t in terms)
+    return where, [f'%{t}%' for t in terms for col in columns]
+
+def matching_task_ids(c, q):
+    terms = q.split()
+    if not terms:
+        return []
+    columns = FTS_SOURCES['bookmarks']
+    if _use_fts(terms):
+        c.execute(f'SELECT rowid FROM bookmarks_fts WHERE bookmarks_fts MATCH ? AND {_NOT_TRASHED.format(table="bookmarks")}', (_fts_match(terms),))
+    else:
+        where, args = _like_where(columns, terms)
+        c.execute(f'SELECT rowid FROM {"bookmarks_fts" if HAS_FTS else "bookmarks"} WHERE {where} AND {_NOT_TRASHED.format(table="bookmarks")}', args)
+    return [r[0] for r in c.fetchall()]
+
+def search(c, q, limit=20):
+    terms = q.split()
+    if not terms:
+        return []
+    results = []
+    for kind, table, columns in SEARCH_TARGETS:
+        fts = f'{table}_fts'
+        if _use_fts(terms):
+            hl = ', '.join(f"highlight({fts}, {i}, '{_HL_OPEN}', '{_HL_CLOSE}')" for i in range(len(columns)))
+            c.execute(f'SELECT rowid, bm25({fts}), {hl} FROM {fts} WHERE {fts} MATCH ? AND {_NOT_TRASHED.format(table=table)} ORDER BY rank LIMIT ?',
+                      (_fts_match(terms), limit))
+            rows = c.fetchall()
+        else:
+            source = fts if HAS_FTS else table
+            where, args = _like_where(columns, terms)
+            c.execute(f'SELECT rowid, 0, {", ".join(columns)} FROM {source} WHERE {where} AND {_NOT_TRASHED.format(table=table)} LIMIT ?', (*args, limit))
+            rows = [(r[0], r[1], *[_mark_terms(v, terms) for v in r[2:]]) for r in c.fetchall()]
+        for row in rows:
+            results.append({'type': kind, 'id': row[0], 'score': row[1],
+                            'fields': {col: _highlight_html(v) for col, v in zip(columns, row[2:])}})
+    results.sort(key=lambda r: r['score'])
+    return results[:limit]
+
+# --- 导入导出 ---
+# 导出和导入都是生成器流水线：导出时边读游标边输出，导入时边解析边按批写入，
+# 内存占用和数据量无关。NDJSON 每行带 type 字段，可以把几类数据放在同一个文件里；
+# CSV 一个文件只能放一类。
+EXPORT_KINDS = ['tasks', 'notes', 'profiles', 'addresses']
+CSV_FIELDS = {
+    'tasks': ['id', 'url', 'remark', 'enable_stats', 'sort_order', 'created_at', 'accounts', 'done_accounts'],
+    'notes': ['id', 'content', 'remark', 'created_at'],
+    'profiles': ['id', 'name', 'avatar', 'remark', 'account_number', 'link'],
+    'addresses': ['id', 'name', 'addr', 'uid', 'sort_order'],
+}
+EXPORT_TABLES = {'tasks': 'bookmarks', 'notes': 'special_notes', 'profiles': 'profiles', 'addresses': 'address_book'}
+IMPORT_CHUNK = 5000
+EXPORT_BATCH = 1000
+
+def _iter_rows(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH)
+        if not rows:
+            return
+        yield from rows
+
+def _export_tasks(conn):
+    # 任务和账户进度各用一个游标按 task_id 顺序读，边走边合并
+    tasks = conn.execute('SELECT id, url, remark, enable_stats, sort_order, created_at FROM bookmarks WHERE deleted_at IS NULL ORDER BY id')
+    accounts = _iter_rows(conn.execute('SELECT task_id, account, done, done_at FROM task_accounts ORDER BY task_id, position'))
+    pending = next(accounts, None)
+    for id, url, remark, enable_stats, sort_order, created_at in _iter_rows(tasks):
+        accs = []
+        while pending is not None and pending[0] <= id:
+            if pending[0] == id:
+                accs.append({'account': pending[1], 'done': bool(pending[2]), 'done_at': pending[3]})
+            pending = next(accounts, None)
+        yield {'id': id, 'url': url, 'remark': remark, 'enable_stats': enable_stats, 'sort_order': sort_order, 'created_at': created_at, 'accounts': accs}
+
+def _export_table(conn, kind, sql):
+    fields = CSV_FIELDS[kind]
+    for row in _iter_rows(conn.execute(sql)):
+        yield dict(zip(fields, row))
+
+def export_records(conn, kind):
+    if kind == 'tasks':
+        return _export_tasks(conn)
+    if kind == 'notes':
+        return _export_table(conn, kind, 'SELECT id, content, remark, created_at FROM special_notes WHERE deleted_at IS NULL ORDER BY id')
+    if kind == 'profiles':
+        return _export_table(conn, kind, 'SELECT id, name, avatar, remark, account_number, link FROM profiles WHERE deleted_at IS NULL ORDER BY id')
+    return _export_table(conn, kind, 'SELECT id, name, addr, uid, sort_order FROM address_book WHERE deleted_at IS NULL ORDER BY sort_order, id')
+
+def export_ndjson(conn, kinds):
+    for kind in kinds:
+        for record in export_records(conn, kind):
+            yield json.dumps({'type': kind, **record}, ensure_ascii=False) + '\n'
+
+def export_csv(conn, kind):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, CSV_FIELDS[kind], extrasaction='ignore')
+    writer.writeheader()
+    for record in export_records(conn, kind):
+        if kind == 'tasks':
+            accs = record.pop('accounts')
+            record['accounts'] = ','.join(a['account'] for a in accs)
+            record['done_accounts'] = ','.join(a['account'] for a in accs if a['done'])
+        writer.writerow(record)
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def read_records(fp, fmt, kind=None):
+    # fp 是文本流，产出 (类型, 记录)
+    if fmt == 'csv':
+        for record in csv.DictReader(fp):
+            if kind == 'tasks' and record.get('accounts') is not None:
+                done = set(parse_accounts(record.get('done_accounts') or ''))
+                record['accounts'] = [{'account': a, 'done': a in done} for a in parse_accounts(record.get('accounts') or '')]
+            yield kind, record
+        return
+    for line in fp:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop('type', kind), record
+
+def _import_tasks(c, records, default_accounts, order):
+    # 导入的任务都排在现有任务前面；记录里带 sort_order 时保持它们之间原来的相对顺序
+    c.execute('SELECT COALESCE(MAX(id), 0) FROM bookmarks')
+    next_id = c.fetchone()[0]
+    tasks, accounts = [], []
+    for r in records:
+        next_id += 1
+        sort_order = order['base'] + int(r['sort_order']) if r.get('sort_order') not in (None, '') else order['last'] + RANK_GAP
+        order['last'] = max(order['last'], sort_order)
+        tasks.append((next_id, r.get('url'), r.get('remark'), 0 if str(r.get('enable_stats', 1)) in ('0', 'False', 'false') else 1, sort_order,
+                      r.get('created_at') or None))
+        accs = r.get('accounts')
+        if accs is None:
+            accs = [{'account': a, 'done': False} for a in default_accounts]
+        seen = set()
+        for pos, a in enumerate(accs):
+            if a['account'] not in seen:
+                seen.add(a['account'])
+                accounts.append((next_id, a['account'], pos, 1 if a.get('done') else 0, a.get('done_at')))
+    c.executemany('INSERT INTO bookmarks (id, url, remark, enable_stats, sort_order, created_at) VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))', tasks)
+    c.executemany('INSERT INTO task_accounts (task_id, account, position, done, done_at) VALUES (?, ?, ?, ?, ?)', accounts)
+
+def import_records(conn, records):
+    # 同一类型的连续记录攒满一批就用 executemany 写入，一批一个事务
+    c = conn.cursor()
+    default_accounts = json.loads(get_settings_dict().get('global_accounts', '[]'))
+    c.execute('SELECT COALESCE(MAX(sort_order), 0) FROM bookmarks')
+    order = {'base': c.fetchone()[0]}
+    order['last'] = order['base']
+    counts = {}
+    step = {}
+
+    def flush(kind, batch):
+        if kind not in EXPORT_TABLES:
+            raise ValueError(f'unknown record type: {kind}')
+        table = EXPORT_TABLES[kind]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+            first = c.fetchone()[0] + 1
+            if kind == 'tasks':
+                _import_tasks(c, batch, default_accounts, order)
+            elif kind == 'notes':
+                c.executemany('INSERT INTO special_notes (content, remark, created_at) VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+                              [(r.get('content'), r.get('remark'), r.get('created_at') or None) for r in batch])
+            elif kind == 'profiles':
+                c.executemany('INSERT INTO profiles (name, avatar, remark, account_number, link) VALUES (?, ?, ?, ?, ?)',
+                              [(r.get('name'), r.get('avatar'), r.get('remark'), r.get('account_number'), r.get('link')) for r in batch])
+            elif kind == 'addresses':
+                c.execute('SELECT COALESCE(MAX(sort_order), 0) FROM address_book')
+                base = c.fetchone()[0]
+                c.executemany('INSERT INTO address_book (name, addr, uid, sort_order) VALUES (?, ?, ?, ?)',
+                              [(r.get('name'), r.get('addr'), r.get('uid'), base + i + 1) for i, r in enumerate(batch)])
+            # 整个导入算一步，撤销时这次导入的所有行一起进回收站
+            c.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+            id = journal(c, 'import', table, range(first, c.fetchone()[0] + 1), step=step.get('id'), created=True)
+            step.setdefault('id', id)
+            commit(conn)
+        except:
+            conn.rollback()
+            raise
+        counts[kind] = counts.get(kind, 0) + len(batch)
+
+    kind, batch = None, []
+    for record_kind, record in records:
+        if batch and (record_kind != kind or len(batch) >= IMPORT_CHUNK):
+            flush(kind, batch)
+            batch = []
+        kind = record_kind
+        batch.append(record)
+    if batch:
+        flush(kind, batch)
+    if counts:
+        # 整批导入后让打开的页面整体重新同步一次，而不是逐条推送
+        emit(c, 'reset')
+        commit(conn)
+    return counts
+
+# --- 备份 ---
+# 用 SQLite 的在线备份接口把库拷到 backups/<时间>/，每次只拷 BACKUP_PAGES 页，两步之间歇一下，
+# 不会长时间占着磁盘和锁。备份连接先开一个读事务：WAL 模式下它一直看到开始那一刻的快照，
+# 期间别的请求照常写，备份也不会因为库被改而从头重来，拷出来的就是那一刻的一致状态。
+# 快照里引用到的头像硬链接（不支持时复制）到快照的 uploads/ 下，manifest.json 记下库文件和
+# 每个头像的大小和 sha256，恢复前逐个校验。
+BACKUP_KEEP = 7  # 保留最近几份
+BACKUP_PAGES = 256
+BACKUP_PAUSE = 0.005  # 每拷一批页歇的秒数
+BACKUP_NAME = re.compile(r'^\d{8}-\d{6}(-\d+)?$')
+
+def _file_entry(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return {'size': os.path.getsize(path), 'sha256': digest.hexdigest()}
+
+def _throttle(status, remaining, total):
+    time.sleep(BACKUP_PAUSE)
+
+def backup_database(db_file, upload_folder, backup_folder, keep=BACKUP_KEEP):
+    os.makedirs(backup_folder, exist_ok=True)
+    name = base = time.strftime('%Y%m%d-%H%M%S')
+    n = 0
+    while os.path.exists(os.path.join(backup_folder, name)):
+        n += 1
+        name = f'{base}-{n}'
+    tmp = os.path.join(backup_folder, f'.{name}.tmp')
+    os.makedirs(os.path.join(tmp, 'uploads'))
+    started = time.perf_counter()
+    try:
+        src = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        dst = sqlite3.connect(os.path.join(tmp, 'bookmarks.db'))
+        try:
+            # 第一次读就定下了快照，头像列表和拷出来的库是同一时刻的
+            src.execute('BEGIN')
+            avatars = [r[0] for r in src.execute("SELECT DISTINCT avatar FROM profiles WHERE avatar IS NOT NULL AND avatar != ''")]
+            version = src.execute('PRAGMA user_version').fetchone()[0]
+            src.backup(dst, pages=BACKUP_PAGES, progress=_throttle)
+            src.execute('COMMIT')
+            dst.execute('PRAGMA journal_mode=DELETE')  # 快照是单个文件，不带 -wal
+        finally:
+            dst.close()
+            src.close()
+        files, missing = {}, []
+        for avatar in avatars:
+            path = os.path.join(upload_folder, secure_filename(avatar))
+            target = os.path.join(tmp, 'uploads', secure_filename(avatar))
+            if not os.path.isfile(path):
+                missing.append(avatar)
+                continue
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+            files[avatar] = _file_entry(target)
+        manifest = {'name': name, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'schema_version': version,
+                    'db': _file_entry(os.path.join(tmp, 'bookmarks.db')), 'avatars': files, 'missing_avatars': missing,
+                    'seconds': round(time.perf_counter() - started, 3)}
+        with open(os.path.join(tmp, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.rename(tmp, os.path.join(backup_folder, name))
+    except:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    rotate_backups(backup_folder, keep)
+    return manifest
+
+def list_backups(backup_folder):
+    if not os.path.isdir(backup_folder):
+        return []
+    result = []
+    for name in sorted(os.listdir(backup_folder), reverse=True):
+        try:
+            with open(os.path.join(backup_folder, name, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if BACKUP_NAME.match(name):
+            result.append(manifest)
+    return result
+
+def rotate_backups(backup_folder, keep=BACKUP_KEEP):
+    for manifest in list_backups(backup_folder)[keep:]:
+        shutil.rmtree(os.path.join(backup_folder, manifest['name']), ignore_errors=True)
+
+def verify_backup(path):
+    # 返回发现的问题，空列表表示快照完好
+    try:
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        return [f'manifest: {e}']
+    problems = []
+    db_path = os.path.join(path, 'bookmarks.db')
+    if not os.path.isfile(db_path) or _file_entry(db_path) != manifest['db']:
+        problems.append('bookmarks.db does not match manifest')
+    else:
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            result = [r[0] for r in conn.execute('PRAGMA integrity_check')]
+        finally:
+            conn.close()
+        if result != ['ok']:
+            problems.extend(f'integrity_check: {r}' for r in result)
+    if manifest.get('schema_version', 0) > SCHEMA_VERSION:
+        problems.append(f'snapshot schema {manifest["schema_version"]} is newer than this program ({SCHEMA_VERSION})')
+    for avatar, entry in manifest['avatars'].items():
+        file = os.path.join(path, 'uploads', secure_filename(avatar))
+        if not os.path.isfile(file) or _file_entry(file) != entry:
+            problems.append(f'avatar {avatar} does not match manifest')
+    return problems
+
+def restore_backup(path, db_file, upload_folder, backup_folder):
+    problems = verify_backup(path)
+    if problems:
+        raise ValueError('; '.join(problems))
+    # 先给现在的库留一份，恢复错了还能回来
+    current = backup_database(db_file, upload_folder, backup_folder, keep=BACKUP_KEEP + 1) if os.path.exists(db_file) else None
+    live = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+    snapshot = sqlite3.connect(f'file:{os.path.join(path, "bookmarks.db")}?mode=ro', uri=True)
+    try:
+        try: last_event = live.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        except sqlite3.OperationalError: last_event = 0
+        # 在线写回：正在运行的服务不用停，其它连接下一次读就看到恢复后的内容
+        snapshot.backup(live)
+        result = [r[0] for r in live.execute('PRAGMA integrity_check')]
+        if result != ['ok']:
+            raise ValueError('; '.join(f'integrity_check: {r}' for r in result))
+    finally:
+        snapshot.close()
+        live.close()
+    # 旧快照的表结构先升级，再接着原来的事件编号发一个 reset，让打开的页面整体刷新
+    migrate(db_file)
+    live = sqlite3.connect(db_file, timeout=30)
+    try:
+        live.execute("INSERT INTO events (id, kind, data) SELECT MAX(COALESCE(MAX(id), 0), ?) + 1, 'reset', '{}' FROM events", (last_event,))
+        live.commit()
+    finally:
+        live.close()
+    os.makedirs(upload_folder, exist_ok=True)
+    for avatar in os.listdir(os.path.join(path, 'uploads')):
+        if not os.path.exists(os.path.join(upload_folder, avatar)):
+            shutil.copy2(os.path.join(path, 'uploads', avatar), os.path.join(upload_folder, avatar))
+    return {'restored': os.path.basename(os.path.normpath(path)), 'previous': current and current['name']}
+
+# --- 复制 ---
+# 读多写少时可以起几个只读副本分担首页和接口的读流量。主库上每张源表有三个触发器，
+# 写操作提交时在同一个事务里往 changelog 追加一行：op 0 是整行（插入或更新后的值），
+# op 1 是删掉的主键。和操作日志一样只记源数据列，计数、汇总和全文索引在副本上由它自己的触发器算。
+# 副本（python note.py follow <主库地址>）先从 /replication/snapshot 取一份一致的快照装进自己的库，
+# 再按编号从 /replication/log 拉后面的变更，一批在一个事务里应用；落后太多、日志已经被截掉时重新取快照。
+# 副本上改数据的请求原样转发给主库，返回后等本地应用到主库给的位置再回给浏览器，
+# 跳转回来的页面能看到刚写的内容。一个副本进程跟随一个库（默认库或 -w 指定的工作区）。
+CHANGELOG_TABLES = {
+    # 表: (主键列, 复制的列)
+    'bookmarks': (['id'], JOURNAL_TABLES['bookmarks'][1] + ['created_at']),
+    'task_accounts': (['task_id', 'account'], JOURNAL_TABLES['task_accounts'][1]),
+    'special_notes': (['id'], JOURNAL_TABLES['special_notes'][1]),
+    'profiles': (['id'], JOURNAL_TABLES['profiles'][1]),
+    'address_book': (['id'], JOURNAL_TABLES['address_book'][1]),
+    'settings': (['key'], JOURNAL_TABLES['settings'][1]),
+    # 事件也复制过去，副本上打开的页面照样实时刷新
+    'events': (['id'], ['id', 'kind', 'data', 'created_at']),
+}
+CHANGELOG_KEEP = 100000  # 主库上最多保留的变更条数，落后更多的副本要重新取快照
+# 副本上只能转给主库的请求：改数据的 GET 路由，和只在主库上有的操作日志、后台任务
+PRIMARY_ONLY = {'delete_profile', 'delete_special_note', 'delete_addr', 'toggle_stats', 'delete_entry', 'restore_entry', 'move_item', 'api_journal',
+                'jobs_status', 'job_status'}
+REPLICA_BATCH = 2000
+REPLICA_POLL = 0.25
+REPLICA_RETRY = 2  # 连不上主库时隔几秒再试
+REPLICA_WAIT = 2  # 转发写请求后最多等几秒让本地副本追上
+REPLICA_TIMEOUT = 30
+# 转发时不原样带过去的头：逐跳的头，以及由两边服务各自处理的长度、压缩和日期
+_SKIP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade', 'proxy-authenticate', 'proxy-authorization',
+                 'host', 'content-length', 'accept-encoding', 'content-encoding', 'date', 'server'}
+_follow_wake = threading.Event()
+
+def changelog_enabled(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'bookmarks_changelog_ai'").fetchone() is not None
+
+def changelog_head(conn):
+    # 已分配的最大编号，截断日志后也不会变小
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changelog'").fetchone()
+    return row[0] if row else 0
+
+def _changelog_triggers(c, table):
+    keys, cols = CHANGELOG_TABLES[table]
+    new_row = f"json_array({', '.join('new.' + col for col in cols)})"
+    old_key = f"json_array({', '.join('old.' + k for k in keys)})"
+    changed = ' OR '.join(f'old.{k} IS NOT new.{k}' for k in keys)
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_changelog_ai AFTER INSERT ON {table} BEGIN INSERT INTO changelog (tbl, op, row) VALUES ('{table}', 0, {new_row}); END")
+    # 主键变了（批量改账户名）先删旧键
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_changelog_au AFTER UPDATE OF {', '.join(cols)} ON {table} BEGIN
+                     INSERT INTO changelog (tbl, op, row) SELECT '{table}', 1, {old_key} WHERE {changed};
+                     INSERT INTO changelog (tbl, op, row) VALUES ('{table}', 0, {new_row});
+                 END''')
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_changelog_ad AFTER DELETE ON {table} BEGIN INSERT INTO changelog (tbl, op, row) VALUES ('{table}', 1, {old_key}); END")
+
+def enable_changelog(conn):
+    # 没有副本的库不建触发器，写入时不多付这份开销
+    if changelog_enabled(conn):
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        c = conn.cursor()
+        for table in CHANGELOG_TABLES:
+            _changelog_triggers(c, table)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+
+def disable_changelog(c):
+    for table in CHANGELOG_TABLES:
+        for event in ('ai', 'au', 'ad'):
+            c.execute(f'DROP TRIGGER IF EXISTS {table}_changelog_{event}')
+
+def replica_snapshot(db_file, path):
+    # 和备份一样在一个读事务里拷，返回快照对应的变更编号
+    src = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+    dst = sqlite3.connect(path)
+    try:
+        src.execute('BEGIN')
+        position = changelog_head(src)
+        src.backup(dst, pages=BACKUP_PAGES, progress=_throttle)
+        src.execute('COMMIT')
+        dst.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dst.close()
+        src.close()
+    return position
+
+def read_changelog(c, after, limit=REPLICA_BATCH):
+    # 返回 (变更, 最新编号, 最新一条的时间)；after 之后的已经被截掉时返回 None
+    c.execute('SELECT id, tbl, op, row, at FROM changelog WHERE id > ? ORDER BY id LIMIT ?', (after, limit))
+    changes = c.fetchall()
+    head = changelog_head(c.connection)
+    c.execute('SELECT MIN(id) FROM changelog')
+    floor = c.fetchone()[0]
+    if after < head and (floor is None or floor > after + 1):
+        return None
+    c.execute('SELECT at FROM changelog WHERE id = ?', (head,))
+    row = c.fetchone()
+    return changes, head, row and row[0]
+
+def apply_changes(c, changes):
+    # 相邻的同一张表同一种操作合成一次 executemany
+    avatars = set()
+    for (table, op), group in itertools.groupby(changes, key=lambda ch: (ch[1], ch[2])):
+        keys, cols = CHANGELOG_TABLES[table]
+        rows = [json.loads(ch[3]) for ch in group]
+        if op:
+            c.executemany(f"DELETE FROM {table} WHERE {' AND '.join(f'{k} = ?' for k in keys)}", rows)
+            continue
+        updates = ', '.join(f'{col} = excluded.{col}' for col in cols if col not in keys)
+        c.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}", rows)
+        if table == 'profiles':
+            avatars.update(row[cols.index('avatar')] for row in rows)
+    return avatars
+
+def _sync_file(db_file):
+    # 副本每轮拉取的结果写在库文件旁边，不写库，免得没有变更时也作废页面缓存
+    return db_file + '-sync.json'
+
+def _write_sync(db_file, **state):
+    tmp = _sync_file(db_file) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, _sync_file(db_file))
+
+def replica_status(c, db_file):
+    c.execute('SELECT primary_url, applied, applied_at FROM replica_state WHERE id = 1')
+    row = c.fetchone()
+    try:
+        with open(_sync_file(db_file), encoding='utf-8') as f:
+            sync = json.load(f)
+    except (OSError, ValueError):
+        sync = {}
+    status = {'role': 'follower', 'primary': current_app.config['PRIMARY_URL'], 'applied': row and row[1], 'head': sync.get('head'),
+              'lag_changes': None, 'lag_seconds': None, 'synced_seconds_ago': None, 'error': sync.get('error')}
+    if row and sync.get('head') is not None:
+        status['lag_changes'] = max(sync['head'] - row[1], 0)
+        # 两个时间都是主库上的提交时间，不受两台机器时钟差的影响
+        if not status['lag_changes']:
+            status['lag_seconds'] = 0
+        elif row[2] is not None and sync.get('head_at') is not None:
+            status['lag_seconds'] = round(max(sync['head_at'] - row[2], 0), 3)
+    if sync.get('synced_at'):
+        status['synced_seconds_ago'] = round(time.time() - sync['synced_at'], 3)
+    return status
+
+def _fetch_avatars(primary, upload_folder, avatars):
+    os.makedirs(upload_folder, exist_ok=True)
+    for avatar in avatars:
+        name = secure_filename(avatar or '')
+        path = os.path.join(upload_folder, name)
+        if not name or os.path.exists(path):
+            continue
+        try:
+            with urllib.request.urlopen(f'{primary}/uploads/{name}', timeout=REPLICA_TIMEOUT) as resp:
+                data = resp.read()
+        except (urllib.error.URLError, OSError) as e:
+            log.warning('fetching avatar %s failed: %s', name, e)
+            continue
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+def bootstrap_replica(primary, db_file, upload_folder):
+    tmp = db_file + '.snapshot'
+    with urllib.request.urlopen(f'{primary}/replication/snapshot', timeout=REPLICA_TIMEOUT) as resp, open(tmp, 'wb') as f:
+        shutil.copyfileobj(resp, f)
+        position = int(resp.headers['X-Note-Changelog'])
+    try:
+        snapshot = sqlite3.connect(tmp)
+        live = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        try:
+            if snapshot.execute('PRAGMA user_version').fetchone()[0] > SCHEMA_VERSION:
+                raise ValueError(f'primary schema is newer than this program ({SCHEMA_VERSION})')
+            # 和恢复备份一样在线写进本地库，正在服务的连接下一次读就看到新内容
+            snapshot.backup(live)
+        finally:
+            live.close()
+            snapshot.close()
+    finally:
+        os.remove(tmp)
+    migrate(db_file)
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        disable_changelog(c)
+        c.execute('DELETE FROM changelog')
+        c.execute('INSERT OR REPLACE INTO replica_state (id, primary_url, applied, applied_at) VALUES (1, ?, ?, NULL)', (primary, position))
+        c.execute("SELECT DISTINCT avatar FROM profiles WHERE avatar IS NOT NULL AND avatar != ''")
+        avatars = [r[0] for r in c.fetchall()]
+        conn.commit()
+    finally:
+        conn.close()
+    bump_generation(db_file)
+    wake_events(db_file)
+    _fetch_avatars(primary, upload_folder, avatars)
+    log.info('replica bootstrapped from %s at change %d', primary, position)
+    return position
+
+def follow_primary(primary, db_file, upload_folder, stop=None):
+    primary = primary.rstrip('/')
+    conn = _connect(db_file)
+    try:
+        while stop is None or not stop.is_set():
+            row = conn.execute('SELECT primary_url, applied FROM replica_state WHERE id = 1').fetchone()
+            try:
+                if row is None or row[0] != primary:
+                    bootstrap_replica(primary, db_file, upload_folder)
+                    continue
+                with urllib.request.urlopen(f'{primary}/replication/log?after={row[1]}&limit={REPLICA_BATCH}', timeout=REPLICA_TIMEOUT) as resp:
+                    data = json.load(resp)
+            except urllib.error.HTTPError as e:
+                if e.code == 410:
+                    log.warning('replica fell behind the changelog of %s, taking a new snapshot', primary)
+                    conn.execute('DELETE FROM replica_state')
+                    conn.commit()
+                    continue
+                _write_sync(db_file, error=f'HTTP {e.code}', synced_at=None)
+                time.sleep(REPLICA_RETRY)
+                continue
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                log.warning('replicating from %s failed: %s', primary, e)
+                _write_sync(db_file, error=str(e), synced_at=None)
+                time.sleep(REPLICA_RETRY)
+                continue
+            changes = data['changes']
+            if changes:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    c = conn.cursor()
+                    avatars = apply_changes(c, changes)
+                    c.execute('UPDATE replica_state SET applied = ?, applied_at = ? WHERE id = 1', (changes[-1][0], changes[-1][4]))
+                    commit(conn)
+                except sqlite3.Error:
+                    conn.rollback()
+                    log.exception('applying changes from %s failed', primary)
+                    time.sleep(REPLICA_RETRY)
+                    continue
+                _fetch_avatars(primary, upload_folder, avatars)
+            _write_sync(db_file, head=data['head'], head_at=data['head_at'], synced_at=time.time(), error=None)
+            if len(changes) < REPLICA_BATCH:
+                # 本进程转发了写请求会提前叫醒
+                _follow_wake.wait(REPLICA_POLL)
+                _follow_wake.clear()
+    finally:
+        conn.close()
+
+def is_write_request():
+    return request.method not in ('GET', 'HEAD', 'OPTIONS') or (request.endpoint or '').rpartition('.')[2] in PRIMARY_ONLY
+
+def wait_for_replica(position, timeout=REPLICA_WAIT):
+    c = get_db().cursor()
+    deadline = time.monotonic() + timeout
+    _follow_wake.set()
+    while True:
+        row = c.execute('SELECT applied FROM replica_state WHERE id = 1').fetchone()
+        if row and row[0] >= position:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # 主库的跳转原样交给浏览器，Location 是相对地址，会跳回副本自己
+    def redirect_request(self, *args):
+        return None
+
+_forward_opener = urllib.request.build_opener(_NoRedirect)
+
+@bp.before_app_request
+def forward_writes():
+    primary = current_app.config.get('PRIMARY_URL')
+    if not primary:
+        return None
+    if (request.endpoint or '').rpartition('.')[2] in ('replication_snapshot', 'replication_log'):
+        return jsonify({'error': 'this instance is a follower'}), 409
+    if not is_write_request():
+        return None
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in _SKIP_HEADERS}
+    headers['X-Forwarded-For'] = request.remote_addr or ''
+    body = request.get_data() if request.method not in ('GET', 'HEAD') else None
+    req = urllib.request.Request(primary.rstrip('/') + request.full_path.rstrip('?'), data=body, headers=headers, method=request.method)
+    try:
+        upstream = _forward_opener.open(req, timeout=REPLICA_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        upstream = e  # 跳转和错误状态也原样转给客户端
+    except (urllib.error.URLError, OSError) as e:
+        log.warning('forwarding %s %s to primary failed: %s', request.method, request.path, e)
+        return jsonify({'error': f'primary unavailable: {e}'}), 502
+    with upstream:
+        data = upstream.read()
+    position = upstream.headers.get('X-Note-Changelog')
+    if position and position.isdigit():
+        wait_for_replica(int(position))
+    return Response(data, status=upstream.getcode(), headers=[(k, v) for k, v in upstream.headers.items() if k.lower() not in _SKIP_HEADERS])
+
+@bp.after_app_request
+def changelog_position(resp):
+    # 主库告诉副本这次写入之后变更日志到了哪里
+    if 'db' in g and not current_app.config.get('PRIMARY_URL') and is_write_request():
+        head = changelog_head(g.db)
+        if head:
+            resp.headers['X-Note-Changelog'] = str(head)
+    return resp
+
+# --- 后台任务 ---
+# 请求里耗时的附带工作（缩头像、清理回收站、重排序号、备份）不在请求线程里做，
+# 而是和写操作在同一个事务里往 jobs 表插一行，请求马上返回。每个提供服务的进程起 JOB_WORKERS 个线程，
+# 轮流扫本进程用到过的各个库，连接从连接池借；库被连接池回收后，队列清空了就不再扫它。
+# 领任务时把它标成 running 并给一个租期；进程崩了、租期过了没做完的，
+# 别的线程会重新领走，所以重启也不会丢任务。失败的按 2、4、8… 秒退避重试，
+# 到 JOB_MAX_ATTEMPTS 次记为 failed。/jobs 查看队列。
+JOB_WORKERS = int(os.environ.get('NOTE_JOB_WORKERS', '2'))
+JOB_POLL = 1.0  # 别的进程排的任务和到点的重试靠轮询发现
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF = 2
+JOB_DONE_KEEP = 24 * 3600  # 做完的任务留多久，失败的按回收站的保留天数
+JOB_LIST = 50
+
+_job_dbs = {}  # 库文件 -> {'app', 'workspace', 'evicted'}
+_job_threads = []
+_job_wake = threading.Event()
+_job_lock = threading.Lock()
+
+def enqueue(c, kind, dedupe=None, delay=0, **args):
+    # 在调用方的事务里入队，请求回滚了任务也不会留下；返回任务号，同一 dedupe 已在排队时返回 None
+    now = time.time()
+    c.execute('INSERT OR IGNORE INTO jobs (kind, args, dedupe, run_at, lease, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+              (kind, json.dumps(args, ensure_ascii=False), dedupe, now + delay, JOB_KINDS[kind][1], now))
+    return c.lastrowid if c.rowcount else None
+
+def wake_jobs(db_file):
+    if db_file in _job_dbs:
+        _job_wake.set()
+
+def _claim_job(conn):
+    # 先用只读查询看有没有要做的，空闲时轮询不去抢写锁
+    now = time.time()
+    due = "state = 'queued' AND run_at <= :now OR state = 'running' AND lease_until < :now"
+    if conn.execute(f'SELECT 1 FROM jobs WHERE {due} LIMIT 1', {'now': now}).fetchone() is None:
+        return None
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        job = conn.execute(f'''UPDATE jobs SET state = 'running', attempts = attempts + 1, started_at = :now, lease_until = :now + lease
+                              WHERE id = (SELECT id FROM jobs WHERE {due} ORDER BY run_at, id LIMIT 1)
+                              RETURNING id, kind, args, attempts''', {'now': now}).fetchone()
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return job
+
+def _run_job(conn, job):
+    id, kind, args, attempts = job
+    try:
+        JOB_KINDS[kind][0](conn, **json.loads(args))
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        retry = attempts < JOB_MAX_ATTEMPTS
+        log.exception('job %d (%s) failed, attempt %d/%d', id, kind, attempts, JOB_MAX_ATTEMPTS)
+        conn.execute("UPDATE jobs SET state = ?, run_at = ?, finished_at = ?, error = ? WHERE id = ?",
+                     ('queued' if retry else 'failed', time.time() + JOB_BACKOFF ** attempts, None if retry else time.time(), f'{type(e).__name__}: {e}', id))
+    else:
+        conn.execute("UPDATE jobs SET state = 'done', finished_at = ?, error = NULL WHERE id = ?", (time.time(), id))
+    conn.commit()
+
+def _job_worker():
+    while True:
+        busy = False
+        for db_file, entry in list(_job_dbs.items()):
+            busy |= _work_db(db_file, entry)
+        if not busy:
+            _job_wake.wait(JOB_POLL)
+            _job_wake.clear()
+
+def _work_db(db_file, entry):
+    # 每个库每轮最多做一个任务，一个库排满了也不会让别的库一直等着
+    try:
+        conn = _acquire(db_file)
+    except sqlite3.Error:
+        log.exception('opening %s for jobs failed', db_file)
+        return False
+    try:
+        with entry['app'].app_context():
+            g.workspace = entry['workspace']
+            job = _claim_job(conn)
+            if job is None:
+                if entry['evicted'] and conn.execute("SELECT 1 FROM jobs WHERE state IN ('queued', 'running') LIMIT 1").fetchone() is None:
+                    with _job_lock:
+                        if _job_dbs.get(db_file) is entry:
+                            del _job_dbs[db_file]
+                return False
+            _run_job(conn, job)
+            return True
+    except sqlite3.Error:
+        log.exception('processing jobs of %s failed', db_file)
+        return False
+    finally:
+        _release(db_file, conn, touch=False)
+
+def watch_jobs(db_file):
+    entry = _job_dbs.get(db_file)
+    if entry is not None and not entry['evicted']:
+        return
+    with _job_lock:
+        entry = _job_dbs.get(db_file)
+        if entry is None or entry['evicted']:
+            _job_dbs[db_file] = {'app': current_app._get_current_object(), 'workspace': g.get('workspace'), 'evicted': False}
+        while len(_job_threads) < JOB_WORKERS:
+            _job_threads.append(threading.Thread(target=_job_worker, name=f'job-worker-{len(_job_threads)}', daemon=True))
+            _job_threads[-1].start()
+    _job_wake.set()
+
+def unwatch_jobs(db_file):
+    # 库被连接池回收：标记一下，工作线程把剩下的任务做完后不再扫它
+    entry = _job_dbs.get(db_file)
+    if entry is not None:
+        entry['evicted'] = True
+
+def _job_thumbnail(conn, filename):
+    # 缩好的图按内容哈希另存，账户改指向它，原图没人用了就删掉
+    path = os.path.join(current_paths()['uploads'], secure_filename(filename))
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        final = store_avatar(f.read(), filename.rsplit('.', 1)[1])
+    c = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute('UPDATE profiles SET avatar = ? WHERE avatar = ?', (final, filename))
+        if c.rowcount:
+            emit(c, 'profiles')
+        commit(conn)
+    except:
+        conn.rollback()
+        raise
+    remove_avatar_if_unused(c, filename)
+
+def _job_purge(conn):
+    purge_expired(conn)
+
+def _job_rebalance(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        c = conn.cursor()
+        rebalance_order(c)
+        # 顺序没变但页面上记的 sort_order 都旧了，让页面整体重新同步
+        emit(c, 'reset')
+        commit(conn)
+    except:
+        conn.rollback()
+        raise
+
+def _job_backup(conn, keep=BACKUP_KEEP):
+    paths = current_paths()
+    manifest = backup_database(paths['db'], paths['uploads'], paths['backups'], keep)
+    log.info('backup %s done in %.2fs', manifest['name'], manifest['seconds'])
+
+JOB_KINDS = {
+    # 类型: (处理函数, 租期秒数)
+    'thumbnail': (_job_thumbnail, 120),
+    'purge': (_job_purge, 600),
+    'rebalance': (_job_rebalance, 600),
+    'backup': (_job_backup, 3600),
+}
+
+def _job_dict(row):
+    return {'id': row[0], 'kind': row[1], 'args': json.loads(row[2]), 'state': row[3], 'attempts': row[4], 'run_at': row[5],
+            'created_at': row[6], 'started_at': row[7], 'finished_at': row[8], 'error': row[9]}
+
+# --- 静态资源 ---
+# 样式和脚本放在 static/ 下，URL 里带内容指纹，浏览器可以放心长期缓存
+ASSET_MAX_AGE = 365 * 24 * 3600
+THEME_DEFAULTS = {
+    'left_bg': '#2c3e50', 'left_text': '#ffffff',
+    'right_bg': '#ffffff', 'right_text': '#333333',
+    'addr_name_color': '#3498db'
+}
+_asset_versions = {}
+
+def asset_url(filename):
+    v = _asset_versions.get(filename)
+    if v is None:
+        with open(os.path.join(current_app.static_folder, filename), 'rb') as f:
+            v = hashlib.md5(f.read()).hexdigest()[:10]
+        _asset_versions[filename] = v
+    return url_for('static', filename=filename, v=v)
+
+def theme_version(settings):
+    return hashlib.md5('|'.join(settings.get(k, v) for k, v in THEME_DEFAULTS.items()).encode()).hexdigest()[:10]
+
+@bp.after_app_request
+def cache_assets(resp):
+    if (request.endpoint or '').rpartition('.')[2] in ('static', 'theme_css') and 'v' in request.args and resp.status_code == 200:
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = ASSET_MAX_AGE
+        resp.cache_control.immutable = True
+    return resp
+
+# --- 压缩 ---
+# 首页有几百 KB 的 HTML，按 Accept-Encoding 压缩后再发；装了 brotli 优先用 br。
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript', 'application/json', 'image/svg+xml'}
+
+def accepted_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+def compress_response(resp):
+    if (resp.status_code != 200 or 'Content-Encoding' in resp.headers or resp.mimetype not in COMPRESS_MIMETYPES
+            or resp.is_streamed and not resp.direct_passthrough):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if not encoding:
+        return resp
+    # send_file 返回的静态文件是直通模式，读出来压缩
+    resp.direct_passthrough = False
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return resp
+    resp.set_data(compress(data, encoding))
+    resp.headers['Content-Encoding'] = encoding
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+# --- 路由 ---
+# --- 首页缓存 ---
+_page_cache = {}
+
+@bp.route('/')
+def index():
+    db_file = current_paths()['db']
+    sync_generation(db_file)
+    gen, modified = current_generation(db_file)
+    etag = f'{_BOOT_ID}-{gen}'
+    # 浏览器手里的页面还是最新的，直接 304，不碰数据库
+    if request.if_none_match.contains_weak(etag):
+        resp = make_response('', 304)
+    else:
+        task_filter = parse_task_filter(request.args)
+        if task_filter:
+            # 筛选过的列表只读匹配的行，不进页面缓存
+            cached = (gen, render_index(task_filter).encode(), {})
+        else:
+            cached = _page_cache.get(db_file)
+            if not cached or cached[0] != gen:
+                cached = _page_cache[db_file] = (gen, render_index().encode(), {})
+        # 压缩后的页面也跟着缓存，同一代数据只压缩一次
+        encoding = accepted_encoding()
+        if encoding:
+            body = cached[2].get(encoding)
+            if body is None:
+                body = cached[2][encoding] = compress(cached[1], encoding)
+            resp = make_response(body)
+            resp.headers['Content-Encoding'] = encoding
+        else:
+            resp = make_response(cached[1])
+        resp.mimetype = 'text/html'
+    # 同一份内容的压缩和未压缩版本共用一个弱 ETag
+    resp.set_etag(etag, weak=True)
+    resp.vary.add('Accept-Encoding')
+    resp.last_modified = modified
+    resp.cache_control.no_cache = True
+    return resp
+
+def render_index(task_filter=None):
+    settings = get_settings_dict()
+    global_accounts_str = ",".join(json.loads(settings.get('global_accounts', '[]')))
+    
+    conn = get_db()
+    c = conn.cursor()
+    
+    summary = load_summary(c)
+    address_book = load_address_book(c)
+    profiles = load_profiles(c)
+    special_notes = load_special_notes(c)
+    trash = load_trash(c)
+    items, next_cursor = load_items(c, filter=task_filter)
         
-    conn.close()
-    return render_template_string(HTML_TEMPLATE, items=items, global_accounts_str=global_accounts_str, address_book=address_book, profiles=profiles, special_notes=special_notes, settings=settings)
+    return render_template('index.html', items=items, next_cursor=next_cursor, task_filter=task_filter or {}, global_accounts_str=global_accounts_str, summary=summary, address_book=address_book, profiles=profiles, special_notes=special_notes, trash=trash, settings=settings, theme_version=theme_version(settings))
+
+def load_address_book(c):
+    c.execute('SELECT id, name, addr, uid FROM address_book WHERE deleted_at IS NULL ORDER BY sort_order, id')
+    return [{'id': r[0], 'name': r[1], 'addr': r[2], 'uid': r[3]} for r in c.fetchall()]
+
+def load_profiles(c):
+    c.execute('SELECT id, name, avatar, remark, account_number, link FROM profiles WHERE deleted_at IS NULL')
+    return [{'id': r[0], 'name': r[1], 'avatar': r[2], 'remark': r[3], 'account_number': r[4], 'link': r[5]} for r in c.fetchall()]
+
+def load_special_notes(c):
+    c.execute('SELECT id, content, remark FROM special_notes WHERE deleted_at IS NULL ORDER BY id DESC')
+    return [{'id': r[0], 'content': r[1], 'remark': r[2]} for r in c.fetchall()]
+
+# 进度汇总直接读触发器维护的计数，和任务数量无关
+def load_summary(c):
+    c.execute('SELECT tasks, complete FROM progress_totals')
+    tasks, complete = c.fetchone() or (0, 0)
+    c.execute('SELECT account, tasks, done FROM account_totals ORDER BY account')
+    accounts = [{'account': r[0], 'tasks': r[1], 'done': r[2], 'pending': r[1] - r[2]} for r in c.fetchall()]
+    return {'tasks': tasks, 'complete': complete, 'pending': tasks - complete, 'accounts': accounts}
+
+# 侧栏各块单独渲染，实时更新时只替换变化的那一块
+FRAGMENTS = {
+    'summary': ('_summary.html', 'summary', load_summary),
+    'addresses': ('_addresses.html', 'address_book', load_address_book),
+    'profiles': ('_profiles.html', 'profiles', load_profiles),
+    'notes': ('_notes.html', 'special_notes', load_special_notes),
+    'trash': ('_trash.html', 'trash', load_trash),
+}
 
-@app.route('/uploads/<filename>')
+@bp.route('/fragment/<name>')
+def fragment(name):
+    if name not in FRAGMENTS:
+        return jsonify({'error': f'fragment must be one of {list(FRAGMENTS)}'}), 404
+    template, var, loader = FRAGMENTS[name]
+    return render_template(template, **{var: loader(get_db().cursor())})
+
+# 用户自定义的配色单独输出成一小段 CSS
+@bp.route('/theme.css')
+def theme_css():
+    settings = get_settings_dict()
+    css = ':root {\n' + ''.join(f'    --{k.replace("_", "-")}: {settings.get(k, v)};\n' for k, v in THEME_DEFAULTS.items()) + '}\n'
+    resp = make_response(css)
+    resp.mimetype = 'text/css'
+    resp.set_etag(theme_version(settings))
+    return resp.make_conditional(request)
+
+@bp.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # 副本还没同步到的头像先到主库取
+    primary = current_app.config.get('PRIMARY_URL')
+    if primary and not os.path.isfile(os.path.join(current_paths()['uploads'], secure_filename(filename))):
+        return redirect(primary.rstrip('/') + request.full_path.rstrip('?'))
+    if AVATAR_NAME.match(filename):
+        resp = send_from_directory(current_paths()['uploads'], filename, max_age=AVATAR_MAX_AGE)
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        return resp
+    return send_from_directory(current_paths()['uploads'], filename)
 
-@app.route('/save_theme', methods=['POST'])
+@bp.route('/save_theme', methods=['POST'])
 def save_theme():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    for k in ['left_bg', 'left_text', 'right_bg', 'right_text', 'addr_name_color']:
+    journal(c, 'settings', 'settings', THEME_DEFAULTS)
+    for k in THEME_DEFAULTS:
         if k in request.form:
             c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (k, request.form[k]))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    emit(c, 'settings', theme_version=theme_version(get_settings_dict()))
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/add_profile', methods=['POST'])
+@bp.route('/add_profile', methods=['POST'])
 def add_profile():
     name = request.form['name']
     remark = request.form['remark']
@@ -655,220 +2340,634 @@ def add_profile():
     file = request.files['file']
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filename = str(int(time.time())) + "_" + filename
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        filename, pending = stage_avatar(file.read(), file.filename.rsplit('.', 1)[1].lower())
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         c = conn.cursor()
         c.execute('INSERT INTO profiles (name, avatar, remark, account_number, link) VALUES (?, ?, ?, ?, ?)', (name, filename, remark, account_number, link))
-        conn.commit()
-        conn.close()
-    return redirect(url_for('index'))
+        journal(c, 'add', 'profiles', [c.lastrowid], created=True)
+        if pending:
+            enqueue(c, 'thumbnail', filename=filename)
+        emit(c, 'profiles')
+        commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/edit_profile', methods=['POST'])
+@bp.route('/edit_profile', methods=['POST'])
 def edit_profile():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
+    journal(c, 'edit', 'profiles', [int(request.form['id'])])
     c.execute('UPDATE profiles SET name=?, remark=?, account_number=?, link=? WHERE id=?', 
               (request.form['name'], request.form['remark'], request.form['account_number'], request.form['link'], request.form['id']))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    emit(c, 'profiles')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/delete_profile/<int:id>')
+@bp.route('/delete_profile/<int:id>')
 def delete_profile(id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('DELETE FROM profiles WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    # 头像文件留着，从回收站还原时还要用，过期清理时才删
+    soft_delete(c, 'profiles', id)
+    emit(c, 'profiles')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/add_special_note', methods=['POST'])
+@bp.route('/add_special_note', methods=['POST'])
 def add_special_note():
     content = request.form['content']
     remark = request.form['remark']
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('INSERT INTO special_notes (content, remark) VALUES (?, ?)', (content, remark))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    journal(c, 'add', 'special_notes', [c.lastrowid], created=True)
+    emit(c, 'notes')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/edit_special_note', methods=['POST'])
+@bp.route('/edit_special_note', methods=['POST'])
 def edit_special_note():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
+    journal(c, 'edit', 'special_notes', [int(request.form['id'])])
     c.execute('UPDATE special_notes SET content = ?, remark = ? WHERE id = ?', 
               (request.form['content'], request.form['remark'], request.form['id']))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    emit(c, 'notes')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/delete_special_note/<int:id>')
+@bp.route('/delete_special_note/<int:id>')
 def delete_special_note(id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('DELETE FROM special_notes WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    soft_delete(c, 'special_notes', id)
+    emit(c, 'notes')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/edit_task_info', methods=['POST'])
+@bp.route('/edit_task_info', methods=['POST'])
 def edit_task_info():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
+    journal(c, 'edit', 'bookmarks', [int(request.form['id'])])
     c.execute('UPDATE bookmarks SET url = ?, remark = ? WHERE id = ?', 
               (request.form['url'], request.form['remark'], request.form['id']))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    emit(c, 'task', id=int(request.form['id']), op='updated')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/update_global_settings', methods=['POST'])
+@bp.route('/update_global_settings', methods=['POST'])
 def update_global_settings():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    new_list = [x.strip() for x in request.form['global_accounts_str'].replace('，', ',').split(',') if x.strip()]
+    new_list = parse_accounts(request.form['global_accounts_str'])
+    journal(c, 'settings', 'settings', ['global_accounts'])
     c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('global_accounts', json.dumps(new_list)))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    emit(c, 'settings', global_accounts=new_list)
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/add_addr', methods=['POST'])
+@bp.route('/add_addr', methods=['POST'])
 def add_addr():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT value FROM settings WHERE key = ?', ('address_book',))
-    row = c.fetchone()
-    l = json.loads(row[0]) if row else []
-    l.append({'name': request.form['name'], 'addr': request.form['addr'], 'uid': request.form['uid']})
-    c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('address_book', json.dumps(l)))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    c.execute('''INSERT INTO address_book (name, addr, uid, sort_order)
+                 VALUES (?, ?, ?, (SELECT COALESCE(MAX(sort_order), 0) + 1 FROM address_book))''',
+              (request.form['name'], request.form['addr'], request.form['uid']))
+    journal(c, 'add', 'address_book', [c.lastrowid], created=True)
+    emit(c, 'addresses')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/edit_addr', methods=['POST'])
+@bp.route('/edit_addr', methods=['POST'])
 def edit_addr():
-    index = int(request.form['index'])
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT value FROM settings WHERE key = ?', ('address_book',))
-    row = c.fetchone()
-    if row:
-        l = json.loads(row[0])
-        if 0 <= index < len(l):
-            l[index] = {'name': request.form['name'], 'addr': request.form['addr'], 'uid': request.form['uid']}
-            c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('address_book', json.dumps(l)))
-            conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
-
-@app.route('/delete_addr/<int:index>')
-def delete_addr(index):
-    conn = sqlite3.connect(DB_FILE)
+    journal(c, 'edit', 'address_book', [int(request.form['id'])])
+    c.execute('UPDATE address_book SET name = ?, addr = ?, uid = ? WHERE id = ?',
+              (request.form['name'], request.form['addr'], request.form['uid'], request.form['id']))
+    emit(c, 'addresses')
+    commit(conn)
+    return redirect(url_for('.index'))
+
+@bp.route('/delete_addr/<int:id>')
+def delete_addr(id):
+    conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT value FROM settings WHERE key = ?', ('address_book',))
-    row = c.fetchone()
-    if row:
-        l = json.loads(row[0])
-        if 0 <= index < len(l):
-            l.pop(index)
-            c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('address_book', json.dumps(l)))
-            conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
-
-@app.route('/add', methods=['POST'])
+    soft_delete(c, 'address_book', id)
+    emit(c, 'addresses')
+    commit(conn)
+    return redirect(url_for('.index'))
+
+@bp.route('/add', methods=['POST'])
 def add_entry():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
     
     # 插入时获取当前最大的 sort_order，新项目排最前面
     c.execute('SELECT MAX(sort_order) FROM bookmarks')
     max_sort = c.fetchone()[0]
-    new_sort = (max_sort + 1) if max_sort is not None else 1
+    new_sort = (max_sort + RANK_GAP) if max_sort is not None else RANK_GAP
     
     c.execute('SELECT value FROM settings WHERE key = ?', ('global_accounts',))
     default_accs = json.loads(c.fetchone()[0])
     
-    c.execute('INSERT INTO bookmarks (url, remark, target_accounts, done_accounts, enable_stats, sort_order) VALUES (?, ?, ?, ?, 1, ?)', 
-              (request.form['url'], request.form['remark'], json.dumps(default_accs), '[]', new_sort))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    c.execute('INSERT INTO bookmarks (url, remark, enable_stats, sort_order, created_at) VALUES (?, ?, 1, ?, CURRENT_TIMESTAMP)', 
+              (request.form['url'], request.form['remark'], new_sort))
+    task_id = c.lastrowid
+    journal(c, 'add', 'bookmarks', [task_id], created=True)
+    set_task_accounts(c, task_id, default_accs)
+    emit(c, 'task', id=task_id, op='added')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/toggle_stats/<int:id>')
+@bp.route('/toggle_stats/<int:id>')
 def toggle_stats(id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
+    journal(c, 'stats', 'bookmarks', [id])
     c.execute('UPDATE bookmarks SET enable_stats = NOT enable_stats WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    emit(c, 'task', id=id, op='updated')
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/update_item_accounts/<int:id>', methods=['POST'])
+@bp.route('/update_item_accounts/<int:id>', methods=['POST'])
 def update_item_accounts(id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    new_list = [x.strip() for x in request.form['target_accounts_str'].replace('，', ',').split(',') if x.strip()]
-    c.execute('UPDATE bookmarks SET target_accounts = ? WHERE id = ?', (json.dumps(new_list), id))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    journal(c, 'accounts', 'task_accounts', [id])
+    set_task_accounts(c, id, parse_accounts(request.form['target_accounts_str']))
+    emit(c, 'task', id=id, op='updated')
+    commit(conn)
+    return redirect(url_for('.index'))
+
+# 批量改账户：{"op": "add|remove|rename", "account": "账号1", "new_name": "账号9"（改名时）,
+#              "filter": "all|incomplete|stats|search", "q": "搜索词"（search 时）, "template": true（同时改默认模板）}
+@bp.route('/api/accounts/bulk', methods=['POST'])
+def bulk_accounts_route():
+    data = request.get_json(silent=True) or {}
+    op, filter = data.get('op'), data.get('filter', 'all')
+    account, new_name = str(data.get('account') or '').strip(), str(data.get('new_name') or '').strip()
+    if op not in BULK_OPS or filter not in (*BULK_FILTERS, 'search') or not account or op == 'rename' and not new_name:
+        return jsonify({'error': f'op must be one of {BULK_OPS}, filter one of {[*BULK_FILTERS, "search"]}; account (and new_name for rename) required'}), 400
+    if op == 'rename' and new_name == account:
+        return jsonify({'error': 'new_name must differ from account'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    ids = bulk_target_ids(c, filter, str(data.get('q') or ''))
+    # 只记这一两个账户的前像，不用把这批任务的全部账户都存一遍
+    step = journal(c, 'bulk', 'task_accounts', ids, accounts=[account, new_name] if op == 'rename' else [account])
+    changed = bulk_accounts(c, op, account, ids, new_name) if ids else 0
+    if data.get('template'):
+        journal(c, 'bulk', 'settings', ['global_accounts'], step=step)
+        accounts = apply_to_template(json.loads(get_settings_dict().get('global_accounts', '[]')), op, account, new_name)
+        c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('global_accounts', json.dumps(accounts)))
+        emit(c, 'settings', global_accounts=accounts)
+    if changed:
+        emit(c, 'reset')
+    commit(conn)
+    return jsonify({'tasks': len(ids), 'changed': changed})
 
-@app.route('/update_progress/<int:id>', methods=['POST'])
+@bp.route('/update_progress/<int:id>', methods=['POST'])
 def update_progress(id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('UPDATE bookmarks SET done_accounts = ? WHERE id = ?', (json.dumps(request.form.getlist('done_accounts')), id))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    journal(c, 'progress', 'task_accounts', [id])
+    if set_task_progress(c, id, request.form.getlist('done_accounts')):
+        emit_progress(c, [id])
+    commit(conn)
+    return redirect(url_for('.index'))
 
-@app.route('/delete/<int:id>')
+@bp.route('/delete/<int:id>')
 def delete_entry(id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('DELETE FROM bookmarks WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
+    soft_delete(c, 'bookmarks', id)  # 账户行留着，还原时原样回来；触发器把它移出汇总
+    emit(c, 'task', id=id, op='deleted')
+    commit(conn)
+    return redirect(url_for('.index'))
+
+@bp.route('/restore/<kind>/<int:id>')
+def restore_entry(kind, id):
+    if kind not in TRASH_KINDS:
+        return jsonify({'error': f'kind must be one of {list(TRASH_KINDS)}'}), 404
+    table = TRASH_KINDS[kind][0]
+    conn = get_db()
+    c = conn.cursor()
+    if restore(c, table, id):
+        if table == 'bookmarks':
+            emit(c, 'task', id=id, op='added')
+        else:
+            emit(c, TABLE_SECTIONS[table])
+    commit(conn)
+    return redirect(url_for('.index'))
+
+# 撤销最近一步写操作，连续调用就一步步往回退
+@bp.route('/undo', methods=['POST'])
+def undo():
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    undone = undo_last(c)
+    if undone is None:
+        conn.rollback()
+        return jsonify({'error': 'nothing to undo'}), 404
+    emit_restored(c, undone['tables'])
+    commit(conn)
+    return jsonify({'undone': undone})
+
+# 按时间段查操作日志：/api/journal?since=1700000000&until=1700086400（Unix 秒），不带前像
+@bp.route('/api/journal')
+def api_journal():
+    since = request.args.get('since', 0, type=int)
+    until = request.args.get('until', 2 ** 62, type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    c = get_db().cursor()
+    c.execute('''SELECT id, step, at, action, tbl, json_array_length(keys), undone FROM journal
+                 WHERE at >= ? AND at < ? ORDER BY at DESC, id DESC LIMIT ?''', (since, until, limit))
+    return jsonify([{'id': r[0], 'step': r[1], 'at': r[2], 'action': r[3], 'table': r[4], 'rows': r[5], 'undone': bool(r[6])}
+                    for r in c.fetchall()])
+
+# 只认 JSON 布尔或 0/1，字符串 "false" 之类不能当成勾选
+def json_flag(value):
+    if type(value) in (bool, int) and value in (0, 1):
+        return bool(value)
+    raise ValueError(value)
+
+# 勾选/取消单个账户，只返回受影响任务的新计数。
+# 请求体可以是 {"task_id": 1, "account": "账号1", "done": true}，
+# 也可以把多次勾选合并成 {"toggles": [{...}, {...}]} 一次提交
+@bp.route('/api/progress', methods=['POST'])
+def api_progress():
+    data = request.get_json(silent=True) or {}
+    try:
+        toggles = [(int(t['task_id']), str(t['account']), json_flag(t['done'])) for t in data.get('toggles', [data])]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'task_id, account and done (true/false) are required'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    journal(c, 'progress', 'task_accounts', {t[0] for t in toggles}, accounts={t[1] for t in toggles})
+    toggle_progress(c, toggles)
+    counts = emit_progress(c, sorted({t[0] for t in toggles}))
+    commit(conn)
+    return jsonify({'tasks': counts})
+
+# 分页读取任务列表；带 html=1 时同时返回渲染好的列表片段，给页面滚动加载用。
+# ids=1,2,3 只取这几条（实时更新刷新单张卡片）
+@bp.route('/api/items')
+def api_items():
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), 500)
+    ids = [int(x) for x in request.args.get('ids', '').split(',') if x.strip().isdigit()][:500] if 'ids' in request.args else None
+    items, next_cursor = load_items(get_db().cursor(), request.args.get('cursor'), limit, ids, parse_task_filter(request.args))
+    data = {'items': items, 'next': next_cursor}
+    if request.args.get('html'):
+        data['html'] = render_template('_items.html', items=items)
+    return jsonify(data)
+
+# 全文搜索任务、特别记事、展示账户和地址本，结果按相关度排序，命中部分用 <mark> 标出
+@bp.route('/search')
+def search_route():
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    return jsonify(search(get_db().cursor(), request.args.get('q', '').strip(), limit))
+
+@bp.route('/api/summary')
+def api_summary():
+    return jsonify(load_summary(get_db().cursor()))
+
+# 查询某个账户还没完成的任务，走 (account, done, task_id) 索引
+@bp.route('/api/missing')
+def missing_tasks():
+    c = get_db().cursor()
+    c.execute('''SELECT b.id, b.url, b.remark FROM task_accounts ta JOIN bookmarks b ON b.id = ta.task_id
+                 WHERE ta.account = ? AND ta.done = 0 AND b.enable_stats = 1 AND b.deleted_at IS NULL
+                 ORDER BY b.sort_order DESC, b.id DESC''', (request.args.get('account', ''),))
+    return jsonify([{'id': r[0], 'url': r[1], 'remark': r[2]} for r in c.fetchall()])
 
 # --- 新增：排序路由 ---
-@app.route('/move/<int:id>/<direction>')
+def _reorder(c, id, before_id, after_id):
+    journal(c, 'move', 'bookmarks', [id])
+    result = place_between(c, id, before_id, after_id)
+    if result:
+        emit(c, 'task', id=id, op='moved')
+        if result[1]:
+            enqueue(c, 'rebalance', dedupe='rebalance')
+    return result
+
+@bp.route('/move/<int:id>/<direction>')
 def move_item(id, direction):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     c = conn.cursor()
     
     # 获取当前项目
-    c.execute('SELECT id, sort_order FROM bookmarks WHERE id = ?', (id,))
+    c.execute('SELECT id, sort_order FROM bookmarks WHERE id = ? AND deleted_at IS NULL', (id,))
     current = c.fetchone()
     
     if current:
-        current_id, current_sort = current
-        if current_sort is None: current_sort = 0 # 防空
-        
-        # 找目标：上移找比它大的最小数，下移找比它小的最大数
+        # 上移：放到上方第一项和第二项之间；下移：放到下方第一项和第二项之间
         if direction == 'up':
-            c.execute('SELECT id, sort_order FROM bookmarks WHERE sort_order > ? ORDER BY sort_order ASC LIMIT 1', (current_sort,))
+            c.execute('SELECT id FROM bookmarks WHERE (sort_order, id) > (?, ?) AND deleted_at IS NULL ORDER BY sort_order ASC, id ASC LIMIT 2', (current[1], current[0]))
+            ids = [r[0] for r in c.fetchall()]
+            if ids:
+                _reorder(c, id, ids[1] if len(ids) > 1 else None, ids[0])
+                commit(conn)
         else:
-            c.execute('SELECT id, sort_order FROM bookmarks WHERE sort_order < ? ORDER BY sort_order DESC LIMIT 1', (current_sort,))
-            
-        target = c.fetchone()
-        
-        if target:
-            target_id, target_sort = target
-            if target_sort is None: target_sort = 0
-            
-            # 交换 sort_order
-            c.execute('UPDATE bookmarks SET sort_order = ? WHERE id = ?', (target_sort, current_id))
-            c.execute('UPDATE bookmarks SET sort_order = ? WHERE id = ?', (current_sort, target_id))
-            conn.commit()
+            c.execute('SELECT id FROM bookmarks WHERE (sort_order, id) < (?, ?) AND deleted_at IS NULL ORDER BY sort_order DESC, id DESC LIMIT 2', (current[1], current[0]))
+            ids = [r[0] for r in c.fetchall()]
+            if ids:
+                _reorder(c, id, ids[0], ids[1] if len(ids) > 1 else None)
+                commit(conn)
             
-    conn.close()
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
+
+# 拖拽排序：{"id": 3, "before_id": 7, "after_id": 9}，before/after 是放下后上方、下方的任务，
+# 放到最顶或最底时对应的一项传 null
+@bp.route('/reorder', methods=['POST'])
+def reorder():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or type(data.get('id')) is not int \
+            or any(data.get(k) is not None and type(data[k]) is not int for k in ('before_id', 'after_id')) \
+            or data.get('before_id') is None and data.get('after_id') is None:
+        return jsonify({'error': 'id and at least one of before_id / after_id (integers) are required'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        _neighbour_sort(c, data['id'])
+        result = _reorder(c, data['id'], data.get('before_id'), data.get('after_id'))
+    except KeyError as e:
+        conn.rollback()
+        return jsonify({'error': f'task {e.args[0]} not found'}), 404
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
+    commit(conn)
+    return jsonify({'id': data['id'], 'sort_order': result[0]})
+
+# --- 实时事件路由 ---
+# EventSource 断线重连时会带上 Last-Event-ID，从那之后的事件接着推
+@bp.route('/events')
+def events():
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    db_file = current_paths()['db']
+    if acquire_stream(current_app.config['EVENT_STREAMS']):
+        resp = Response(stream_events(db_file, last_id), mimetype='text/event-stream')
+        resp.call_on_close(release_stream)
+    else:
+        resp = Response(poll_events(db_file, last_id), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # 让 nginx 之类的反向代理不要缓冲
+    return resp
+
+# --- 导入导出路由 ---
+# /export?format=ndjson|csv&kind=tasks ；NDJSON 不带 kind 时导出全部
+@bp.route('/export')
+def export_data():
+    fmt = request.args.get('format', 'ndjson')
+    kind = request.args.get('kind')
+    if kind and kind not in EXPORT_KINDS or fmt not in ('ndjson', 'csv') or fmt == 'csv' and not kind:
+        return jsonify({'error': f'format must be ndjson or csv, kind one of {EXPORT_KINDS} (required for csv)'}), 400
+    conn = get_db()
+    if fmt == 'csv':
+        body, mimetype = export_csv(conn, kind), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(conn, [kind] if kind else EXPORT_KINDS), 'application/x-ndjson'
+    resp = Response(stream_with_context(body), mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename={kind or "all"}.{fmt}'
+    return resp
+
+# POST 原始文件内容或 multipart 的 file 字段；CSV 需要 kind 参数
+@bp.route('/import', methods=['POST'])
+def import_data():
+    fmt = request.args.get('format', 'ndjson')
+    kind = request.args.get('kind')
+    if fmt not in ('ndjson', 'csv') or fmt == 'csv' and kind not in EXPORT_KINDS:
+        return jsonify({'error': f'format must be ndjson or csv, kind one of {EXPORT_KINDS} (required for csv)'}), 400
+    stream = request.files['file'].stream if 'file' in request.files else request.stream
+    fp = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        counts = import_records(get_db(), read_records(fp, fmt, kind))
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'imported': counts})
+
+# --- 备份路由 ---
+# POST 排一个后台备份任务（已经有一个在排队或进行时返回 409），GET 列出现有快照；
+# 恢复只能用命令行（python note.py restore）
+@bp.route('/admin/backup', methods=['GET', 'POST'])
+def admin_backup():
+    conn = get_db()
+    c = conn.cursor()
+    if request.method == 'POST':
+        job = enqueue(c, 'backup', dedupe='backup', keep=current_app.config['BACKUP_KEEP'])
+        commit(conn)
+        return jsonify({'started': job is not None, 'job': job}), 202 if job else 409
+    c.execute("SELECT 1 FROM jobs WHERE dedupe = 'backup' AND state IN ('queued', 'running')")
+    return jsonify({'running': c.fetchone() is not None, 'backups': list_backups(current_paths()['backups'])})
+
+# --- 后台任务路由 ---
+# /jobs 按类型和状态汇总队列，列出最近的任务（?state= 只看某种状态），/jobs/<id> 查单个任务
+_JOB_COLUMNS = 'id, kind, args, state, attempts, run_at, created_at, started_at, finished_at, error'
+
+@bp.route('/jobs')
+def jobs_status():
+    c = get_db().cursor()
+    c.execute('SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state')
+    counts = {}
+    for kind, state, n in c.fetchall():
+        counts.setdefault(kind, {})[state] = n
+    c.execute("SELECT MIN(run_at) FROM jobs WHERE state = 'queued'")
+    oldest = c.fetchone()[0]
+    state = request.args.get('state')
+    limit = min(max(request.args.get('limit', JOB_LIST, type=int), 1), 500)
+    c.execute(f'SELECT {_JOB_COLUMNS} FROM jobs {"WHERE state = ?" if state else ""} ORDER BY id DESC LIMIT ?', (*([state] if state else []), limit))
+    return jsonify({'workers': JOB_WORKERS if current_paths()['db'] in _job_dbs else 0, 'counts': counts,
+                    'oldest_queued_seconds': round(max(time.time() - oldest, 0), 3) if oldest else 0,
+                    'jobs': [_job_dict(r) for r in c.fetchall()]})
+
+@bp.route('/jobs/<int:id>')
+def job_status(id):
+    c = get_db().cursor()
+    c.execute(f'SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?', (id,))
+    row = c.fetchone()
+    if row is None:
+        return jsonify({'error': 'no such job'}), 404
+    return jsonify(_job_dict(row))
+
+# --- 复制路由 ---
+# 主库：snapshot 给新副本一份快照（第一次调用时开启变更日志），log 按编号给后面的变更；
+# 副本上这两个返回 409。status 两边都有，副本上报告复制延迟。
+@bp.route('/replication/snapshot')
+def replication_snapshot():
+    db_file = current_paths()['db']
+    enable_changelog(get_db())
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='note-snapshot-')
+    os.close(fd)
+    try:
+        position = replica_snapshot(db_file, path)
+    except:
+        os.remove(path)
+        raise
+    def stream():
+        try:
+            with open(path, 'rb') as f:
+                yield from iter(lambda: f.read(1024 * 1024), b'')
+        finally:
+            os.remove(path)
+    resp = Response(stream(), mimetype='application/vnd.sqlite3')
+    resp.headers['X-Note-Changelog'] = str(position)
+    resp.headers['Content-Length'] = str(os.path.getsize(path))
+    return resp
+
+@bp.route('/replication/log')
+def replication_log():
+    c = get_db().cursor()
+    if not changelog_enabled(c.connection):
+        return jsonify({'error': 'changelog is not enabled, take a snapshot first'}), 409
+    limit = max(1, min(request.args.get('limit', REPLICA_BATCH, type=int), REPLICA_BATCH))
+    result = read_changelog(c, request.args.get('after', 0, type=int), limit)
+    if result is None:
+        return jsonify({'error': 'position is no longer in the changelog, take a new snapshot'}), 410
+    changes, head, head_at = result
+    return jsonify({'head': head, 'head_at': head_at, 'changes': changes})
+
+@bp.route('/replication/status')
+def replication_status():
+    conn = get_db()
+    if current_app.config.get('PRIMARY_URL'):
+        return jsonify(replica_status(conn.cursor(), current_paths()['db']))
+    return jsonify({'role': 'primary', 'enabled': changelog_enabled(conn), 'head': changelog_head(conn)})
+
+# --- 应用 ---
+# WSGI 服务（gunicorn、waitress 等）可以直接用 note:create_app() 或 note:app，见 serve.py。
+# 每个 worker 进程各自建应用、各自的连接池；表结构迁移在 BEGIN IMMEDIATE 里做，
+# 多个 worker 同时启动时只有第一个会真正升级，其余的等锁后发现版本已是最新直接跳过。
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = os.environ.get('NOTE_UPLOAD_FOLDER', UPLOAD_FOLDER)
+    # 可以用环境变量 NOTE_DB_FILE 指向别的数据库文件
+    app.config['DB_FILE'] = os.environ.get('NOTE_DB_FILE', DB_FILE)
+    app.config['BACKUP_FOLDER'] = os.environ.get('NOTE_BACKUP_FOLDER', BACKUP_FOLDER)
+    app.config['BACKUP_KEEP'] = int(os.environ.get('NOTE_BACKUP_KEEP', BACKUP_KEEP))
+    app.config['WORKSPACE_FOLDER'] = os.environ.get('NOTE_WORKSPACE_FOLDER', WORKSPACE_FOLDER)
+    # 设了主库地址就是只读副本：读本地库，写请求转发给主库，本地库由 note.py follow 同步
+    app.config['PRIMARY_URL'] = os.environ.get('NOTE_PRIMARY_URL')
+    # 每个进程同时保持的 /events 长连接数，0 不限；serve.py 会按线程数设好
+    app.config['EVENT_STREAMS'] = int(os.environ.get('NOTE_EVENT_STREAMS', '0'))
+    if config:
+        app.config.update(config)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # after_request 按注册的逆序执行，压缩要最后做，所以先于蓝图注册
+    app.after_request(compress_response)
+    app.register_blueprint(bp)
+    app.register_blueprint(bp, name='ws', url_prefix='/w/<workspace>')
+    app.teardown_appcontext(release_db)
+    app.add_template_global(asset_url)
+    app.add_template_global(base_path)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    return app
+
+app = create_app()
+
+# --- 命令行 ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='小记管理控制台')
+    parser.add_argument('-w', '--workspace', help='操作哪个工作区，默认不带前缀的那个库')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('serve', help='启动服务（默认）')
+    p.add_argument('--host', default='0.0.0.0')
+    p.add_argument('--port', type=int, default=5000)
+    p = sub.add_parser('export', help='导出数据到文件或标准输出')
+    p.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    p.add_argument('--kind', choices=EXPORT_KINDS)
+    p.add_argument('-o', '--output', help='输出文件，默认标准输出')
+    p = sub.add_parser('import', help='从文件或标准输入导入数据')
+    p.add_argument('file', nargs='?', help='输入文件，默认标准输入')
+    p.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    p.add_argument('--kind', choices=EXPORT_KINDS)
+    p = sub.add_parser('backup', help='在线备份数据库和头像（服务不用停）')
+    p.add_argument('--list', action='store_true', help='只列出现有快照')
+    p = sub.add_parser('restore', help='校验快照后恢复到当前数据库')
+    p.add_argument('snapshot', help='快照名（backups 下的目录名）或快照目录路径')
+    p = sub.add_parser('follow', help='作为只读副本跟随主库：同步变更到本地库并提供只读服务，写请求转给主库')
+    p.add_argument('primary', help='主库服务地址，比如 http://127.0.0.1:5000')
+    p.add_argument('--host', default='0.0.0.0')
+    p.add_argument('--port', type=int, default=5001)
+    p.add_argument('--no-serve', action='store_true', help='只同步不提供服务，页面另用 NOTE_PRIMARY_URL=<主库地址> python serve.py 启动')
+    p = sub.add_parser('workspace', help='新建或列出工作区')
+    p.add_argument('action', choices=['create', 'list'])
+    p.add_argument('name', nargs='?')
+    args = parser.parse_args(argv)
+
+    if args.command == 'workspace':
+        if args.action == 'list':
+            print('\n'.join(list_workspaces(app)))
+            return
+        try:
+            create_workspace(app, args.name or '')
+        except ValueError as e:
+            parser.error(str(e))
+        args.workspace = args.name
+    elif args.command == 'follow':
+        if args.workspace:
+            try:
+                create_workspace(app, args.workspace)
+            except ValueError as e:
+                parser.error(str(e))
+        app.config['PRIMARY_URL'] = args.primary
+    elif args.workspace and not workspace_exists(app, args.workspace):
+        parser.error(f'workspace {args.workspace} does not exist, create it with: workspace create {args.workspace}')
+    paths = workspace_paths(app, args.workspace)
+    with app.app_context():
+        g.workspace = args.workspace
+        init_db()
+    if args.command == 'workspace':
+        print(paths['db'])
+        return
+    if args.command == 'follow':
+        # 副本跟随主库上同一个工作区的库
+        primary = args.primary.rstrip('/') + (f'/w/{args.workspace}' if args.workspace else '')
+        follow = lambda: follow_primary(primary, paths['db'], paths['uploads'])
+        if args.no_serve:
+            follow()
+            return
+        threading.Thread(target=follow, name='replica-follow', daemon=True).start()
+        app.run(host=args.host, port=args.port, debug=False)
+        return
+    if args.command in (None, 'serve'):
+        app.run(host=getattr(args, 'host', '0.0.0.0'), port=getattr(args, 'port', 5000), debug=False)
+        return
+    if args.command == 'backup':
+        result = list_backups(paths['backups']) if args.list else backup_database(paths['db'], paths['uploads'], paths['backups'], app.config['BACKUP_KEEP'])
+        print(json.dumps(result, ensure_ascii=False, indent=1))
+        return
+    if args.command == 'restore':
+        path = args.snapshot if os.path.isdir(args.snapshot) else os.path.join(paths['backups'], args.snapshot)
+        try:
+            result = restore_backup(path, paths['db'], paths['uploads'], paths['backups'])
+        except ValueError as e:
+            sys.exit(f'restore failed: {e}')
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    if args.format == 'csv' and not args.kind:
+        parser.error('--kind is required for csv')
+    with app.app_context():
+        g.workspace = args.workspace
+        conn = get_db()
+        if args.command == 'export':
+            out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+            chunks = export_csv(conn, args.kind) if args.format == 'csv' else export_ndjson(conn, [args.kind] if args.kind else EXPORT_KINDS)
+            try:
+                out.writelines(chunks)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+        else:
+            fp = open(args.file, encoding='utf-8-sig', newline='') if args.file else sys.stdin
+            with fp:
+                counts = import_records(conn, read_records(fp, args.format, args.kind))
+            print(json.dumps({'imported': counts}, ensure_ascii=False))
 
 if __name__ == '__main__':
-    init_db()
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    main()
@@ -0,0 +1,248 @@
+# ASGI 部署方式：同一套路由和 URL，跑在 uvicorn 之类的 ASGI 服务上。
+#
+#   python note_asgi.py --port 8000 --workers 4
+#   uvicorn note_asgi:app --host 0.0.0.0 --port 8000 --workers 4
+#
+# - /events（实时事件）是原生的协程：空闲的订阅连接只是事件循环里的一个任务，不占线程，
+#   一个进程可以挂几千个。事件由 note 里每个库一个的分发线程读出，通过回调叫醒事件循环。
+# - 其它路由仍是 note 里的同步视图，放到线程池里执行，SQLite 读写和头像文件落盘都在线程池里，
+#   不会卡住事件循环。请求体先在事件循环里异步读完（大的落到临时文件），
+#   慢速上传不会占着线程；流式响应（/export）也是在线程池里一块一块取。
+# - 线程池大小 NOTE_ASGI_THREADS，默认 32；同一时刻真正查库的请求数受它限制。
+import argparse
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g
+
+import note
+
+ASGI_THREADS = int(os.environ.get('NOTE_ASGI_THREADS', '32'))
+BODY_SPOOL_SIZE = 1024 * 1024  # 请求体超过这个大小写临时文件
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='note-asgi')
+
+async def run_sync(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+# --- WSGI 桥接 ---
+async def read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None, 0
+        chunk = message.get('body', b'')
+        if chunk:
+            body.write(chunk)
+            size += len(chunk)
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+    return body, size
+
+def build_environ(scope, body, size):
+    root = scope.get('root_path', '')
+    path = scope['path'][len(root):] if scope['path'].startswith(root) else scope['path']
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(size),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key not in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+            key = 'HTTP_' + key
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+async def call_wsgi(wsgi_app, scope, receive, send):
+    body, size = await read_body(receive)
+    if body is None:
+        return
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return write
+
+    def write(data):
+        raise RuntimeError('write() is not supported')
+
+    def next_chunk(it):
+        for chunk in it:
+            if chunk:
+                return chunk
+        return None
+
+    # 同一个请求的各步可能落在线程池的不同线程上，Flask 的请求上下文存在 contextvars 里，
+    # 所以都放进同一个 Context 里执行（流式响应的生成器要靠它找到请求上下文）
+    ctx = contextvars.copy_context()
+    try:
+        result = await run_sync(ctx.run, wsgi_app, build_environ(scope, body, size), start_response)
+        try:
+            it = iter(result)
+            chunk = await run_sync(ctx.run, next_chunk, it)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await run_sync(ctx.run, next_chunk, it)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await run_sync(ctx.run, result.close)
+    finally:
+        body.close()
+
+# --- 实时事件 ---
+# 每个库一个中继：note 的分发线程有新事件时回调，换一个新的 asyncio.Event 并把旧的置位，
+# 等待中的连接全部醒来，各自从共享缓冲里取自己没发过的事件。
+class _Relay:
+    def __init__(self, loop):
+        self.loop = loop
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        old, self.changed = self.changed, asyncio.Event()
+        old.set()
+
+def _relay(hub):
+    # 中继挂在 hub 上：库被回收后 hub 换了新的，中继也跟着重建
+    loop = asyncio.get_running_loop()
+    relays = hub.setdefault('relays', {})
+    relay = relays.get(loop)
+    if relay is None:
+        relay = relays[loop] = _Relay(loop)
+        hub['listeners'].append(lambda: loop.call_soon_threadsafe(relay.notify))
+    return relay
+
+def _take(hub, last_id):
+    with hub['cond']:
+        return note.take_events(hub, last_id)
+
+async def stream_events(db_file, scope, receive, send):
+    hub = await run_sync(note._event_hub, db_file, True)
+    relay = _relay(hub)
+    last_id = None
+    for name, value in scope['headers']:
+        if name == b'last-event-id' and value.isdigit():
+            last_id = int(value)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+        await send({'type': 'http.response.body', 'body': f'retry: {note.EVENT_RETRY_MS}\n\n'.encode(), 'more_body': True})
+        while not disconnected.done():
+            changed = relay.changed
+            pending, last_id = _take(hub, last_id)
+            if not pending:
+                waiter = asyncio.ensure_future(changed.wait())
+                await asyncio.wait({waiter, disconnected}, timeout=note.EVENT_PING, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if disconnected.done():
+                    break
+                pending, last_id = _take(hub, last_id)
+            text = note.format_events(pending) if pending else ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        await run_sync(note.unsubscribe_events, db_file, hub)
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+# --- 应用 ---
+class NoteASGI:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.ready = False
+
+    def init(self, workspace=None):
+        with self.flask_app.app_context():
+            g.workspace = workspace
+            note.init_db()
+
+    def events_db(self, scope):
+        # /events 和 /w/<工作区>/events 走原生协程，返回对应的库文件；别的路径返回 None
+        path = scope['path'][len(scope.get('root_path', '')):]
+        workspace = None
+        if path.startswith('/w/'):
+            workspace, _, rest = path[3:].partition('/')
+            path = '/' + rest
+        if scope['method'] != 'GET' or path != '/events':
+            return None, None
+        if workspace is not None and not note.workspace_exists(self.flask_app, workspace):
+            return None, None  # 交给 Flask 返回 404
+        return workspace, note.workspace_paths(self.flask_app, workspace)['db']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        if not self.ready:
+            await run_sync(self.init)
+            self.ready = True
+        workspace, db_file = self.events_db(scope)
+        if db_file is not None:
+            if db_file not in note._ready_dbs:
+                await run_sync(self.init, workspace)
+            return await stream_events(db_file, scope, receive, send)
+        return await call_wsgi(self.flask_app, scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await run_sync(self.init)
+                self.ready = True
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+def create_app(config=None):
+    return NoteASGI(note.create_app(config))
+
+app = NoteASGI(note.app)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='note ASGI 启动（需要 uvicorn）')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error('uvicorn is not installed: pip install uvicorn')
+    uvicorn.run('note_asgi:app', host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == '__main__':
+    main()
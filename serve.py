@@ -0,0 +1,115 @@
+# 生产环境启动脚本：多进程 + 多线程跑 note 应用。
+#
+#   python serve.py                        # 0.0.0.0:5000，worker 数按 CPU 核数算
+#   python serve.py --port 8000 --workers 4 --threads 8
+#   NOTE_DB_FILE=/data/bookmarks.db python serve.py --pid /run/note.pid
+#
+# 只读副本：本地库由 note.py follow --no-serve 从主库同步，这里多进程提供页面，写请求转给主库：
+#   NOTE_DB_FILE=replica.db python note.py follow http://primary:5000 --no-serve
+#   NOTE_DB_FILE=replica.db NOTE_PRIMARY_URL=http://primary:5000 python serve.py --port 5001
+#
+# 装了 gunicorn（Linux/macOS）时用 gunicorn 的 gthread worker：
+#   - worker 数默认 2 × CPU 核数 + 1，最多 MAX_WORKERS 个。SQLite 同一时刻只有一个写者，
+#     进程再多写也不会更快，多出来的进程只是在分担读和模板渲染。
+#   - 平滑重载：kill -HUP $(cat note.pid)，gunicorn 会起新 worker 加载新代码，旧 worker 处理完手上的请求再退出。
+#   - 平滑停止：kill -TERM，最多等 --graceful-timeout 秒。
+#   - /events 的实时推送每条连接占一个线程，每个 worker 最多开 --event-streams 条（默认线程数的一半），
+#     其余线程留给普通请求；超出的页面改成每隔几秒轮询一次。推送连接多的话用 note_asgi.py。
+# 没有 gunicorn（比如 Windows）时退到 waitress 的单进程多线程，再没有就用 werkzeug 自带的多线程服务。
+#
+# 也可以不用这个脚本，直接 NOTE_EVENT_STREAMS=2 gunicorn -w 4 -k gthread --threads 4 'note:create_app()'。
+# 每个 worker 第一次处理请求前会检查表结构，多个 worker 同时升级是安全的（见 note.create_app 的说明）。
+import argparse
+import os
+
+MAX_WORKERS = 17
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))  # 容器里限制了 CPU 时以这个为准
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def default_workers():
+    return min(cpu_count() * 2 + 1, MAX_WORKERS)
+
+def load_app():
+    import note
+    app = note.create_app()
+    with app.app_context():
+        note.init_db()
+    return app
+
+def serve_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+    os.environ['NOTE_EVENT_STREAMS'] = str(args.event_streams)  # worker 进程启动时由 note.create_app 读取
+
+    class NoteApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'{args.host}:{args.port}',
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                'timeout': args.timeout,
+                'graceful_timeout': args.graceful_timeout,
+                'keepalive': 5,
+                'pidfile': args.pid,
+                'accesslog': '-' if args.access_log else None,
+                # 不预加载：每个 worker 自己导入应用，HUP 重载时才能换上新代码，
+                # 也不会把父进程打开的 SQLite 连接带进子进程
+                'preload_app': False,
+            }
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return load_app()
+
+    NoteApplication().run()
+
+def serve_waitress(args):
+    from waitress import serve
+    os.environ['NOTE_EVENT_STREAMS'] = str(args.event_streams * args.workers)  # 单进程，线程是 workers × threads 个
+    serve(load_app(), host=args.host, port=args.port, threads=args.workers * args.threads)
+
+def serve_werkzeug(args):
+    from werkzeug.serving import run_simple
+    print('gunicorn 和 waitress 都没装，使用 werkzeug 开发服务器（单进程多线程）')
+    run_simple(args.host, args.port, load_app(), threaded=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='note 生产环境启动')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=default_workers(), help='worker 进程数，默认 2 × CPU 核数 + 1')
+    parser.add_argument('--threads', type=int, default=4, help='每个 worker 的线程数')
+    parser.add_argument('--event-streams', type=int, help='每个 worker 最多同时保持的 /events 连接数，默认线程数的一半')
+    parser.add_argument('--timeout', type=int, default=120, help='worker 多久没响应会被重启（秒），大文件导入要留够时间')
+    parser.add_argument('--graceful-timeout', type=int, default=30)
+    parser.add_argument('--pid', help='gunicorn 主进程 pid 文件，用于 kill -HUP 重载')
+    parser.add_argument('--access-log', action='store_true')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress', 'werkzeug'], default='auto')
+    args = parser.parse_args(argv)
+    if args.event_streams is None:
+        args.event_streams = max(1, args.threads // 2)
+    if args.event_streams >= args.threads:
+        parser.error('--event-streams must be less than --threads')
+
+    servers = {'gunicorn': serve_gunicorn, 'waitress': serve_waitress, 'werkzeug': serve_werkzeug}
+    if args.server != 'auto':
+        servers[args.server](args)
+        return
+    # gunicorn 在 Windows 上能装但导入 gunicorn.app.base 会因为缺 fcntl 失败
+    for name, module in (('gunicorn', 'gunicorn.app.base'), ('waitress', 'waitress')):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        servers[name](args)
+        return
+    serve_werkzeug(args)
+
+if __name__ == '__main__':
+    main()
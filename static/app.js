@@ -0,0 +1,270 @@
+// 在工作区里时接口地址都带 /w/<名字> 前缀
+const BASE = document.documentElement.dataset.base || '';
+function toggleTheme() { try { const c = document.documentElement.getAttribute("data-theme"); const n = c === "dark" ? "light" : "dark"; document.documentElement.setAttribute("data-theme", n); localStorage.setItem("theme", n); } catch(e) {} }
+document.addEventListener("DOMContentLoaded", function() { const s = localStorage.getItem("theme") || "light"; document.documentElement.setAttribute("data-theme", s); const p = document.getElementById('authPassword'); if(p){ p.addEventListener("keypress", function(e) { if (e.key === "Enter") confirmAction(); }); } });
+
+function toggleDrawer(id) {
+    var overlay = document.getElementById('drawerOverlay');
+    var target = document.getElementById(id);
+    if (target.classList.contains('open')) { closeAllDrawers(); } else { closeAllDrawers(); target.classList.add('open'); overlay.classList.add('open'); }
+}
+function closeAllDrawers() { document.getElementById('profileDrawer').classList.remove('open'); document.getElementById('specialDrawer').classList.remove('open'); document.getElementById('drawerOverlay').classList.remove('open'); }
+
+function toggleEdit(id) { var el = document.getElementById('edit-' + id); el.style.display = el.style.display === 'block' ? 'none' : 'block'; }
+function toggleAddrForm() { var el = document.getElementById('addr-form-container'); var btn = document.getElementById('btn-toggle-addr'); if (el.style.display === 'block') { el.style.display = 'none'; btn.innerText = '＋ 添加新备忘'; } else { el.style.display = 'block'; btn.innerText = '－ 收起'; } }
+function copyContent(text, btnElement) { navigator.clipboard.writeText(text).then(function() { var originalText = btnElement.innerText; btnElement.innerText = "OK"; setTimeout(function() { btnElement.innerText = originalText; }, 1500); }, function(err) { alert('复制失败'); }); }
+
+function openEditAddrModal(btn) { document.getElementById('edit_addr_id').value = btn.dataset.id; document.getElementById('edit_name').value = btn.dataset.name; document.getElementById('edit_addr_val').value = btn.dataset.addr; document.getElementById('edit_uid_val').value = btn.dataset.uid; document.getElementById('editAddrModal').style.display = 'flex'; }
+function openEditTaskModal(id, url, remark) { document.getElementById('edit_task_id').value = id; document.getElementById('edit_task_url').value = url; document.getElementById('edit_task_remark').value = remark; document.getElementById('editTaskModal').style.display = 'flex'; }
+function openEditProfileModal(btn) { document.getElementById('edit_profile_id').value = btn.dataset.id; document.getElementById('edit_profile_name').value = btn.dataset.name; document.getElementById('edit_profile_remark').value = btn.dataset.remark; document.getElementById('edit_profile_acc').value = btn.dataset.acc; document.getElementById('edit_profile_link').value = btn.dataset.link; document.getElementById('editProfileModal').style.display = 'flex'; }
+function openEditSpecialModal(id, content, remark) { document.getElementById('edit_special_id').value = id; document.getElementById('edit_special_content').value = content; document.getElementById('edit_special_remark').value = remark; document.getElementById('editSpecialModal').style.display = 'flex'; }
+function openColorModal() { document.getElementById('colorModal').style.display = 'flex'; }
+
+let pendingAction = null; let pendingData = null;
+function triggerAuth(action, data) {
+    const modal = document.getElementById('authModal'); const passInput = document.getElementById('authPassword');
+    pendingAction = action; pendingData = data; passInput.value = ""; 
+    ['editAddrModal', 'editTaskModal', 'editProfileModal', 'colorModal', 'editSpecialModal'].forEach(id => document.getElementById(id).style.display = 'none');
+    modal.style.display = 'flex'; passInput.focus();
+}
+function closeModal(modalId) { document.getElementById(modalId).style.display = 'none'; pendingAction = null; pendingData = null; }
+function confirmAction() {
+    const password = document.getElementById('authPassword').value;
+    if (password === "110") {
+        if (pendingAction === 'delete_addr') window.location.href = BASE + "/delete_addr/" + pendingData;
+        else if (pendingAction === 'add_addr') document.getElementById('realAddForm').submit();
+        else if (pendingAction === 'delete_task') window.location.href = BASE + "/delete/" + pendingData;
+        else if (pendingAction === 'edit_addr') document.getElementById('editAddrForm').submit();
+        else if (pendingAction === 'edit_task_info') document.getElementById('editTaskForm').submit();
+        else if (pendingAction === 'add_profile') document.getElementById('realProfileForm').submit();
+        else if (pendingAction === 'delete_profile') window.location.href = BASE + "/delete_profile/" + pendingData;
+        else if (pendingAction === 'edit_profile') document.getElementById('editProfileForm').submit();
+        else if (pendingAction === 'save_theme') document.getElementById('colorForm').submit();
+        else if (pendingAction === 'delete_special') window.location.href = BASE + "/delete_special_note/" + pendingData;
+        else if (pendingAction === 'edit_special_note') document.getElementById('editSpecialForm').submit();
+        else if (pendingAction === 'bulk_accounts') submitBulkAccounts(document.getElementById('bulkAccountsForm'));
+        else if (pendingAction === 'restore') window.location.href = BASE + "/restore/" + pendingData;
+        else if (pendingAction === 'undo') undoLast();
+        closeModal('authModal');
+    } else { alert("密码错误！"); document.getElementById('authPassword').value = ""; }
+}
+
+// 页面带了筛选条件时，取列表的请求都带上同样的条件；刷新单张卡片时不再符合条件的会被移走
+function listFilter() {
+    const filter = document.getElementById('item-list').dataset.filter;
+    return filter ? '&' + filter : '';
+}
+// 列表滚动到底部时按游标加载下一页
+function loadMoreItems(more) {
+    if (more.dataset.loading) return;
+    more.dataset.loading = '1';
+    fetch(BASE + '/api/items?html=1' + listFilter() + '&cursor=' + encodeURIComponent(more.dataset.cursor))
+        .then(function(r) { return r.json(); })
+        .then(function(data) {
+            document.getElementById('item-list').insertAdjacentHTML('beforeend', data.html);
+            if (data.next) { more.dataset.cursor = data.next; delete more.dataset.loading; } else { more.remove(); }
+        })
+        .catch(function() { more.innerText = '加载失败，点击重试'; more.onclick = function() { more.innerText = '加载中...'; loadMoreItems(more); }; delete more.dataset.loading; });
+}
+document.addEventListener("DOMContentLoaded", function() {
+    const more = document.getElementById('list-more');
+    if (more) observeMore(more);
+});
+
+// 勾选账户后不再提交整个表单，短时间内的多次勾选合并成一次请求，只刷新对应卡片
+let pendingToggles = []; let toggleTimer = null;
+function queueToggle(taskId, checkbox) {
+    pendingToggles.push({ task_id: taskId, account: checkbox.value, done: checkbox.checked });
+    clearTimeout(toggleTimer);
+    toggleTimer = setTimeout(flushToggles, 300);
+}
+function flushToggles() {
+    const toggles = pendingToggles; pendingToggles = [];
+    if (!toggles.length) return;
+    fetch(BASE + '/api/progress', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ toggles: toggles }) })
+        .then(function(r) { if (!r.ok) throw new Error(r.status); return r.json(); })
+        .then(function(data) { Object.keys(data.tasks).forEach(function(id) { updateItemCounts(id, data.tasks[id]); }); })
+        .catch(function() { alert('进度保存失败，请刷新页面'); });
+}
+function updateItemCounts(id, counts) {
+    const li = document.getElementById('item-' + id);
+    if (!li || li.classList.contains('stats-off')) return;
+    li.classList.toggle('completed', counts.is_complete);
+    li.classList.toggle('pending', !counts.is_complete);
+    const badge = li.querySelector('.badge');
+    if (counts.is_complete) { badge.className = 'badge badge-success'; badge.innerText = '✅ 已完成'; }
+    else { badge.className = 'badge badge-warning'; badge.innerText = '⏳ ' + counts.done_count + ' / ' + counts.total_count; }
+}
+
+// 全文搜索：输入停顿后再请求，点击任务结果时滚动到对应卡片，其它结果打开所在抽屉
+const SEARCH_LABELS = { task: '任务', note: '记事', profile: '账户', address: '地址' };
+let searchTimer = null;
+function queueSearch(q) {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(function() { runSearch(q.trim()); }, 200);
+}
+function runSearch(q) {
+    const box = document.getElementById('search-results');
+    if (!q) { box.classList.remove('open'); box.innerHTML = ''; return; }
+    fetch(BASE + '/search?q=' + encodeURIComponent(q)).then(function(r) { return r.json(); }).then(function(hits) {
+        box.innerHTML = hits.length ? '' : '<div class="search-empty">没有找到结果</div>';
+        hits.forEach(function(hit) {
+            const div = document.createElement('div');
+            div.className = 'search-hit';
+            // 字段内容已经在服务端转义过，只保留 <mark> 标签
+            div.innerHTML = '<span class="search-type">' + SEARCH_LABELS[hit.type] + '</span>' + Object.values(hit.fields).filter(function(v) { return v; }).join(' · ');
+            div.onclick = function() { openSearchHit(hit); };
+            box.appendChild(div);
+        });
+        box.classList.add('open');
+    });
+}
+function openSearchHit(hit) {
+    document.getElementById('search-results').classList.remove('open');
+    if (hit.type === 'task') { const li = document.getElementById('item-' + hit.id); if (li) li.scrollIntoView({ behavior: 'smooth', block: 'center' }); }
+    else if (hit.type === 'note') toggleDrawer('specialDrawer');
+    else if (hit.type === 'profile') toggleDrawer('profileDrawer');
+}
+
+// 拖拽排序：按住 ⠿ 拖动卡片，松手后把新位置上下两项的 id 发给 /reorder，一次请求完成
+let dragItem = null; let dragOrigNext = null;
+function armDrag(handle) { handle.closest('.list-item').draggable = true; }
+document.addEventListener('dragstart', function(e) {
+    const li = e.target.closest && e.target.closest('.list-item');
+    if (!li || !li.draggable) return;
+    dragItem = li; dragOrigNext = li.nextElementSibling;
+    li.classList.add('dragging');
+    e.dataTransfer.effectAllowed = 'move';
+});
+document.addEventListener('dragover', function(e) {
+    if (!dragItem) return;
+    const li = e.target.closest && e.target.closest('.list-item');
+    if (!li || li === dragItem) return;
+    e.preventDefault();
+    const r = li.getBoundingClientRect();
+    li.parentNode.insertBefore(dragItem, e.clientY < r.top + r.height / 2 ? li : li.nextSibling);
+});
+document.addEventListener('dragend', function() {
+    if (!dragItem) return;
+    const li = dragItem; dragItem = null;
+    li.classList.remove('dragging'); li.draggable = false;
+    if (li.nextElementSibling === dragOrigNext) return;
+    const prev = li.previousElementSibling, next = li.nextElementSibling;
+    fetch(BASE + '/reorder', { method: 'POST', headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ id: +li.dataset.id, before_id: prev ? +prev.dataset.id : null, after_id: next && next.dataset.id ? +next.dataset.id : null }) })
+        .then(function(r) { if (!r.ok) location.reload(); });
+});
+
+// 实时更新：订阅 /events，别人（或别的标签页）的改动按事件只刷新对应的卡片或侧栏区块
+const SECTION_CONTAINERS = { summary: 'summary', addresses: 'addr-list', profiles: 'profile-list', notes: 'special-list', trash: 'trash-list' };
+function observeMore(more) {
+    new IntersectionObserver(function(entries) { if (entries[0].isIntersecting) loadMoreItems(more); }, { rootMargin: '600px' }).observe(more);
+}
+function itemKey(li) { return [+li.dataset.sort, +li.dataset.id]; }
+function placeItem(li) {
+    const list = document.getElementById('item-list');
+    const key = itemKey(li);
+    for (const other of list.children) {
+        const k = itemKey(other);
+        if (k[0] < key[0] || k[0] === key[0] && k[1] < key[1]) { list.insertBefore(li, other); return; }
+    }
+    // 排在已加载部分之后的，等滚动加载到那一页再出现
+    if (!document.getElementById('list-more')) list.appendChild(li);
+}
+function hasPendingToggle(id) { return pendingToggles.some(function(t) { return t.task_id === id; }); }
+function refreshItem(id) {
+    fetch(BASE + '/api/items?html=1' + listFilter() + '&ids=' + id).then(function(r) { return r.json(); }).then(function(data) {
+        const old = document.getElementById('item-' + id);
+        if (old && (hasPendingToggle(id) || old.querySelector('.edit-area[style*="block"]') || old === dragItem)) return;
+        if (old) old.remove();
+        if (!data.items.length) return;
+        const tpl = document.createElement('template');
+        tpl.innerHTML = data.html.trim();
+        placeItem(tpl.content.firstElementChild);
+    });
+}
+function applyProgress(data) {
+    const li = document.getElementById('item-' + data.id);
+    if (!li) return;
+    if (!hasPendingToggle(data.id)) {
+        li.querySelectorAll('input[name="done_accounts"]').forEach(function(cb) { cb.checked = data.done.indexOf(cb.value) !== -1; });
+    }
+    updateItemCounts(data.id, data);
+}
+function refreshSection(name) {
+    fetch(BASE + '/fragment/' + name).then(function(r) { return r.text(); }).then(function(html) {
+        document.getElementById(SECTION_CONTAINERS[name]).innerHTML = html;
+    });
+}
+function reloadItems() {
+    const list = document.getElementById('item-list');
+    fetch(BASE + '/api/items?html=1' + listFilter() + '&limit=' + Math.min(Math.max(list.children.length, 50), 500)).then(function(r) { return r.json(); }).then(function(data) {
+        list.innerHTML = data.html;
+        let more = document.getElementById('list-more');
+        if (data.next && !more) {
+            more = document.createElement('div');
+            more.id = 'list-more'; more.className = 'list-more'; more.innerText = '加载中...';
+            list.after(more); observeMore(more);
+        }
+        if (data.next) { more.dataset.cursor = data.next; delete more.dataset.loading; } else if (more) more.remove();
+    });
+}
+// 进度一变汇总也跟着变，连续的事件合并成一次刷新
+let summaryTimer = null;
+function queueSummaryRefresh() {
+    clearTimeout(summaryTimer);
+    summaryTimer = setTimeout(function() { refreshSection('summary'); }, 1000);
+}
+function showMissing(row) {
+    const box = document.getElementById('summary-missing');
+    const active = row.classList.contains('active');
+    document.querySelectorAll('.summary-row.active').forEach(function(r) { r.classList.remove('active'); });
+    box.innerHTML = '';
+    if (active) return;
+    row.classList.add('active');
+    fetch(BASE + '/api/missing?account=' + encodeURIComponent(row.dataset.account)).then(function(r) { return r.json(); }).then(function(tasks) {
+        tasks.forEach(function(t) {
+            const a = document.createElement('a');
+            a.href = '#item-' + t.id; a.innerText = t.remark || t.url;
+            box.appendChild(a);
+        });
+    });
+}
+function connectEvents() {
+    if (!window.EventSource) return;
+    const es = new EventSource(BASE + '/events');
+    es.addEventListener('task', function(e) {
+        const data = JSON.parse(e.data);
+        if (data.op === 'deleted') { const li = document.getElementById('item-' + data.id); if (li) li.remove(); }
+        else refreshItem(data.id);
+        if (data.op !== 'moved') queueSummaryRefresh();
+    });
+    es.addEventListener('progress', function(e) { applyProgress(JSON.parse(e.data)); queueSummaryRefresh(); });
+    Object.keys(SECTION_CONTAINERS).forEach(function(name) { es.addEventListener(name, function() { refreshSection(name); }); });
+    es.addEventListener('settings', function(e) {
+        const data = JSON.parse(e.data);
+        if (data.theme_version) { const link = document.getElementById('theme-css'); link.href = link.href.replace(/v=[^&]*/, 'v=' + data.theme_version); }
+        const editor = document.getElementById('global-accounts');
+        if (data.global_accounts && document.activeElement !== editor) editor.value = data.global_accounts.join(',');
+    });
+    es.addEventListener('reset', function() { reloadItems(); Object.keys(SECTION_CONTAINERS).forEach(refreshSection); });
+}
+document.addEventListener("DOMContentLoaded", connectEvents);
+
+// 批量改账户：一次请求改完所有选中的任务，页面随后收到 reset 事件整体刷新
+function submitBulkAccounts(form) {
+    const body = { op: form.op.value, account: form.account.value.trim(), new_name: form.new_name.value.trim(),
+                   filter: form.filter.value, q: form.q.value.trim(), template: form.template.checked };
+    fetch(BASE + '/api/accounts/bulk', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) })
+        .then(function(r) { return r.json().then(function(data) { if (!r.ok) throw new Error(data.error); return data; }); })
+        .then(function(data) { alert('已处理 ' + data.tasks + ' 个任务，改动 ' + data.changed + ' 条账户记录'); if (!window.EventSource) location.reload(); })
+        .catch(function(e) { alert('批量修改失败：' + e.message); });
+}
+
+// 撤销最近一步操作，改动由随后的实时事件刷新到页面上
+function undoLast() {
+    fetch(BASE + '/undo', { method: 'POST' })
+        .then(function(r) { return r.json().then(function(data) { if (!r.ok) throw new Error(data.error); return data; }); })
+        .then(function() { if (!window.EventSource) location.reload(); })
+        .catch(function(e) { alert('撤销失败：' + e.message); });
+}